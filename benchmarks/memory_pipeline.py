@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+"""
+记忆管线基准测试
+
+用合成的多角色对话驱动 memory_server 的各个端点（/ingest、/finalize、/process、/renew、/new_dialog、/search_for_memory）
+以及后台的 review_history，所有LLM请求都发往本地的OpenAI兼容桩服务（可配置延迟），
+最终按端点输出 p50/p95 延迟、LLM调用次数、处理的轮次数、记忆目录与轮次日志的磁盘增长，用于发现记忆子系统的性能回退。
+
+--protocol 选择上传方式：ingest 与 cross_server 一致，逐轮以NDJSON流式上传后发送 /finalize；
+legacy 在session结束时一次性上传到 /process 或 /renew；both 按会话交替使用两者。
+
+整个过程在临时目录中进行，不会读写用户“我的文档”下的真实配置与记忆。
+
+用法:
+    python benchmarks/memory_pipeline.py --characters 2 --sessions 10 --turns 12 --llm-latency 0.2
+    python benchmarks/memory_pipeline.py --protocol legacy --json bench_output.json
+"""
+import sys, os
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+import argparse
+import asyncio
+import json
+import math
+import random
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from uuid import uuid4
+
+# 合成对话用的语料，刻意混入括号、时间戳等 new_dialog 需要清洗的内容
+_USER_LINES = [
+    "今天上班好累啊，老板又临时加了需求",
+    "你还记得我上周说想去的那家拉面店吗",
+    "我最近在学吉他，手指疼得不行",
+    "外面下雨了，我没带伞（叹气）",
+    "帮我想想周末去哪里玩比较好",
+    "我养的猫今天把花瓶打碎了",
+    "晚饭吃什么呢，不想做饭",
+    "明天要考试了，有点紧张",
+]
+_AI_LINES = [
+    "辛苦啦～要不要先喝杯热茶休息一下？",
+    "当然记得！是车站旁边那家豚骨拉面对吧【开心】",
+    "刚开始都会疼的，坚持两周就会长茧啦",
+    "那就等雨小一点再走嘛，不要淋湿了哦",
+    "可以去公园野餐，或者去看看新开的展览<思考>",
+    "诶？它没有受伤吧？花瓶碎片要小心收拾",
+    "点外卖也不错，或者我陪你一起想菜谱",
+    "你已经准备得很充分了，相信自己！",
+]
+
+# 后台设定提取的LLM调用类型，不计入发起请求的端点
+SETTINGS_LLM_KINDS = ('settings_extract', 'settings_verify')
+
+
+def percentile(values, pct):
+    """最近秩法求分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def dir_size(path):
+    """统计目录下所有文件的总字节数"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def file_size(path):
+    """文件不存在时返回0"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def make_ingest_lines(history, session_id):
+    """把对话转成 cross_server 上传到 /ingest 的NDJSON行，每个元素是一轮"""
+    lines = []
+    for seq, entry in enumerate(history, start=1):
+        lines.append(json.dumps({'session_id': session_id, 'seq': seq, 'key': f"{session_id}:{seq}", **entry},
+                                ensure_ascii=False))
+    return lines
+
+
+def make_conversation(rng, turns, start_time):
+    """
+    生成一段与 cross_server 上传格式一致的合成对话
+
+    Args:
+        rng: random.Random 实例，保证可复现
+        turns: 对话轮数（每轮包含一条用户消息和一条角色回复）
+        start_time: 第一轮的时间戳
+    """
+    history = []
+    t = start_time
+    for i in range(turns):
+        user_text = rng.choice(_USER_LINES) + ("" if rng.random() < 0.7 else f"，第{i}次说这个了")
+        ai_text = t.strftime('[%Y%m%d %a %H:%M] ') + rng.choice(_AI_LINES)
+        history.append({'role': 'user', 'content': [{'type': 'text', 'text': user_text}]})
+        history.append({'role': 'assistant', 'content': [{'type': 'text', 'text': ai_text}]})
+        t += timedelta(seconds=rng.randint(5, 40))
+    return history
+
+
+class StubLLMServer:
+    """
+    本地OpenAI兼容桩服务，支持 /v1/chat/completions 与 /v1/embeddings。
+
+    按prompt内容识别调用类型（摘要、二次摘要、审阅、设定提取、重排等），
+    返回符合各模块解析规则的JSON，并按类型计数。
+    """
+    def __init__(self, latency=0.2, jitter=0.05, summary_chars=120, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.summary_chars = summary_chars
+        self.rng = random.Random(seed)
+        self.calls = defaultdict(int)
+        self.runner = None
+        self.port = None
+
+    @staticmethod
+    def classify(prompt):
+        if '请审阅' in prompt:
+            return 'review'
+        if '请总结以下内容' in prompt:
+            return 'further_summary'
+        if '对话摘要' in prompt:
+            return 'summary'
+        if '重要个人信息' in prompt:
+            return 'settings_extract'
+        if '冲突条目' in prompt:
+            return 'settings_verify'
+        if '精筛' in prompt:
+            return 'rerank'
+        return 'other'
+
+    def _fake_review(self, prompt):
+        """把审阅prompt中的对话历史原样拆回结构化格式"""
+        body = prompt.split('======以下为对话历史======', 1)[-1].split('======以上为对话历史======', 1)[0]
+        corrected = []
+        for block in body.strip().split('\n\n'):
+            role, _, content = block.partition(': ')
+            if content:
+                corrected.append({'role': role, 'content': content})
+        return {'修正说明': '基准测试桩：未做修改', '修正后的对话': corrected}
+
+    def _respond(self, kind, prompt):
+        if kind in ('summary', 'further_summary'):
+            return json.dumps({'对话摘要': ('摘要' * self.summary_chars)[:self.summary_chars]}, ensure_ascii=False)
+        if kind == 'review':
+            return json.dumps(self._fake_review(prompt), ensure_ascii=False)
+        if kind == 'rerank':
+            return '[1, 2, 3]'
+        return '{}'
+
+    async def _delay(self):
+        await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+
+    async def _chat_completions(self, request):
+        from aiohttp import web
+        payload = await request.json()
+        parts = []
+        for msg in payload.get('messages', []):
+            content = msg.get('content', '')
+            if isinstance(content, list):
+                parts.extend(i.get('text', '') for i in content if isinstance(i, dict))
+            else:
+                parts.append(str(content))
+        prompt = "\n".join(parts)
+        kind = self.classify(prompt)
+        self.calls[kind] += 1
+        await self._delay()
+        content = self._respond(kind, prompt)
+        return web.json_response({
+            "id": f"chatcmpl-bench-{sum(self.calls.values())}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get('model', 'bench'),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt), "completion_tokens": len(content), "total_tokens": len(prompt) + len(content)},
+        })
+
+    async def _embeddings(self, request):
+        from aiohttp import web
+        payload = await request.json()
+        inputs = payload.get('input', [])
+        if not isinstance(inputs, list):
+            inputs = [inputs]
+        self.calls['embedding'] += 1
+        await self._delay()
+        return web.json_response({
+            "object": "list",
+            "model": payload.get('model', 'bench'),
+            "data": [{"object": "embedding", "index": i, "embedding": [0.0] * 8} for i in range(len(inputs))],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    async def start(self, port=0):
+        from aiohttp import web
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/v1/chat/completions', self._chat_completions)
+        app.router.add_post('/v1/embeddings', self._embeddings)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+    def snapshot(self):
+        return dict(self.calls)
+
+
+class EndpointStats:
+    """按端点累计延迟、LLM调用次数、处理的轮次数、磁盘增长（记忆目录/轮次日志）和错误数"""
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.llm_calls = defaultdict(int)
+        self.turns = defaultdict(int)
+        self.disk_growth = defaultdict(int)
+        self.journal_growth = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    def record(self, name, elapsed, llm_calls, disk_delta, ok=True, turns=0, journal_delta=0):
+        self.latencies[name].append(elapsed)
+        self.llm_calls[name] += llm_calls
+        self.turns[name] += turns
+        self.disk_growth[name] += disk_delta
+        self.journal_growth[name] += journal_delta
+        if not ok:
+            self.errors[name] += 1
+
+    def summary(self):
+        result = {}
+        for name, values in self.latencies.items():
+            result[name] = {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "llm_calls": self.llm_calls[name],
+                "llm_calls_per_op": round(self.llm_calls[name] / len(values), 2) if values else 0,
+                "turns": self.turns[name],
+                "disk_growth_bytes": self.disk_growth[name],
+                "journal_growth_bytes": self.journal_growth[name],
+                "errors": self.errors[name],
+            }
+        return result
+
+
+def _prepare_sandbox(workdir, character_names):
+    """把配置管理器指向临时目录，并写入基准测试用的角色配置"""
+    from utils import config_manager
+
+    docs_dir = Path(workdir) / "docs"
+    project_dir = Path(workdir) / "project"
+    config_manager.ConfigManager._get_documents_directory = lambda self: docs_dir
+    config_manager.ConfigManager._get_project_config_directory = lambda self: project_dir / "config"
+    config_manager.ConfigManager._get_project_memory_directory = lambda self: project_dir / "memory" / "store"
+    manager = config_manager.get_config_manager()
+    manager.ensure_config_directory()
+    manager.ensure_memory_directory()
+
+    characters = {
+        "主人": {"档案名": "测试主人", "性别": "男", "昵称": "主人"},
+        "猫娘": {name: {"性别": "女", "年龄": 15, "昵称": name, "live2d": "mao_pro", "voice_id": ""} for name in character_names},
+        "当前猫娘": character_names[0],
+    }
+    with open(manager.config_dir / 'characters.json', 'w', encoding='utf-8') as f:
+        json.dump(characters, f, ensure_ascii=False, indent=2)
+    return manager
+
+
+def _patch_core_config(stub_url):
+    """所有辅助LLM请求改发到桩服务。必须在导入memory模块之前调用。"""
+    import config
+
+    original = config.get_core_config
+
+    def get_core_config():
+        cfg = original()
+        cfg.update({
+            'OPENROUTER_URL': stub_url,
+            'OPENROUTER_API_KEY': 'bench-key',
+            'SUMMARY_MODEL': 'bench-summary',
+            'CORRECTION_MODEL': 'bench-correction',
+            'EMOTION_MODEL': 'bench-emotion',
+            'VISION_MODEL': 'bench-vision',
+        })
+        return cfg
+
+    config.get_core_config = get_core_config
+
+
+async def run_benchmark(args):
+    character_names = [f"bench_{i}" for i in range(args.characters)]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="xiao8_memory_bench_")
+    stub = StubLLMServer(latency=args.llm_latency, jitter=args.llm_jitter, summary_chars=args.summary_chars, seed=args.seed)
+    stub_url = await stub.start(args.stub_port)
+
+    try:
+        manager = _prepare_sandbox(workdir, character_names)
+        _patch_core_config(stub_url)
+
+        import httpx
+        import memory_server
+
+        memory_dir = str(manager.memory_dir)
+        stats = EndpointStats()
+
+        # 包装后台审阅任务，单独统计 review_history
+        original_review = memory_server._run_review_in_background
+
+        async def timed_review(lanlan_name):
+            before_calls = stub.snapshot().get('review', 0)
+            before_disk = dir_size(memory_dir)
+            start = time.perf_counter()
+            await original_review(lanlan_name)
+            stats.record('review_history', time.perf_counter() - start,
+                         stub.snapshot().get('review', 0) - before_calls,
+                         dir_size(memory_dir) - before_disk)
+
+        memory_server._run_review_in_background = timed_review
+
+        # 设定提取同样在后台执行，单独统计（不含排队等待同角色上一次提取的时间）
+        original_extract = memory_server.settings_manager.extract_and_update_settings
+
+        async def timed_extract(*a, **kw):
+            before = stub.snapshot()
+            start = time.perf_counter()
+            await original_extract(*a, **kw)
+            after = stub.snapshot()
+            stats.record('settings_extract', time.perf_counter() - start,
+                         sum(after.get(k, 0) - before.get(k, 0) for k in SETTINGS_LLM_KINDS), 0)
+
+        memory_server.settings_manager.extract_and_update_settings = timed_extract
+
+        transport = httpx.ASGITransport(app=memory_server.app, raise_app_exceptions=False)
+        rng = random.Random(args.seed)
+        start_time = datetime(2025, 1, 1, 9, 0)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://memory", timeout=None) as client:
+
+            async def call(name, method, url, lanlan_name=None, **kwargs):
+                journal_path = memory_server.turn_journal._journal_path(lanlan_name) if lanlan_name else None
+                before_calls = stub.snapshot()
+                before_disk = dir_size(memory_dir)
+                before_journal = file_size(journal_path) if journal_path else 0
+                start = time.perf_counter()
+                resp = await client.request(method, url, **kwargs)
+                elapsed = time.perf_counter() - start
+                after_calls = stub.snapshot()
+                llm_calls = sum(v - before_calls.get(k, 0) for k, v in after_calls.items() if k != 'review' and k not in SETTINGS_LLM_KINDS)
+                ok = resp.status_code == 200
+                body = None
+                if ok and resp.headers.get('content-type', '').startswith('application/json'):
+                    body = resp.json()
+                    ok = not (isinstance(body, dict) and body.get('status') == 'error')
+                turns = 0
+                if isinstance(body, dict):
+                    # /ingest 返回 accepted，/finalize 返回实际处理的轮次数
+                    turns = body.get('accepted', body.get('turns', 0)) or 0
+                journal_delta = (file_size(journal_path) - before_journal) if journal_path else 0
+                stats.record(name, elapsed, llm_calls, dir_size(memory_dir) - before_disk, ok,
+                             turns=turns, journal_delta=journal_delta)
+
+            async def upload_streaming(name, history, renew):
+                """与 cross_server 一致：每完成一轮就上传一行NDJSON，session结束时只发送 /finalize"""
+                session_id = str(uuid4())
+                for line in make_ingest_lines(history, session_id):
+                    await call('/ingest', 'POST', f"/ingest/{name}", lanlan_name=name,
+                               content=(line + '\n').encode('utf-8'),
+                               headers={'Content-Type': 'application/x-ndjson'})
+                await call('/finalize', 'POST', f"/finalize/{name}", lanlan_name=name,
+                           json={'session_id': session_id, 'mode': 'renew' if renew else 'process'})
+
+            async def upload_legacy(name, history, renew):
+                payload = {'input_history': json.dumps(history, indent=2, ensure_ascii=False)}
+                if renew:
+                    await call('/renew', 'POST', f"/renew/{name}", json=payload)
+                else:
+                    await call('/process', 'POST', f"/process/{name}", json=payload)
+
+            for session_idx in range(args.sessions):
+                for name in character_names:
+                    history = make_conversation(rng, args.turns, start_time + timedelta(hours=session_idx))
+                    renew = bool(args.renew_every) and (session_idx + 1) % args.renew_every == 0
+                    streaming = args.protocol == 'ingest' or (args.protocol == 'both' and session_idx % 2 == 0)
+                    await call('/new_dialog', 'GET', f"/new_dialog/{name}")
+                    if streaming:
+                        await upload_streaming(name, history, renew)
+                    else:
+                        await upload_legacy(name, history, renew)
+                    if args.search:
+                        await call('/search_for_memory', 'GET', f"/search_for_memory/{name}/{rng.choice(_USER_LINES)[:6]}")
+
+                # 等待本轮触发的后台审阅和设定提取结束，避免审阅被下一轮请求取消而失去统计意义
+                pending = [t for t in list(memory_server.correction_tasks.values()) + list(memory_server.settings_tasks.values())
+                           if not t.done()]
+                if pending and not args.no_wait_review:
+                    await asyncio.gather(*pending, return_exceptions=True)
+
+        report = {
+            "params": {
+                "characters": args.characters, "sessions": args.sessions, "turns": args.turns,
+                "llm_latency": args.llm_latency, "llm_jitter": args.llm_jitter, "seed": args.seed,
+                "protocol": args.protocol,
+            },
+            "endpoints": stats.summary(),
+            "llm_calls_by_kind": stub.snapshot(),
+            "memory_dir_bytes": dir_size(memory_dir),
+            "journal_bytes": sum(file_size(memory_server.turn_journal._journal_path(name)) for name in character_names),
+        }
+        return report
+    finally:
+        await stub.stop()
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(report):
+    header = (f"{'endpoint':<20}{'count':>7}{'p50(ms)':>11}{'p95(ms)':>11}{'llm/op':>9}{'turns':>8}"
+              f"{'disk(+B)':>12}{'journal(+B)':>13}{'errors':>8}")
+    print(header)
+    print('-' * len(header))
+    for name, s in sorted(report['endpoints'].items()):
+        print(f"{name:<20}{s['count']:>7}{s['p50_ms']:>11.1f}{s['p95_ms']:>11.1f}{s['llm_calls_per_op']:>9.2f}{s['turns']:>8}"
+              f"{s['disk_growth_bytes']:>12}{s['journal_growth_bytes']:>13}{s['errors']:>8}")
+    print(f"\nLLM调用（按类型）: {report['llm_calls_by_kind']}")
+    print(f"记忆目录最终大小: {report['memory_dir_bytes']} bytes")
+    print(f"轮次日志最终大小: {report['journal_bytes']} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory pipeline benchmark')
+    parser.add_argument('--characters', type=int, default=2, help='合成角色数量')
+    parser.add_argument('--sessions', type=int, default=10, help='每个角色的会话数（即历史增长的步数）')
+    parser.add_argument('--turns', type=int, default=12, help='每个会话的对话轮数')
+    parser.add_argument('--protocol', choices=['ingest', 'legacy', 'both'], default='ingest',
+                        help='上传方式：ingest 为逐轮流式上传加 /finalize，legacy 为一次性 /process、/renew，both 交替使用')
+    parser.add_argument('--renew-every', type=int, default=4, help='每隔多少个会话以热切换方式结束（/renew 或 mode=renew 的 /finalize），0表示不使用')
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='桩服务的平均响应延迟（秒）')
+    parser.add_argument('--llm-jitter', type=float, default=0.05, help='桩服务延迟的均匀抖动范围（秒）')
+    parser.add_argument('--summary-chars', type=int, default=120, help='桩服务返回的摘要长度')
+    parser.add_argument('--search', action='store_true', help='同时测试 /search_for_memory（需要可用的向量库）')
+    parser.add_argument('--no-wait-review', action='store_true', help='不等待后台审阅完成，模拟真实的连续请求')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--stub-port', type=int, default=0, help='桩服务端口，0表示自动分配')
+    parser.add_argument('--workdir', type=str, default='', help='沙盒目录，默认使用临时目录并在结束后删除')
+    parser.add_argument('--keep', action='store_true', help='保留临时沙盒目录')
+    parser.add_argument('--json', type=str, default='', help='将结果写入JSON文件')
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
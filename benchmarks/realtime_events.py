@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Realtime事件处理基准测试
+
+按 Realtime API 的真实节奏合成一段服务端事件流（response.created、转录增量、音频增量、response.done），
+直接喂给 OmniRealtimeClient.handle_event，统计每秒生成语音所消耗的事件处理CPU时间，
+并与“整条JSON解析 + if/elif + base64解码”的旧写法对比，用于跟踪 handle_messages 的性能回退。
+
+不需要网络和API Key，回调都是空操作。
+
+用法:
+    python benchmarks/realtime_events.py --seconds 60 --chunk-ms 100
+    python benchmarks/realtime_events.py --json bench_output.json
+"""
+import sys, os
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+
+from main_helper.omni_realtime_client import OmniRealtimeClient
+
+OUTPUT_SAMPLE_RATE = 24000  # 模型输出 PCM16 24kHz
+
+
+def make_events(seconds, chunk_ms, seed=0, audio_event="response.audio.delta"):
+    """合成 seconds 秒语音对应的事件流，每个音频增量 chunk_ms 毫秒，每 4 个音频增量夹一个转录增量"""
+    rng = random.Random(seed)
+    chunk_bytes = OUTPUT_SAMPLE_RATE * 2 * chunk_ms // 1000
+    transcript_event = audio_event.replace("audio.delta", "audio_transcript.delta")
+    events = [json.dumps({"type": "response.created", "event_id": "event_0", "response": {"id": "resp_0"}})]
+    n_chunks = seconds * 1000 // chunk_ms
+    for i in range(n_chunks):
+        if i % 4 == 0:
+            events.append(json.dumps({
+                "type": transcript_event, "event_id": f"event_t{i}", "response_id": "resp_0",
+                "item_id": "item_0", "output_index": 0, "content_index": 0, "delta": "你好呀，今天",
+            }, ensure_ascii=False))
+        audio = rng.randbytes(chunk_bytes)
+        events.append(json.dumps({
+            "type": audio_event, "event_id": f"event_a{i}", "response_id": "resp_0",
+            "item_id": "item_0", "output_index": 0, "content_index": 0,
+            "delta": base64.b64encode(audio).decode(),
+        }))
+    events.append(json.dumps({"type": "response.done", "event_id": "event_done", "response": {"id": "resp_0"}}))
+    return events
+
+
+async def _noop(*args):
+    return None
+
+
+def make_client():
+    client = OmniRealtimeClient(
+        base_url="ws://localhost", api_key="", model="qwen-omni-turbo-realtime",
+        on_text_delta=_noop, on_audio_delta=_noop, on_new_message=_noop,
+        on_input_transcript=_noop, on_output_transcript=_noop, on_response_done=_noop,
+    )
+    client._print_input_transcript = True
+    return client
+
+
+async def legacy_handle(client, message):
+    """旧写法：每条事件都完整解析JSON，再沿 if/elif 链比较类型"""
+    event = json.loads(message)
+    event_type = event.get("type")
+    if event_type == "error":
+        return
+    elif event_type == "response.done":
+        client._is_responding = False
+    elif event_type == "response.created":
+        client._is_responding = True
+    elif event_type == "response.output_item.added":
+        pass
+    elif event_type == "input_audio_buffer.speech_started":
+        pass
+    elif event_type == "input_audio_buffer.speech_stopped":
+        pass
+    elif event_type == "conversation.item.input_audio_transcription.completed":
+        pass
+    elif event_type in ["response.audio_transcript.done", "response.output_audio_transcript.done"]:
+        pass
+    if event_type in ["response.text.delta", "response.output_text.delta"]:
+        await client.on_text_delta(event["delta"], False)
+    elif event_type in ["response.audio.delta", "response.output_audio.delta"]:
+        await client.on_audio_delta(base64.b64decode(event["delta"]))
+    elif event_type in ["response.audio_transcript.delta", "response.output_audio_transcript.delta"]:
+        await client.on_output_transcript(event.get("delta", ""), False)
+
+
+async def time_handler(handler, client, events, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.process_time()
+        for message in events:
+            await handler(client, message)
+        best = min(best, time.process_time() - start)
+    return best
+
+
+async def run_benchmark(args):
+    events = make_events(args.seconds, args.chunk_ms, args.seed, args.audio_event)
+    client = make_client()
+
+    async def current(c, message):
+        await c.handle_event(message)
+
+    legacy = await time_handler(legacy_handle, client, events, args.repeat)
+    client = make_client()
+    dispatched = await time_handler(current, client, events, args.repeat)
+    total_bytes = sum(len(e) for e in events)
+    return {
+        "params": {"seconds": args.seconds, "chunk_ms": args.chunk_ms, "repeat": args.repeat, "audio_event": args.audio_event},
+        "events": len(events),
+        "event_bytes": total_bytes,
+        "legacy_ms_per_speech_second": legacy * 1000 / args.seconds,
+        "dispatch_ms_per_speech_second": dispatched * 1000 / args.seconds,
+        "legacy_us_per_event": legacy * 1e6 / len(events),
+        "dispatch_us_per_event": dispatched * 1e6 / len(events),
+        "fast_path_audio_deltas": client.audio_deltas_fast_path // args.repeat,
+        "speedup": legacy / dispatched if dispatched else None,
+    }
+
+
+def print_report(report):
+    print(f"事件数: {report['events']}，总大小: {report['event_bytes']} bytes，"
+          f"走快速路径的音频增量: {report['fast_path_audio_deltas']}")
+    header = f"{'handler':<12}{'ms/语音秒':>12}{'us/事件':>12}"
+    print(header)
+    print('-' * len(header))
+    print(f"{'legacy':<12}{report['legacy_ms_per_speech_second']:>12.3f}{report['legacy_us_per_event']:>12.2f}")
+    print(f"{'dispatch':<12}{report['dispatch_ms_per_speech_second']:>12.3f}{report['dispatch_us_per_event']:>12.2f}")
+    print(f"\n加速比: {report['speedup']:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Realtime event handling benchmark')
+    parser.add_argument('--seconds', type=int, default=60, help='合成的语音时长（秒）')
+    parser.add_argument('--chunk-ms', type=int, default=100, help='每个音频增量包含的音频时长（毫秒）')
+    parser.add_argument('--audio-event', type=str, default='response.audio.delta',
+                        choices=['response.audio.delta', 'response.output_audio.delta'], help='音频增量事件名')
+    parser.add_argument('--repeat', type=int, default=5, help='重复次数，取最快的一次')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--json', type=str, default='', help='将结果写入JSON文件')
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 from typing import Dict, Any, List
-from langchain_openai import ChatOpenAI
+from utils.llm_client import get_chat_llm
+from utils.model_router import route_model
+from utils.llm_gateway import llm_ainvoke
+from utils.llm_scheduler import Priority
 from config import get_core_config, MODELS_WITH_EXTRA_BODY
+from .response_cache import ResponseCache
 
 
 class ConversationAnalyzer:
@@ -9,12 +13,14 @@ class ConversationAnalyzer:
     Input is textual transcript snippets from cross-server; output is zero or more normalized task queries.
     """
     def __init__(self):
-        pass
+        # The sync connector re-posts overlapping windows every turn; unchanged windows hit this cache
+        self._response_cache = ResponseCache(maxsize=256, ttl=120)
     
-    def _get_llm(self):
+    def _get_llm(self, prompt=None):
         """动态获取LLM实例以支持配置热重载"""
         core_config = get_core_config()
-        return ChatOpenAI(model=core_config['SUMMARY_MODEL'], base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'], temperature=0, extra_body={"enable_thinking": False} if core_config['SUMMARY_MODEL'] in MODELS_WITH_EXTRA_BODY else None)
+        model = route_model('analyzer', prompt, core_config)
+        return get_chat_llm(model=model, base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'], temperature=0, extra_body={"enable_thinking": False} if model in MODELS_WITH_EXTRA_BODY else None)
 
     def _build_prompt(self, messages: List[Dict[str, str]]) -> str:
         lines = []
@@ -32,21 +38,26 @@ class ConversationAnalyzer:
 
     async def analyze(self, messages: List[Dict[str, str]]):
         prompt = self._build_prompt(messages)
-        llm = self._get_llm()
-        resp = await llm.ainvoke([
+        llm = self._get_llm(prompt)
+        messages = [
             {"role": "system", "content": "You are a precise task intent extractor."},
             {"role": "user", "content": prompt},
-        ])
-        text = resp.content.strip()
-        import json
-        try:
-            if text.startswith("```"):
-                text = text.replace("```json", "").replace("```", "").strip()
-            data = json.loads(text)
-        except Exception as e:
-            print(f"Analyzer parse error: {e}")
-            data = {"tasks": [], "reason": "parse error", "raw": text}
-        return data
+        ]
+
+        async def compute():
+            resp = await llm_ainvoke(llm, messages, Priority.FOREGROUND)
+            text = resp.content.strip()
+            import json
+            try:
+                if text.startswith("```"):
+                    text = text.replace("```json", "").replace("```", "").strip()
+                return json.loads(text), True
+            except Exception as e:
+                print(f"Analyzer parse error: {e}")
+                return {"tasks": [], "reason": "parse error", "raw": text}, False
+
+        key = ResponseCache.fingerprint(getattr(llm, 'model_name', None), messages)
+        return await self._response_cache.get_or_compute(key, compute)
 
 
 
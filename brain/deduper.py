@@ -1,6 +1,10 @@
 from typing import List, Dict, Any, Optional, Tuple
-from langchain_openai import ChatOpenAI
+from utils.llm_client import get_chat_llm
+from utils.model_router import route_model
+from utils.llm_gateway import llm_ainvoke
+from utils.llm_scheduler import Priority
 from config import get_core_config, MODELS_WITH_EXTRA_BODY
+from .response_cache import ResponseCache
 
 
 class TaskDeduper:
@@ -11,13 +15,18 @@ class TaskDeduper:
     """
 
     def __init__(self):
+        self._response_cache = ResponseCache(maxsize=512, ttl=300)
+
+    def _get_llm(self, prompt=None):
+        """动态获取LLM实例以支持配置热重载"""
         core_config = get_core_config()
-        self.llm = ChatOpenAI(
-            model=core_config['SUMMARY_MODEL'],
+        model = route_model('dedup', prompt, core_config)
+        return get_chat_llm(
+            model=model,
             base_url=core_config['OPENROUTER_URL'],
             api_key=core_config['OPENROUTER_API_KEY'],
             temperature=0,
-            extra_body={"enable_thinking": False} if core_config['SUMMARY_MODEL'] in MODELS_WITH_EXTRA_BODY else None
+            extra_body={"enable_thinking": False} if model in MODELS_WITH_EXTRA_BODY else None
         )
 
     def _build_prompt(self, new_task: str, candidates: List[Tuple[str, str]]) -> str:
@@ -37,30 +46,37 @@ class TaskDeduper:
             return {"duplicate": False, "matched_id": None}
 
         prompt = self._build_prompt(new_task, candidates)
-        resp = await self.llm.ainvoke([
+        llm = self._get_llm(prompt)
+        messages = [
             {"role": "system", "content": "You are a careful deduplication judge."},
             {"role": "user", "content": prompt},
-        ])
-        text = (resp.content or "").strip()
-        import json
-        try:
-            if text.startswith("```"):
-                text = text.replace("```json", "").replace("```", "").strip()
-            data = json.loads(text)
-            # Preferred contract: JSON array [matched_id_or_null, duplicate_boolean]
-            if isinstance(data, list) and len(data) >= 2:
-                matched_id = data[0]
-                duplicate = bool(data[1])
-                return {"duplicate": duplicate, "matched_id": matched_id}
-            # Fallback: accept dict shape if model returns it
-            if isinstance(data, dict):
-                return {
-                    "duplicate": bool(data.get("duplicate", False)),
-                    "matched_id": data.get("matched_id")
-                }
-            # Unknown shape
-            return {"duplicate": False, "matched_id": None}
-        except Exception:
-            return {"duplicate": False, "matched_id": None}
+        ]
+
+        async def compute():
+            resp = await llm_ainvoke(llm, messages, Priority.FOREGROUND)
+            text = (resp.content or "").strip()
+            import json
+            try:
+                if text.startswith("```"):
+                    text = text.replace("```json", "").replace("```", "").strip()
+                data = json.loads(text)
+                # Preferred contract: JSON array [matched_id_or_null, duplicate_boolean]
+                if isinstance(data, list) and len(data) >= 2:
+                    matched_id = data[0]
+                    duplicate = bool(data[1])
+                    return {"duplicate": duplicate, "matched_id": matched_id}, True
+                # Fallback: accept dict shape if model returns it
+                if isinstance(data, dict):
+                    return {
+                        "duplicate": bool(data.get("duplicate", False)),
+                        "matched_id": data.get("matched_id")
+                    }, True
+                # Unknown shape
+                return {"duplicate": False, "matched_id": None}, False
+            except Exception:
+                return {"duplicate": False, "matched_id": None}, False
+
+        key = ResponseCache.fingerprint(getattr(llm, 'model_name', None), messages)
+        return await self._response_cache.get_or_compute(key, compute)
 
 
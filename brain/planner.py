@@ -2,10 +2,14 @@ import asyncio
 import logging
 from typing import Dict, Any, List, Optional
 from dataclasses import dataclass, field
-from langchain_openai import ChatOpenAI
+from utils.llm_client import get_chat_llm
+from utils.model_router import route_model
+from utils.llm_gateway import llm_ainvoke
+from utils.llm_scheduler import Priority
 from config import get_core_config, MODELS_WITH_EXTRA_BODY
 from .mcp_client import McpRouterClient, McpToolCatalog
 from .computer_use import ComputerUseAdapter
+from .response_cache import ResponseCache
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -31,11 +35,14 @@ class TaskPlanner:
         self.catalog = McpToolCatalog(self.router)
         self.task_pool: Dict[str, Task] = {}
         self.computer_use = computer_use or ComputerUseAdapter()
+        # Planning decisions keyed by (model, prompt, capabilities version)
+        self._response_cache = ResponseCache(maxsize=256, ttl=300)
     
-    def _get_llm(self):
+    def _get_llm(self, prompt=None):
         """动态获取LLM实例以支持配置热重载"""
         core_config = get_core_config()
-        return ChatOpenAI(model=core_config['SUMMARY_MODEL'], base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'], temperature=0, extra_body={"enable_thinking": False} if core_config['SUMMARY_MODEL'] in MODELS_WITH_EXTRA_BODY else None)
+        model = route_model('planner', prompt, core_config)
+        return get_chat_llm(model=model, base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'], temperature=0, extra_body={"enable_thinking": False} if model in MODELS_WITH_EXTRA_BODY else None)
 
     async def refresh_capabilities(self) -> Dict[str, Dict[str, Any]]:
         try:
@@ -59,19 +66,28 @@ class TaskPlanner:
             " steps should be granular tool queries for the MCP processor."
         )
         mcp_user = f"Capabilities:\n{tools_brief}\n\nTask: {query}"
-        llm = self._get_llm()
-        resp1 = await llm.ainvoke([
+        llm = self._get_llm(mcp_user)
+        import json, uuid
+        capabilities_version = ResponseCache.fingerprint(None, [], capabilities)
+        mcp_messages = [
             {"role": "system", "content": mcp_system},
             {"role": "user", "content": mcp_user},
-        ])
-        text1 = resp1.content.strip()
-        import json, uuid
-        try:
-            if text1.startswith("```"):
-                text1 = text1.replace("```json", "").replace("```", "").strip()
-            mcp = json.loads(text1)
-        except Exception:
-            mcp = {"can_execute": False, "reason": "LLM parse error", "server_id": None, "steps": []}
+        ]
+
+        async def plan_mcp():
+            resp1 = await llm_ainvoke(llm, mcp_messages, Priority.FOREGROUND)
+            text1 = resp1.content.strip()
+            try:
+                if text1.startswith("```"):
+                    text1 = text1.replace("```json", "").replace("```", "").strip()
+                return json.loads(text1), True
+            except Exception:
+                return {"can_execute": False, "reason": "LLM parse error", "server_id": None, "steps": []}, False
+
+        mcp = await self._response_cache.get_or_compute(
+            ResponseCache.fingerprint(getattr(llm, 'model_name', None), mcp_messages, capabilities_version),
+            plan_mcp,
+        )
         
         # Log MCP decision
         if mcp.get('can_execute'):
@@ -97,17 +113,25 @@ class TaskPlanner:
                     " {use_computer: bool, reason: string}"
                 )
                 cu_user = f"Task: {query}"
-                resp2 = await llm.ainvoke([
+                cu_messages = [
                     {"role": "system", "content": cu_system},
                     {"role": "user", "content": cu_user},
-                ])
-                text2 = resp2.content.strip()
-                try:
-                    if text2.startswith("```"):
-                        text2 = text2.replace("```json", "").replace("```", "").strip()
-                    cu_decision = json.loads(text2)
-                except Exception:
-                    cu_decision = {"use_computer": False, "reason": "LLM parse error"}
+                ]
+
+                async def plan_cu():
+                    resp2 = await llm_ainvoke(llm, cu_messages, Priority.FOREGROUND)
+                    text2 = resp2.content.strip()
+                    try:
+                        if text2.startswith("```"):
+                            text2 = text2.replace("```json", "").replace("```", "").strip()
+                        return json.loads(text2), True
+                    except Exception:
+                        return {"use_computer": False, "reason": "LLM parse error"}, False
+
+                cu_decision = await self._response_cache.get_or_compute(
+                    ResponseCache.fingerprint(getattr(llm, 'model_name', None), cu_messages),
+                    plan_cu,
+                )
 
                 # Do not execute here to avoid blocking; scheduling is handled by server
                 # if cu_decision.get('use_computer'): execution will be scheduled by the caller
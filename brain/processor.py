@@ -1,7 +1,10 @@
 from typing import Dict, Any, Optional
 import asyncio
 import logging
-from langchain_openai import ChatOpenAI
+from utils.llm_client import get_chat_llm
+from utils.model_router import route_model
+from utils.llm_gateway import llm_ainvoke
+from utils.llm_scheduler import Priority
 from config import get_core_config, MODELS_WITH_EXTRA_BODY
 from .mcp_client import McpRouterClient, McpToolCatalog
 
@@ -18,10 +21,11 @@ class Processor:
         self.router = McpRouterClient()
         self.catalog = McpToolCatalog(self.router)
     
-    def _get_llm(self):
+    def _get_llm(self, prompt=None):
         """动态获取LLM实例以支持配置热重载"""
         core_config = get_core_config()
-        return ChatOpenAI(model=core_config['SUMMARY_MODEL'], base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'], temperature=0, extra_body={"enable_thinking": False} if core_config['SUMMARY_MODEL'] in MODELS_WITH_EXTRA_BODY else None)
+        model = route_model('processor', prompt, core_config)
+        return get_chat_llm(model=model, base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'], temperature=0, extra_body={"enable_thinking": False} if model in MODELS_WITH_EXTRA_BODY else None)
 
     async def process(self, query: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         capabilities = await self.catalog.get_capabilities()
@@ -41,11 +45,11 @@ class Processor:
             " For tool_calls, be specific about which tools from the server would be used (e.g., ['save_memory', 'retrieve_memory'])."
         )
         user = f"Capabilities:\n{tools_brief}\n\nTask: {query}"
-        llm = self._get_llm()
-        resp = await llm.ainvoke([
+        llm = self._get_llm(user)
+        resp = await llm_ainvoke(llm, [
             {"role": "system", "content": system},
             {"role": "user", "content": user},
-        ])
+        ], Priority.FOREGROUND)
         text = resp.content.strip()
         
         # Log raw LLM response for debugging
@@ -0,0 +1,88 @@
+import asyncio
+import copy
+import hashlib
+import json
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from cachetools import TTLCache
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class ResponseCache:
+    """
+    TTL + size bounded cache for parsed LLM decisions in the brain modules.
+    Keys are fingerprints of (model, normalized messages, extra context such as the
+    capabilities version), so re-posting an unchanged conversation window or re-planning
+    the same task against the same capability list returns instantly without tokens.
+    Concurrent lookups of the same key share one in-flight LLM call.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300):
+        self._cache: TTLCache[str, Any] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(text: Any) -> Any:
+        if isinstance(text, str):
+            return _WHITESPACE.sub(" ", text).strip()
+        if isinstance(text, list):
+            return [ResponseCache._normalize(t) for t in text]
+        if isinstance(text, dict):
+            return {k: ResponseCache._normalize(v) for k, v in text.items()}
+        return text
+
+    @staticmethod
+    def fingerprint(model: Optional[str], messages: List[Dict[str, Any]], extra: Any = None) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": ResponseCache._normalize(messages), "extra": extra},
+            ensure_ascii=False, sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Tuple[Any, bool]]]) -> Any:
+        """
+        Return the cached value for key, or run compute() which returns (value, cacheable).
+        Values are deep-copied on the way out so callers may mutate them freely.
+        """
+        if key in self._cache:
+            self.hits += 1
+            return copy.deepcopy(self._cache[key])
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                value = await asyncio.shield(pending)
+                self.hits += 1
+                return copy.deepcopy(value)
+            except asyncio.CancelledError:
+                # The owner of the in-flight call was cancelled, not us: compute it ourselves
+                if not pending.cancelled():
+                    raise
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value, cacheable = await compute()
+            if cacheable:
+                self._cache[key] = value
+            future.set_result(value)
+            return copy.deepcopy(value)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Avoid "exception was never retrieved" when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
@@ -4,7 +4,11 @@ import json
 import os
 import logging
 import os
+import threading
+import time
+from collections import namedtuple
 from pathlib import Path
+from types import MappingProxyType
 from utils.config_manager import get_config_manager
 
 # Setup logger for this module
@@ -50,9 +54,10 @@ def save_characters(data, character_json_path=None):
     
     with open(character_json_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    _config_manager.notify_config_changed(os.path.basename(character_json_path))
 
-def get_character_data():
-    """获取角色数据"""
+def _build_character_data():
+    """从characters.json解析角色数据"""
     character_data = load_characters()
     # MASTER_NAME 必须始终存在，取档案名
     master_name = character_data.get('主人', {}).get('档案名', _default_master['档案名'])
@@ -91,9 +96,33 @@ TIME_COMPRESSED_TABLE_NAME = "time_indexed_compressed"
 
 MODELS_WITH_EXTRA_BODY = ["qwen-flash-2025-07-28", "qwen3-vl-plus-2025-09-23"]
 
-def get_core_config():
+# 语音session的续期（热切换）预算，按 CORE_API_TYPE 选择，任意一项超出即在回合结束时准备新session
+#   min_uptime: session至少运行这么久（秒）才考虑续期，避免频繁切换
+#   max_uptime: 无论用量多少，运行这么久（秒）后续期，需要小于服务商的单session时长上限
+#   context_tokens: 当前上下文的token数（最近一次response的输入+输出）
+#   input_tokens: 本session累计计费的输入token数（每次回复都会重新读取整个上下文）
+#   audio_seconds: 本session累计的输入+输出音频时长（秒）
+SESSION_RENEWAL_BUDGETS = {
+    'qwen': {'min_uptime': 40, 'max_uptime': 1500, 'context_tokens': 16000, 'input_tokens': 300000, 'audio_seconds': 900},
+    'openai': {'min_uptime': 40, 'max_uptime': 1500, 'context_tokens': 16000, 'input_tokens': 150000, 'audio_seconds': 900},
+    'glm': {'min_uptime': 40, 'max_uptime': 1500, 'context_tokens': 6000, 'input_tokens': 150000, 'audio_seconds': 600},
+    'step': {'min_uptime': 40, 'max_uptime': 1500, 'context_tokens': 8000, 'input_tokens': 150000, 'audio_seconds': 600},
+    'free': {'min_uptime': 40, 'max_uptime': 1500, 'context_tokens': 8000, 'input_tokens': 100000, 'audio_seconds': 600},
+    'default': {'min_uptime': 40, 'max_uptime': 1500, 'context_tokens': 12000, 'input_tokens': 200000, 'audio_seconds': 900},
+}
+
+# 各服务商的Realtime接口（按 coreApi 类型），以及作为备用服务商时使用的API Key字段
+REALTIME_PROVIDERS = {
+    'free': {'url': "ws://47.100.209.206:9805", 'model': "free-model", 'key_field': None},  #还在备案，之后会换成wss+域名
+    'qwen': {'url': "wss://dashscope.aliyuncs.com/api-ws/v1/realtime", 'model': "qwen3-omni-flash-realtime-2025-09-15", 'key_field': 'assistApiKeyQwen'},
+    'glm': {'url': "wss://open.bigmodel.cn/api/paas/v4/realtime", 'model': "glm-realtime-air", 'key_field': 'assistApiKeyGlm'},
+    'openai': {'url': "wss://api.openai.com/v1/realtime", 'model': "gpt-realtime", 'key_field': 'assistApiKeyOpenai'},
+    'step': {'url': "wss://api.stepfun.com/v1/realtime", 'model': "step-audio-2", 'key_field': 'assistApiKeyStep'},
+}
+
+def _build_core_config():
     """
-    动态读取核心配置
+    从core_config.json解析核心配置
     返回一个包含所有核心配置的字典
     """
     # 从 config/api.py 导入默认值
@@ -135,6 +164,8 @@ def get_core_config():
         'COMPUTER_USE_MODEL_API_KEY': '',
         'COMPUTER_USE_GROUND_API_KEY': '',
         'IS_FREE_VERSION': False,  # 标识是否为免费版
+        # 主服务商不可用时按顺序尝试的备用Realtime服务商: [{'type', 'url', 'model', 'api_key'}, ...]
+        'CORE_FALLBACKS': [],
     }
     
     try:
@@ -150,24 +181,14 @@ def get_core_config():
         
         # 根据 coreApi 类型设置 CORE_URL 和 CORE_MODEL
         if 'coreApi' in core_cfg and core_cfg['coreApi']:
+            if core_cfg['coreApi'] in REALTIME_PROVIDERS:
+                provider = REALTIME_PROVIDERS[core_cfg['coreApi']]
+                config['CORE_URL'] = provider['url']
+                config['CORE_MODEL'] = provider['model']
             if core_cfg['coreApi'] == 'free':
                 # 免费版配置
-                config['CORE_URL'] = "ws://47.100.209.206:9805" #还在备案，之后会换成wss+域名
-                config['CORE_MODEL'] = "free-model"  # 免费版无需指定模型
                 config['CORE_API_KEY'] = "free-access"  # 免费版无需真实API key
                 config['IS_FREE_VERSION'] = True
-            elif core_cfg['coreApi'] == 'qwen':
-                config['CORE_URL'] = "wss://dashscope.aliyuncs.com/api-ws/v1/realtime"
-                config['CORE_MODEL'] = "qwen3-omni-flash-realtime-2025-09-15"
-            elif core_cfg['coreApi'] == 'glm':
-                config['CORE_URL'] = "wss://open.bigmodel.cn/api/paas/v4/realtime"
-                config['CORE_MODEL'] = "glm-realtime-air"
-            elif core_cfg['coreApi'] == 'openai':
-                config['CORE_URL'] = "wss://api.openai.com/v1/realtime"
-                config['CORE_MODEL'] = "gpt-realtime"
-            elif core_cfg['coreApi'] == 'step':
-                config['CORE_URL'] = "wss://api.stepfun.com/v1/realtime"
-                config['CORE_MODEL'] = "step-audio-2"
         
         # 读取各种辅助API Key
         config['ASSIST_API_KEY_QWEN'] = core_cfg.get('assistApiKeyQwen', '') or config['CORE_API_KEY']
@@ -176,6 +197,16 @@ def get_core_config():
         config['ASSIST_API_KEY_STEP'] = core_cfg.get('assistApiKeyStep', '') or config['CORE_API_KEY']
         config['ASSIST_API_KEY_SILICON'] = core_cfg.get('assistApiKeySilicon', '') or config['CORE_API_KEY']
         
+        # 备用Realtime服务商，按 coreApiFallbacks 中的顺序；需要单独填写该服务商的API Key（免费版除外）
+        for api_type in core_cfg.get('coreApiFallbacks') or []:
+            provider = REALTIME_PROVIDERS.get(api_type)
+            if not provider or api_type == config['CORE_API_TYPE']:
+                continue
+            api_key = core_cfg.get(provider['key_field'], '') if provider['key_field'] else "free-access"
+            if api_key:
+                config['CORE_FALLBACKS'].append(
+                    {'type': api_type, 'url': provider['url'], 'model': provider['model'], 'api_key': api_key})
+
         # 读取MCP Token
         if 'mcpToken' in core_cfg and core_cfg['mcpToken']:
             config['MCP_ROUTER_API_KEY'] = core_cfg['mcpToken']
@@ -251,6 +282,100 @@ def get_core_config():
     
     return config
 
+
+# ===== 进程内配置注册表 =====
+# characters.json 和 core_config.json 只在文件变化（或通过ConfigManager显式保存）时重新解析，
+# 其余时候直接返回缓存的快照。快照带有递增的版本号，便于下游缓存判断配置是否更新。
+ConfigSnapshot = namedtuple('ConfigSnapshot', ['version', 'character_data', 'core_config'])
+
+# 两次检查文件mtime之间的最小间隔（秒）。其他进程修改配置后最多延迟这么久生效，本进程内的保存立即生效
+CONFIG_STAT_INTERVAL = 1.0
+
+_registry_lock = threading.RLock()
+_snapshot = None
+_snapshot_stamps = None
+_snapshot_dirty = False
+_last_stat_check = 0.0
+
+
+def _freeze(value, depth=1):
+    """把字典（depth>1 时连同下一层的字典）包装成只读视图，调用方误改缓存时直接报错，而不是悄悄污染其他模块看到的配置"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v, depth - 1) if depth > 1 else v for k, v in value.items()})
+    return value
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+def _config_stamps():
+    return _file_stamp(CHARACTER_JSON_PATH), _file_stamp(CORE_CONFIG_PATH)
+
+
+def invalidate_config_cache(filename=None):
+    """标记配置缓存失效，下一次读取时重新加载"""
+    global _snapshot_dirty
+    if filename is None or filename in ('characters.json', 'core_config.json'):
+        _snapshot_dirty = True
+
+
+def get_config_snapshot():
+    """
+    获取当前配置快照（只读）。
+    配置文件未变化时直接返回缓存，不做文件读取和JSON解析。
+    """
+    global _snapshot, _snapshot_stamps, _snapshot_dirty, _last_stat_check
+    snapshot = _snapshot
+    if snapshot is not None and not _snapshot_dirty and time.monotonic() - _last_stat_check < CONFIG_STAT_INTERVAL:
+        return snapshot
+
+    with _registry_lock:
+        stamps = _config_stamps()
+        _last_stat_check = time.monotonic()
+        if _snapshot is not None and not _snapshot_dirty and stamps == _snapshot_stamps:
+            return _snapshot
+
+        # 先记录文件状态、清除标记再解析，解析期间发生的修改会触发下一次重新加载
+        _snapshot_dirty = False
+        version = _snapshot.version + 1 if _snapshot is not None else 1
+        # 第4项 lanlan_basic_config 是 {角色名: 角色配置}，两层都设为只读
+        character_data = tuple(_freeze(item, depth=2 if i == 3 else 1) for i, item in enumerate(_build_character_data()))
+        core_config = MappingProxyType(_build_core_config())
+        _snapshot_stamps = stamps
+        _snapshot = ConfigSnapshot(version, character_data, core_config)
+        if version > 1:
+            logger.info(f"配置已重新加载 (version {version})")
+        return _snapshot
+
+
+def get_config_version():
+    """当前配置快照的版本号，每次重新加载后递增"""
+    return get_config_snapshot().version
+
+
+def get_character_data():
+    """
+    获取角色数据（来自缓存快照，返回的字典是只读视图，需要修改时先复制；
+    修改角色请使用 load_characters + save_characters）
+    """
+    return get_config_snapshot().character_data
+
+
+def get_core_config():
+    """
+    获取核心配置，支持热重载
+    返回一个包含所有核心配置的字典（副本，可自由修改）
+    """
+    return dict(get_config_snapshot().core_config)
+
+
+_config_manager.add_change_listener(invalidate_config_cache)
+
 # 但是保留不易变的常量（端口、表名等）
 from config.api import (
     MAIN_SERVER_PORT,
@@ -271,6 +396,9 @@ __all__ = [
     # 函数
     'get_character_data',
     'get_core_config',
+    'get_config_snapshot',
+    'get_config_version',
+    'invalidate_config_cache',
     'load_characters',
     'save_characters',
     # 路径
@@ -281,6 +409,8 @@ __all__ = [
     'TIME_ORIGINAL_TABLE_NAME',
     'TIME_COMPRESSED_TABLE_NAME',
     'MODELS_WITH_EXTRA_BODY',
+    'SESSION_RENEWAL_BUDGETS',
+    'REALTIME_PROVIDERS',
     'MAIN_SERVER_PORT',
     'MEMORY_SERVER_PORT',
     'MONITOR_SERVER_PORT',
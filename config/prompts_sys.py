@@ -68,7 +68,19 @@ settings_extractor_prompt = f"""从以下对话中提取关于{{LANLAN_NAME}}和
 
 现在，请提取关于{{LANLAN_NAME}}和{MASTER_NAME}的重要个人信息。注意，只允许添加重要、准确的信息。如果没有符合条件的信息，可以返回一个空字典({{}})。"""
 
-settings_verifier_prompt = ''
+settings_verifier_prompt = """以下是{LANLAN_NAME}的个人备忘录中与最新对话相冲突的条目。每个条目给出了备忘录中的旧值(old)和从最新对话中提取的新值(new)。
+
+======以下为冲突条目======
+%s
+======以上为冲突条目======
+
+请逐条裁决最终应保留的值：
+- 如果新值是对旧值的更新或更正，采用新值；
+- 如果新旧值可以共存，将二者合并为一个值；
+- 如果新值明显是误提取，保留旧值；
+- 如果该条目已经不再成立，返回null。
+
+只返回JSON，结构与冲突条目相同，但每个条目只给出最终值，例如：{"某人": {"属性1": "最终值", "属性2": null}}。不要添加冲突条目以外的key。"""
 
 history_review_prompt = """请审阅%s和%s之间的对话历史记录，识别并修正以下问题：
 
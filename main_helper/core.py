@@ -4,13 +4,14 @@
 TTS部分使用了两个队列，原本只需要一个，但是阿里的TTS API回调函数只支持同步函数，所以增加了一个response queue来异步向前端发送音频数据。
 """
 import asyncio
+import time
 import json
 import traceback
 import struct  # For packing audio data
 import threading
 import re
-import requests
 import logging
+from collections import deque
 from datetime import datetime
 from websockets import exceptions as web_exceptions
 from fastapi import WebSocket, WebSocketDisconnect
@@ -19,21 +20,53 @@ from utils.frontend_utils import contains_chinese, replace_blank, replace_corner
 from utils.audio import make_wav_header
 from main_helper.omni_realtime_client import OmniRealtimeClient
 from main_helper.omni_offline_client import OmniOfflineClient
+from main_helper.standby_pool import RealtimeStandbyPool
+from main_helper.provider_failover import RealtimeFailover
+from main_helper.warm_context import load_warm_context, save_warm_context
+from main_helper.turn_latency import TurnLatencyTracker
+from main_helper.turn_tuning import EndOfTurnTuner
 from main_helper.tts_helper import get_tts_worker
 import inflect
 import base64
 from io import BytesIO
 from PIL import Image
-from config import get_character_data, get_core_config, MEMORY_SERVER_PORT
+from config import get_character_data, get_core_config, MEMORY_SERVER_PORT, SESSION_RENEWAL_BUDGETS
 from multiprocessing import Process, Queue as MPQueue
 from uuid import uuid4
 import numpy as np
-from librosa import resample
+from utils.resampler import StreamingResampler
+from utils.silence_gate import SilenceGate, GATE_HANGOVER_MS
 import httpx 
 
 # Setup logger for this module
 logger = logging.getLogger(__name__)
 
+# memory_server 在这个时间内没有返回记忆时，先用本地保存的上一次上下文启动session（秒）
+MEMORY_CONTEXT_DEADLINE = 1.5
+# 获取记忆的总超时时间（秒），超过deadline后仍在后台等待，到达后注入当前session
+MEMORY_CONTEXT_TIMEOUT = 30.0
+# 最近麦克风音频的保留时长（毫秒），需要覆盖热切换最后一步的窗口
+MIC_HISTORY_MS = 5000
+# 热切换时，除了切换窗口内的音频，还向新session重放这么长的切换前音频，让新session的VAD能捕捉到语音开头（毫秒）
+MIC_SWAP_PREROLL_MS = 300
+# Core API 的输入音频为 16bit 16kHz 单声道
+_MIC_BYTES_PER_MS = 32
+# 与服务商的连接意外断开后自动重连：最多尝试次数、退避时间（秒，指数增长并封顶）、单次建连超时（秒）
+# 重连期间的麦克风音频只保存在 MIC_HISTORY_MS 的缓冲区里，重连总耗时也以此为限，超时则放弃，不丢弃用户的话
+RESUME_MAX_ATTEMPTS = 6
+RESUME_BACKOFF_BASE = 0.25
+RESUME_BACKOFF_MAX = 4.0
+RESUME_CONNECT_TIMEOUT = 5.0
+# 重连时写入instructions的最近对话条数
+RESUME_TRANSCRIPT_TURNS = 20
+# 断开原因中包含这些标记时不重连（欠费、额度用尽、鉴权失败等，重连也不会成功），匹配时不区分大小写
+RESUME_FATAL_HINTS = ('欠费', 'arrearage', 'good standing', 'insufficient_quota', 'exceeded your current quota',
+                      'unauthorized', 'forbidden', 'invalid_api_key', 'invalid api key', 'incorrect api key', 'authentication')
+# 断开原因中的HTTP 401/403状态码
+RESUME_FATAL_STATUS = re.compile(r'\b40[13]\b')
+# semantic_vad 自己决定何时算说完，停顿可能较长，静音抑制的拖尾也相应放长（毫秒）
+SEMANTIC_VAD_GATE_HANGOVER_MS = 4000
+
 
 
 # --- 一个带有定期上下文压缩+在线热切换的语音会话管理器 ---
@@ -51,6 +84,12 @@ class LLMSessionManager:
         self.tts_process = None  # TTS子进程
         self.lock = asyncio.Lock()  # 使用异步锁替代同步锁
         self.current_speech_id = None
+        self._speech_id_fresh = False  # 当前speech_id下是否还没有输出过任何内容
+        self.tts_frames_dropped = 0  # 因speech_id过期而丢弃的TTS音频帧数
+        # 每轮语音交互关键路径的时间线（speech_stopped -> 首次推送音频）
+        self.turn_latency = TurnLatencyTracker()
+        # 根据用户的停顿习惯调整服务端VAD的静音时长，跨session保留
+        self.turn_tuner = EndOfTurnTuner()
         self.inflect_parser = inflect.engine()
         self.emoji_pattern = re.compile(r'[^\w\u4e00-\u9fff\s>][^\w\u4e00-\u9fff\s]{2,}[^\w\u4e00-\u9fff\s<]', flags=re.UNICODE)
         self.emoji_pattern2 = re.compile("["
@@ -102,6 +141,9 @@ class LLMSessionManager:
         self.pending_connector = None
         self.pending_session = None
         self.is_hot_swap_imminent = False
+        # 连接意外断开后的重连任务，以及当前session的instructions之外的最近对话（重连时写入新session）
+        self._resume_task = None
+        self._session_transcript = deque(maxlen=RESUME_TRANSCRIPT_TURNS)
         self.tts_handler_task = None
         # 热切换相关变量
         self.background_preparation_task = None
@@ -136,47 +178,72 @@ class LLMSessionManager:
         self.tts_ready = False  # TTS是否完全就绪
         self.tts_pending_chunks = []  # 待处理的TTS文本chunk: [(speech_id, text), ...]
         self.tts_cache_lock = asyncio.Lock()  # 保护缓存的锁
+        # 模型输出音频 24kHz -> 前端播放 48kHz，跨chunk保留滤波器状态
+        self._output_resampler = StreamingResampler(24000, 48000)
+        # 麦克风二进制帧：非16kHz输入时的重采样器，以及上一帧的序号（用于发现丢帧）
+        self._mic_resampler = None
+        self._mic_last_seq = None
+        # 最近的麦克风PCM：(本地序号, pcm)。热切换最后一步期间暂停向旧session发送（_mic_hold），
+        # 切换完成后按序号把未送达新session的音频重放进去
+        self._mic_history = deque()
+        self._mic_history_bytes = 0
+        self._mic_seq = 0
+        self._mic_delivered_seq = 0  # 当前session已经收到的最后一个序号
+        self._mic_hold = False
+        self._mic_hold_seq = 0  # 开始暂停时的序号
+        self._mic_lock = asyncio.Lock()
+        # 麦克风静音抑制：只把有语音的片段（以及前后的预录和拖尾）发给服务商
+        self._mic_gate = SilenceGate()
+        # 预热的Realtime备用连接，start_session和热切换优先从这里取用
+        self.standby_pool = RealtimeStandbyPool(lanlan_name)
+        # 主服务商连接失败时按配置切换到备用Realtime服务商，并在一段时间内记住胜出的服务商
+        self.realtime_failover = RealtimeFailover(lanlan_name)
+        # session启动各阶段耗时（毫秒），从start_session开始计时，到第一次向前端推送音频为止
+        self._bringup_t0 = None
+        self.bringup_timings = {}
+        # 使用本地上下文启动时，尚未到达的记忆：(fetch_task, base_prompt, warm_context)
+        self._late_memory = None
         
         # 输入数据缓存机制：确保session初始化期间的输入不丢失
         self.session_ready = False  # Session是否完全就绪
         self.pending_input_data = []  # 待处理的输入数据: [message_dict, ...]
         self.input_cache_lock = asyncio.Lock()  # 保护输入缓存的锁
 
-    async def handle_new_message(self):
-        """处理新模型输出：清空TTS队列并通知前端"""
+    async def handle_interrupt(self):
+        """
+        用户开始说话（speech_started）或发送了新的文本：立即开启新的speech_id，停止当前播放。
+        TTS子进程、主进程、同步连接器和monitor都按speech_id丢弃属于旧回复的音频，不需要清空队列
+        """
+        async with self.lock:
+            previous_speech_id = self.current_speech_id
+            self.current_speech_id = speech_id = str(uuid4())
+            self._speech_id_fresh = True
+        async with self.tts_cache_lock:
+            self.tts_pending_chunks.clear()
         if self.use_tts and self.tts_process and self.tts_process.is_alive():
-            # 清空响应队列中待发送的音频数据
-            while not self.tts_response_queue.empty():
-                try:
-                    self.tts_response_queue.get_nowait()
-                except:
-                    break
-            # 发送终止信号以清空TTS请求队列并停止当前合成
+            # 不带文本的新speech_id：worker立即放弃旧的合成，并为下一轮回复准备好连接
             try:
-                self.tts_request_queue.put((None, None))
+                self.tts_request_queue.put((speech_id, None))
             except Exception as e:
                 logger.warning(f"⚠️ 发送TTS中断信号失败: {e}")
-        
-        # 清空待处理的TTS缓存
-        async with self.tts_cache_lock:
-            self.tts_pending_chunks.clear()
-        
+        # 新的一轮回复从静音开始，不带上一轮的滤波器状态
+        self._output_resampler.reset()
+        self.sync_message_queue.put({'type': 'interrupt', 'speech_id': speech_id, 'previous_speech_id': previous_speech_id})
         await self.send_user_activity()
 
+    async def handle_new_message(self):
+        """用户说完话：这次发言还没有触发过打断时（例如服务商没有发送speech_started），在这里打断"""
+        if not self._speech_id_fresh:
+            await self.handle_interrupt()
+
     async def handle_text_data(self, text: str, is_first_chunk: bool = False):
         """文本回调：处理文本显示和TTS（用于文本模式）"""
-        # 如果是新消息的第一个chunk，清空TTS队列和缓存以打断之前的语音
+        self._speech_id_fresh = False
+        self.turn_latency.mark('first_delta')
+        # 如果是新消息的第一个chunk，清空TTS缓存；旧语音的音频会因为speech_id不同而被丢弃
         if is_first_chunk and self.use_tts:
             async with self.tts_cache_lock:
                 self.tts_pending_chunks.clear()
-            
-            if self.tts_process and self.tts_process.is_alive():
-                # 清空响应队列中待发送的音频数据
-                while not self.tts_response_queue.empty():
-                    try:
-                        self.tts_response_queue.get_nowait()
-                    except:
-                        break
         
         # 文本模式下，无论是否使用TTS，都要发送文本到前端显示
         await self.send_lanlan_response(text, is_first_chunk)
@@ -189,6 +256,7 @@ class LLMSessionManager:
                     # TTS已就绪，直接发送
                     try:
                         self.tts_request_queue.put((self.current_speech_id, text))
+                        self.turn_latency.mark('first_tts_request')
                     except Exception as e:
                         logger.warning(f"⚠️ 发送TTS请求失败: {e}")
                 else:
@@ -227,9 +295,9 @@ class LLMSessionManager:
             return
             
         if hasattr(self, 'is_preparing_new_session') and not self.is_preparing_new_session:
-            if self.session_start_time and \
-                        (datetime.now() - self.session_start_time).total_seconds() >= 40:
-                logger.info(f"[{self.lanlan_name}] Main Listener: Uptime threshold met. Marking for new session preparation.")
+            renew_reason = self._renewal_reason()
+            if renew_reason:
+                logger.info(f"[{self.lanlan_name}] Main Listener: {renew_reason}. Marking for new session preparation.")
                 self.is_preparing_new_session = True  # Mark that we are in prep mode
                 self.summary_triggered_time = datetime.now()
                 self.message_cache_for_new_session = []  # Reset cache for this new cycle
@@ -244,9 +312,14 @@ class LLMSessionManager:
                 (not self.background_preparation_task or self.background_preparation_task.done()) and \
                 not (
                         self.pending_session_warmed_up_event and self.pending_session_warmed_up_event.is_set()):  # Don't restart if already warmed up
-            logger.info(f"[{self.lanlan_name}] Main Listener: Conditions met to start BACKGROUND PREPARATION of pending session.")
-            self.pending_session_warmed_up_event = asyncio.Event()  # Create event for this prep cycle
-            self.background_preparation_task = asyncio.create_task(self._background_prepare_pending_session())
+            if isinstance(self.session, OmniRealtimeClient) and self.session.supports_in_place_refresh:
+                # 服务商支持会话中途更新instructions和删除对话条目：原地刷新，不需要第二条连接
+                logger.info(f"[{self.lanlan_name}] Main Listener: Refreshing session context in place.")
+                self.background_preparation_task = asyncio.create_task(self._refresh_session_in_place())
+            else:
+                logger.info(f"[{self.lanlan_name}] Main Listener: Conditions met to start BACKGROUND PREPARATION of pending session.")
+                self.pending_session_warmed_up_event = asyncio.Event()  # Create event for this prep cycle
+                self.background_preparation_task = asyncio.create_task(self._background_prepare_pending_session())
 
         # Stage 2: Trigger FINAL SWAP if pending session is warmed up AND this old session just completed a turn
         elif self.pending_session_warmed_up_event and \
@@ -268,15 +341,50 @@ class LLMSessionManager:
             # This listener will be cancelled by the final_swap_task.
 
 
+    def _renewal_reason(self):
+        """
+        [热切换相关] 按当前服务商的续期预算（config.SESSION_RENEWAL_BUDGETS）判断是否需要准备新session
+        :return: 需要续期时返回原因，否则返回None
+        """
+        if not self.session_start_time:
+            return None
+        budget = SESSION_RENEWAL_BUDGETS.get(self.core_api_type, SESSION_RENEWAL_BUDGETS['default'])
+        uptime = (datetime.now() - self.session_start_time).total_seconds()
+        if uptime < budget['min_uptime']:
+            return None
+        usage = getattr(self.session, 'usage', None)
+        if usage is None:
+            # 没有用量统计的session（文本模式）仍按运行时长续期
+            return f"Uptime {uptime:.0f}s >= {budget['min_uptime']}s"
+
+        audio_seconds = usage['input_audio_seconds'] + usage['output_audio_seconds']
+        checks = [
+            ('uptime', uptime, budget['max_uptime']),
+            ('context_tokens', usage['context_tokens'], budget['context_tokens']),
+            ('input_tokens', usage['input_tokens'], budget['input_tokens']),
+            ('audio_seconds', audio_seconds, budget['audio_seconds']),
+        ]
+        source = "reported" if usage['reported'] else "estimated"
+        inputs = ", ".join(f"{name}={value:.0f}/{limit}" for name, value, limit in checks)
+        for name, value, limit in checks:
+            if value >= limit:
+                return f"Renewal budget exceeded ({name}, {source} usage: {inputs})"
+        logger.debug(f"[{self.lanlan_name}] 续期预算未超出（{source} usage: {inputs}）")
+        return None
+
     async def handle_audio_data(self, audio_data: bytes):
         """Qwen音频回调：推送音频到WebSocket前端"""
         if not self.use_tts:
+            self._speech_id_fresh = False
             if self.websocket and hasattr(self.websocket, 'client_state') and self.websocket.client_state == self.websocket.client_state.CONNECTED:
-                # 这里假设audio_data为PCM16字节流，直接推送
-                audio = np.frombuffer(audio_data, dtype=np.int16)
-                audio = (resample(audio.astype(np.float32) / 32768.0, orig_sr=24000, target_sr=48000)*32767.).clip(-32768, 32767).astype(np.int16)
+                speech_id = self.current_speech_id
+                # 这里假设audio_data为PCM16字节流，重采样到48kHz后推送
+                audio = await self._output_resampler.process_bytes_async(audio_data)
+                if speech_id != self.current_speech_id:
+                    # 重采样期间用户开始说话，丢弃
+                    return
 
-                await self.send_speech(audio.tobytes())
+                await self.send_speech(audio, speech_id)
                 # 你可以根据需要加上格式、isNewMessage等标记
                 # await self.websocket.send_json({"type": "cozy_audio", "format": "blob", "isNewMessage": True})
             else:
@@ -300,6 +408,7 @@ class LLMSessionManager:
                 except Exception as e:
                     logger.error(f"⚠️ 发送用户转录到前端失败: {e}")
         
+        self._record_transcript(self.master_name, transcript.strip())
         # 缓存到session cache
         if hasattr(self, 'is_preparing_new_session') and self.is_preparing_new_session:
             if not hasattr(self, 'message_cache_for_new_session'):
@@ -308,12 +417,14 @@ class LLMSessionManager:
                 self.message_cache_for_new_session.append({"role": self.master_name, "text": transcript.strip()})
             elif self.message_cache_for_new_session[-1]['role'] == self.master_name:
                 self.message_cache_for_new_session[-1]['text'] += transcript.strip()
-        # 可选：推送用户活动
+        # 语音模式下speech_id在用户开始说话时（handle_interrupt）就已经更新
         async with self.lock:
-            self.current_speech_id = str(uuid4())
+            if self.current_speech_id is None:
+                self.current_speech_id = str(uuid4())
 
     async def handle_output_transcript(self, text: str, is_first_chunk: bool = False):
         """输出转录回调：处理文本显示和TTS（用于语音模式）"""        
+        self._speech_id_fresh = False
         # 无论是否使用TTS，都要发送文本到前端显示
         await self.send_lanlan_response(text, is_first_chunk)
         
@@ -325,6 +436,7 @@ class LLMSessionManager:
                     # TTS已就绪，直接发送
                     try:
                         self.tts_request_queue.put((self.current_speech_id, text))
+                        self.turn_latency.mark('first_tts_request')
                     except Exception as e:
                         logger.warning(f"⚠️ 发送TTS请求失败: {e}")
                 else:
@@ -345,6 +457,7 @@ class LLMSessionManager:
                 }
                 await self.websocket.send_json(message)
                 self.sync_message_queue.put({"type": "json", "data": message})
+                self._record_transcript(self.lanlan_name, text)
                 if hasattr(self, 'is_preparing_new_session') and self.is_preparing_new_session:
                     if not hasattr(self, 'message_cache_for_new_session'):
                         self.message_cache_for_new_session = []
@@ -360,6 +473,90 @@ class LLMSessionManager:
             logger.error(f"💥 WS Send Lanlan Response Error: {e}")
         
     async def handle_connection_error(self, message=None):
+        if self._can_resume(message):
+            if not self._is_resuming():
+                # 立即暂停发送麦克风音频，重连任务开始运行之前到达的音频也要进缓冲区
+                self._hold_mic()
+                self._resume_task = asyncio.create_task(self._resume_realtime_session(message))
+            return
+        if isinstance(self.session, OmniRealtimeClient) and self._is_fatal_error(message):
+            # 下次建连时先尝试其他服务商
+            self.realtime_failover.report_failure(self.core_api_type, message)
+        await self._report_connection_error(message)
+
+    @staticmethod
+    def _is_fatal_error(message):
+        text = (message or '').lower()
+        return any(h in text for h in RESUME_FATAL_HINTS) or RESUME_FATAL_STATUS.search(text) is not None
+
+    def _can_resume(self, message):
+        return isinstance(self.session, OmniRealtimeClient) and self.is_active and \
+            not self.is_hot_swap_imminent and not self._is_fatal_error(message)
+
+    def _is_resuming(self):
+        return self._resume_task is not None and not self._resume_task.done()
+
+    async def _resume_realtime_session(self, reason):
+        """
+        与服务商的连接意外断开：用原instructions加上最近对话重建session，替换掉断开的连接。
+        期间麦克风音频只进缓冲区，重连成功后重放；前端只收到 session_status 事件，不会结束会话。
+        """
+        old = self.session
+        logger.warning(f"🔌 Realtime连接断开，尝试重连: {reason}")
+        await self.send_session_status('reconnecting')
+        instructions = (old.instructions or self._base_prompt()) + self._convert_cache_to_str(self._session_transcript)
+        t0 = time.perf_counter()
+        deadline = t0 + MIC_HISTORY_MS / 1000
+        client = None
+        try:
+            for attempt in range(RESUME_MAX_ATTEMPTS):
+                if attempt:
+                    await asyncio.sleep(min(RESUME_BACKOFF_MAX, RESUME_BACKOFF_BASE * 2 ** (attempt - 1),
+                                            max(0.0, deadline - time.perf_counter())))
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                if self.session is not old or not self.is_active:
+                    return
+                try:
+                    client = await asyncio.wait_for(self._open_realtime_session(instructions),
+                                                    min(RESUME_CONNECT_TIMEOUT, remaining))
+                    break
+                except Exception as e:
+                    logger.warning(f"⚠️ 第 {attempt + 1} 次重连失败: {e}")
+            if client is None:
+                logger.error(f"💥 {(time.perf_counter() - t0) * 1000:.0f}ms 内未能重连，放弃当前session")
+                await self._report_connection_error(reason)
+                return
+            if self.session is not old or not self.is_active:
+                await client.close()
+                return
+
+            # 断线时可能正在后台准备热切换，待命的session基于旧连接的上下文，直接丢弃；最近对话已经写入新session的instructions
+            if self.is_preparing_new_session or self.pending_session:
+                logger.info("🔄 重连：放弃正在准备的热切换")
+            self._reset_preparation_state(clear_main_cache=True)
+            await self._cleanup_pending_session_resources()
+            await self._attach_turn_trackers(client)
+            self.session = client
+            self.session_start_time = datetime.now()
+            self._session_transcript.clear()
+            self.message_handler_task = asyncio.create_task(client.handle_messages())
+            await self._release_mic_hold(new_session=True)
+            await self.send_session_status('resumed')
+            logger.info(f"✅ Realtime连接已恢复，耗时 {(time.perf_counter() - t0) * 1000:.0f}ms")
+            try:
+                await old.close()
+            except Exception:
+                pass
+        except asyncio.CancelledError:
+            if client is not None and client is not self.session:
+                await client.close()
+            raise
+        finally:
+            await self._release_mic_hold()
+
+    async def _report_connection_error(self, message=None):
         if message:
             if '欠费' in message:
                 await self.send_status("💥 智谱API触发欠费bug。请考虑充值1元。")
@@ -400,6 +597,10 @@ class LLMSessionManager:
         self.session_start_time = None  # 记录当前 session 开始时间
         self.pending_session = None  # Managed by connector's __aexit__
         self.is_hot_swap_imminent = False
+        self._mic_history.clear()
+        self._mic_history_bytes = 0
+        self._mic_delivered_seq = self._mic_seq
+        self._mic_hold = False
 
     async def _flush_tts_pending_chunks(self):
         """将缓存的TTS文本chunk发送到TTS队列"""
@@ -414,6 +615,7 @@ class LLMSessionManager:
                 for speech_id, text in self.tts_pending_chunks:
                     try:
                         self.tts_request_queue.put((speech_id, text))
+                        self.turn_latency.mark('first_tts_request')
                     except Exception as e:
                         logger.error(f"💥 发送缓存的TTS请求失败: {e}")
                         break
@@ -468,6 +670,9 @@ class LLMSessionManager:
         
         # 标记正在启动
         self.is_starting_session = True
+        self._bringup_t0 = time.perf_counter()
+        self.bringup_timings = {}
+        self._late_memory = None
         
         logger.info(f"启动新session: input_mode={input_mode}, new={new}")
         self.websocket = websocket
@@ -515,8 +720,6 @@ class LLMSessionManager:
         # 如果检测到旧 session，先清理
         if self.is_active:
             await self.end_session(by_server=True)
-            # 等待一小段时间确保资源完全释放
-            await asyncio.sleep(0.5)
             logger.info("旧session清理完成")
         
         # 如果当前不需要TTS但TTS进程仍在运行，关闭它
@@ -533,52 +736,6 @@ class LLMSessionManager:
             finally:
                 self.tts_process = None
 
-        # new session时重置部分状态
-        if self.use_tts:
-            # 启动TTS子进程（如果配置了自定义语音）
-            # 文本模式和语音模式都需要TTS支持
-            if self.tts_process is None or not self.tts_process.is_alive():
-                # 使用工厂函数获取合适的 TTS worker
-                has_custom_voice = bool(self.voice_id)
-                tts_worker = get_tts_worker(
-                    core_api_type=self.core_api_type,
-                    has_custom_voice=has_custom_voice
-                )
-                
-                self.tts_request_queue = MPQueue() # TTS request (多进程队列)
-                self.tts_response_queue = MPQueue() # TTS response (多进程队列)
-                self.tts_process = Process(
-                    target=tts_worker,
-                    args=(self.tts_request_queue, self.tts_response_queue, self.audio_api_key if has_custom_voice else self.core_api_key, self.voice_id)
-                )
-                self.tts_process.daemon = True
-                self.tts_process.start()
-                
-                # 等待TTS进程完全启动（给进程一点启动时间）
-                await asyncio.sleep(0.1)
-                
-                # 记录使用的 TTS 类型
-                tts_type = "自定义音色(CosyVoice)" if has_custom_voice else f"{self.core_api_type}默认TTS"
-                logger.info(f"TTS进程已启动，使用: {tts_type}")
-            
-            # 确保旧的 TTS handler task 已经停止
-            if self.tts_handler_task and not self.tts_handler_task.done():
-                self.tts_handler_task.cancel()
-                try:
-                    await asyncio.wait_for(self.tts_handler_task, timeout=1.0)
-                except (asyncio.CancelledError, asyncio.TimeoutError):
-                    pass
-            
-            # 启动新的 TTS handler task
-            self.tts_handler_task = asyncio.create_task(self.tts_response_handler())
-            
-            # 标记TTS为就绪状态并处理可能已缓存的chunk
-            async with self.tts_cache_lock:
-                self.tts_ready = True
-            
-            # 处理在TTS启动期间可能已经缓存的文本chunk
-            await self._flush_tts_pending_chunks()
-
         if new:
             self.message_cache_for_new_session = []
             self.last_time = None
@@ -590,16 +747,28 @@ class LLMSessionManager:
                 self.pending_input_data.clear()
 
         try:
-            # 获取初始 prompt
-            initial_prompt = (f"你是一个角色扮演大师，并且精通电脑操作。请按要求扮演以下角色（{self.lanlan_name}），并在对方请求时、回答'我试试'并尝试操纵电脑。" if self._is_agent_enabled() else f"你是一个角色扮演大师。请按要求扮演以下角色（{self.lanlan_name}）。") + self.lanlan_prompt
-            initial_prompt += requests.get(f"http://localhost:{self.memory_server_port}/new_dialog/{self.lanlan_name}").text
-            # logger.info("====Initial Prompt=====")
-            # logger.info(initial_prompt)
+            # 并行启动：获取记忆prompt、启动TTS进程、与服务商建立连接（或取用预热连接）互不依赖
+            bringup = {'prompt': asyncio.create_task(self._fetch_initial_prompt())}
+            if self.use_tts:
+                bringup['tts'] = asyncio.create_task(self._start_tts())
+            if input_mode != 'text':
+                bringup['client'] = asyncio.create_task(self._acquire_realtime_client())
+            try:
+                await asyncio.gather(*bringup.values())
+            except BaseException:
+                for task in bringup.values():
+                    task.cancel()
+                client_task = bringup.get('client')
+                if client_task and client_task.done() and not client_task.cancelled() and client_task.exception() is None:
+                    await client_task.result().close()
+                raise
+            initial_prompt = bringup['prompt'].result()
 
             # 根据input_mode创建不同的session
             if input_mode == 'text':
                 # 文本模式：使用 OmniOfflineClient with OpenAI-compatible API
-                self.session = OmniOfflineClient(
+                self.session = None
+                session = OmniOfflineClient(
                     base_url=self.openrouter_url,
                     api_key=self.openrouter_api_key,
                     model=self.text_model,
@@ -610,24 +779,24 @@ class LLMSessionManager:
                     on_connection_error=self.handle_connection_error,
                     on_response_done=self.handle_response_complete
                 )
+                await session.connect(initial_prompt, native_audio = not self.use_tts)
+                self.session = session
             else:
-                # 语音模式：使用 OmniRealtimeClient
-                self.session = OmniRealtimeClient(
-                    base_url=self.core_url,
-                    api_key=self.core_api_key,
-                    model=self.model,
-                    on_text_delta=self.handle_text_data,
-                    on_audio_delta=self.handle_audio_data,
-                    on_new_message=self.handle_new_message,
-                    on_input_transcript=self.handle_input_transcript,
-                    on_output_transcript=self.handle_output_transcript,
-                    on_connection_error=self.handle_connection_error,
-                    on_response_done=self.handle_response_complete
-                )
+                # 语音模式：连接已经就绪，只需要用最新的prompt配置
+                client = bringup['client'].result()
+                try:
+                    await self._configure_realtime_client(client, initial_prompt)
+                except BaseException:
+                    await client.close()
+                    raise
+                await self._attach_turn_trackers(client)
+                self.session = client
+                self._reset_transcript()
+                self._mic_gate.reset()
+            self._mark_bringup('session_configured')
 
             # 标记 session 激活
             if self.session:
-                await self.session.connect(initial_prompt, native_audio = not self.use_tts)
                 async with self.lock:
                     self.is_active = True
                     
@@ -642,6 +811,8 @@ class LLMSessionManager:
                 
                 # 通知前端 session 已成功启动
                 await self.send_session_started(input_mode)
+                self._mark_bringup('session_started')
+                logger.info(f"⏱️ Session启动耗时: {self.bringup_timings}")
                 
                 # 标记session为就绪状态并处理可能已缓存的输入数据
                 async with self.input_cache_lock:
@@ -649,6 +820,11 @@ class LLMSessionManager:
                 
                 # 处理在session启动期间可能已经缓存的输入数据
                 await self._flush_pending_input_data()
+
+                # 以本地上下文启动的session，在最新记忆到达后补充注入
+                if self._late_memory:
+                    asyncio.create_task(self._inject_late_memory(self.session, *self._late_memory))
+                    self._late_memory = None
             else:
                 raise Exception("Session not initialized")
         
@@ -671,7 +847,10 @@ class LLMSessionManager:
             
             # 检查是否是memory_server连接错误（端口48912）
             error_str = str(e)
-            if 'WinError 10061' in error_str or 'WinError 10054' in error_str:
+            if isinstance(e, httpx.TransportError):
+                # 只有获取记忆prompt时使用httpx
+                await self.send_status(f"💥 记忆服务器(端口{self.memory_server_port})已崩溃。请检查API设置是否正确。")
+            elif 'WinError 10061' in error_str or 'WinError 10054' in error_str:
                 # 检查端口号是否为48912
                 if str(self.memory_server_port) in error_str or '48912' in error_str:
                     await self.send_status(f"💥 记忆服务器(端口{self.memory_server_port})已崩溃。请检查API设置是否正确。")
@@ -702,6 +881,18 @@ class LLMSessionManager:
         except Exception as e:
             logger.error(f"💥 WS Send User Activity Error: {e}")
 
+    def _record_transcript(self, role, text):
+        """记录当前session的instructions之外的对话，连续同一角色的内容合并为一条"""
+        if self._session_transcript and self._session_transcript[-1]['role'] == role:
+            self._session_transcript[-1]['text'] += text
+        else:
+            self._session_transcript.append({'role': role, 'text': text})
+
+    def _reset_transcript(self, cache=()):
+        """session的instructions刚重建过，只保留其中没有包含的对话（复制，避免与message_cache共享条目）"""
+        self._session_transcript.clear()
+        self._session_transcript.extend({'role': m['role'], 'text': m['text']} for m in cache)
+
     def _convert_cache_to_str(self, cache):
         """[热切换相关] 将cache转换为字符串"""
         res = ""
@@ -709,6 +900,203 @@ class LLMSessionManager:
             res += f"{i['role']} | {i['text']}\n"
         return res
 
+    def _realtime_callbacks(self):
+        return dict(
+            on_text_delta=self.handle_text_data,
+            on_audio_delta=self.handle_audio_data,
+            on_new_message=self.handle_new_message,
+            on_interrupt=self.handle_interrupt,
+            on_input_transcript=self.handle_input_transcript,
+            on_output_transcript=self.handle_output_transcript,
+            on_connection_error=self.handle_connection_error,
+            on_response_done=self.handle_response_complete
+        )
+
+    def _base_prompt(self):
+        return (f"你是一个角色扮演大师，并且精通电脑操作。请按要求扮演以下角色（{self.lanlan_name}），并在对方请求时、回答'我试试'并尝试操纵电脑。" if self._is_agent_enabled() else f"你是一个角色扮演大师。请按要求扮演以下角色（{self.lanlan_name}）。") + self.lanlan_prompt
+
+    async def _fetch_memory_context(self):
+        """从memory_server获取近期记忆，成功后保存到本地作为下次启动的预热上下文"""
+        async with httpx.AsyncClient(timeout=MEMORY_CONTEXT_TIMEOUT) as client:
+            resp = await client.get(f"http://localhost:{self.memory_server_port}/new_dialog/{self.lanlan_name}")
+            resp.raise_for_status()
+        context = resp.text
+        await asyncio.get_running_loop().run_in_executor(None, save_warm_context, self.lanlan_name, context)
+        return context
+
+    async def _fetch_memory_context_or_warm(self):
+        """
+        获取近期记忆，返回 (context, late_fetch_task)
+        memory_server 在 MEMORY_CONTEXT_DEADLINE 内没有返回（或出错）时，改用本地保存的上一次上下文；
+        超时的情况下 late_fetch_task 是仍在进行的获取任务，最新记忆到达后由 _inject_late_memory 注入
+        """
+        fetch_task = asyncio.create_task(self._fetch_memory_context())
+        warm_context = await asyncio.get_running_loop().run_in_executor(None, load_warm_context, self.lanlan_name)
+        if warm_context is not None:
+            done, _ = await asyncio.wait({fetch_task}, timeout=MEMORY_CONTEXT_DEADLINE)
+            if done and fetch_task.exception() is not None:
+                logger.warning(f"⚠️ 获取记忆失败，使用本地保存的上下文: {fetch_task.exception()}")
+                return warm_context, None
+            if not done:
+                logger.info(f"⏱️ memory_server {MEMORY_CONTEXT_DEADLINE}s 内未返回，先使用本地保存的上下文")
+                return warm_context, fetch_task
+        return await fetch_task, None
+
+    async def _fetch_initial_prompt(self):
+        """
+        构造初始prompt：角色设定 + memory_server 提供的近期记忆
+        memory_server 较慢或出错时使用本地保存的上一次上下文，见 _fetch_memory_context_or_warm
+        """
+        initial_prompt = self._base_prompt()
+        context, late_fetch = await self._fetch_memory_context_or_warm()
+        if late_fetch is not None:
+            self._late_memory = (late_fetch, initial_prompt, context)
+        self._mark_bringup('memory_fetched')
+        return initial_prompt + context
+
+    async def _inject_late_memory(self, session, fetch_task, base_prompt, warm_context, suffix=''):
+        """用最新记忆替换session启动时使用的本地上下文；suffix 是instructions中记忆之后的部分"""
+        try:
+            context = await fetch_task
+        except Exception as e:
+            logger.warning(f"⚠️ 获取最新记忆失败，本次session继续使用本地上下文: {e}")
+            return
+        # 热切换准备的session在切换前也可以注入
+        if context == warm_context or session not in (self.session, self.pending_session) or not self.is_active:
+            return
+        instructions = base_prompt + context + suffix
+        try:
+            if isinstance(session, OmniRealtimeClient):
+                await self._configure_realtime_client(session, instructions)
+            else:
+                await session.update_session({"instructions": instructions})
+            logger.info("✅ 最新记忆已注入当前session")
+        except Exception as e:
+            logger.warning(f"⚠️ 注入最新记忆失败: {e}")
+
+    async def _start_tts(self):
+        """启动TTS子进程（如未运行）和TTS响应处理任务"""
+        # 启动TTS子进程（如果配置了自定义语音）
+        # 文本模式和语音模式都需要TTS支持
+        if self.tts_process is None or not self.tts_process.is_alive():
+            # 使用工厂函数获取合适的 TTS worker
+            has_custom_voice = bool(self.voice_id)
+            tts_worker = get_tts_worker(
+                core_api_type=self.core_api_type,
+                has_custom_voice=has_custom_voice
+            )
+            
+            self.tts_request_queue = MPQueue() # TTS request (多进程队列)
+            self.tts_response_queue = MPQueue() # TTS response (多进程队列)
+            self.tts_process = Process(
+                target=tts_worker,
+                args=(self.tts_request_queue, self.tts_response_queue, self.audio_api_key if has_custom_voice else self.core_api_key, self.voice_id)
+            )
+            self.tts_process.daemon = True
+            # 启动子进程（Windows下spawn较慢）放到线程池，不阻塞事件循环
+            await asyncio.get_running_loop().run_in_executor(None, self.tts_process.start)
+            
+            # 记录使用的 TTS 类型
+            tts_type = "自定义音色(CosyVoice)" if has_custom_voice else f"{self.core_api_type}默认TTS"
+            logger.info(f"TTS进程已启动，使用: {tts_type}")
+        
+        # 确保旧的 TTS handler task 已经停止
+        if self.tts_handler_task and not self.tts_handler_task.done():
+            self.tts_handler_task.cancel()
+            try:
+                await asyncio.wait_for(self.tts_handler_task, timeout=1.0)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                pass
+        
+        # 启动新的 TTS handler task
+        self.tts_handler_task = asyncio.create_task(self.tts_response_handler())
+        
+        # 标记TTS为就绪状态并处理可能已缓存的chunk
+        async with self.tts_cache_lock:
+            self.tts_ready = True
+        
+        # 处理在TTS启动期间可能已经缓存的文本chunk
+        await self._flush_tts_pending_chunks()
+        self._mark_bringup('tts_ready')
+
+    def _realtime_providers(self):
+        """主服务商在前，其后是 core_config 中配置的备用服务商"""
+        core_config = get_core_config()
+        primary = {'type': core_config['CORE_API_TYPE'], 'url': core_config['CORE_URL'],
+                   'model': core_config['CORE_MODEL'], 'api_key': core_config['CORE_API_KEY']}
+        return [primary] + core_config['CORE_FALLBACKS']
+
+    def _use_realtime_provider(self, provider):
+        self.core_api_type = provider['type']
+        self.core_url = provider['url']
+        self.model = provider['model']
+        self.core_api_key = provider['api_key']
+
+    async def _connect_realtime_provider(self, provider):
+        client = OmniRealtimeClient(
+            base_url=provider['url'],
+            api_key=provider['api_key'],
+            model=provider['model'],
+            **self._realtime_callbacks()
+        )
+        try:
+            await client.open()
+        except BaseException:
+            await client.close()
+            raise
+        return client
+
+    async def _acquire_realtime_client(self):
+        """
+        取用预热的备用连接，没有时冷启动一个新连接（尚未配置instructions）
+        配置了备用服务商时错峰连接，最先连上的胜出，self.model 等随之切换到胜出的服务商
+        """
+        providers = self._realtime_providers()
+        self._use_realtime_provider(self.realtime_failover.order(providers)[0])
+        client = self.standby_pool.acquire(self.core_url, self.core_api_key, self.model, not self.use_tts)
+        if client is None:
+            provider, client = await self.realtime_failover.connect(providers, self._connect_realtime_provider)
+            self._use_realtime_provider(provider)
+        else:
+            client.set_callbacks(**self._realtime_callbacks())
+        self._mark_bringup('provider_connected')
+        return client
+
+    async def _configure_realtime_client(self, client, instructions):
+        """instructions或音频模式与连接当前配置不同时发送 session.update，并让备用池按最新配置补充连接"""
+        native_audio = not self.use_tts
+        if client.instructions != instructions or client.native_audio != native_audio:
+            await client.configure(instructions, native_audio)
+        self.standby_pool.update(self.core_url, self.core_api_key, self.model, instructions, native_audio)
+
+    async def _open_realtime_session(self, instructions):
+        """返回已配置好的 OmniRealtimeClient"""
+        client = await self._acquire_realtime_client()
+        try:
+            await self._configure_realtime_client(client, instructions)
+        except BaseException:
+            await client.close()
+            raise
+        return client
+
+    async def _attach_turn_trackers(self, client):
+        """让即将成为当前session的连接记录回合延迟，并沿用已经学到的说话结束判定参数"""
+        client.latency = self.turn_latency
+        # 故障切换后新连接可能来自另一家服务商，静音抑制的拖尾按连接实际使用的VAD设置
+        self._mic_gate.hangover_ms = SEMANTIC_VAD_GATE_HANGOVER_MS if 'gpt' in client.model else GATE_HANGOVER_MS
+        client.turn_tuner = self.turn_tuner
+        silence_ms = self.turn_tuner.applied_ms
+        if silence_ms != client.silence_duration_ms:
+            try:
+                await client.update_turn_detection(silence_ms)
+            except Exception as e:
+                logger.warning(f"⚠️ 同步说话结束判定参数失败: {e}")
+
+    def _mark_bringup(self, phase):
+        """记录session启动各阶段距离点击开始的耗时（毫秒）"""
+        if self._bringup_t0 is not None and phase not in self.bringup_timings:
+            self.bringup_timings[phase] = round((time.perf_counter() - self._bringup_t0) * 1000)
+
     def _is_agent_enabled(self):
         return self.agent_flags['agent_enabled'] and (self.agent_flags['computer_use_enabled'] or self.agent_flags['mcp_enabled'])
 
@@ -730,27 +1118,15 @@ class LLMSessionManager:
             self.audio_api_key = core_config['AUDIO_API_KEY']
             logger.info(f"🔄 热切换准备: 已重新加载配置")
             
-            # 创建新的pending session
-            self.pending_session = OmniRealtimeClient(
-                base_url=self.core_url,
-                api_key=self.core_api_key,
-                model=self.model,
-                on_text_delta=self.handle_text_data,
-                on_audio_delta=self.handle_audio_data,
-                on_new_message=self.handle_new_message,
-                on_input_transcript=self.handle_input_transcript,
-                on_output_transcript=self.handle_output_transcript,
-                on_connection_error=self.handle_connection_error,
-                on_response_done=self.handle_response_complete
-            )
-            
-            initial_prompt = (f"你是一个角色扮演大师，并且精通电脑操作。请按要求扮演以下角色（{self.lanlan_name}），在对方请求时、回答“我试试”并尝试操纵电脑。" if self._is_agent_enabled() else f"你是一个角色扮演大师。请按要求扮演以下角色（{self.lanlan_name}）。") + self.lanlan_prompt
+            base_prompt = self._base_prompt()
+            # 写入instructions的对话与快照长度一起确定，之后新增的部分在最终切换时作为增量发送
             self.initial_cache_snapshot_len = len(self.message_cache_for_new_session)
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(f"http://localhost:{self.memory_server_port}/new_dialog/{self.lanlan_name}")
-                initial_prompt += resp.text + self._convert_cache_to_str(self.message_cache_for_new_session)
-            # print(initial_prompt)
-            await self.pending_session.connect(initial_prompt, native_audio = not self.use_tts)
+            cache_prompt = self._convert_cache_to_str(self.message_cache_for_new_session)
+            context, late_fetch = await self._fetch_memory_context_or_warm()
+            # 创建新的pending session，优先取用预热的备用连接
+            self.pending_session = await self._open_realtime_session(base_prompt + context + cache_prompt)
+            if late_fetch is not None:
+                asyncio.create_task(self._inject_late_memory(self.pending_session, late_fetch, base_prompt, context, cache_prompt))
 
             # 4. Start temporary listener for PENDING session's *first* ignored response
             #    and wait for it to complete.
@@ -771,6 +1147,45 @@ class LLMSessionManager:
             if self.background_preparation_task and self.background_preparation_task.done():
                 self.background_preparation_task = None
 
+    async def _refresh_session_in_place(self, trim=True):
+        """
+        [热切换的替代方案] 在现有连接上刷新上下文：
+        用memory_server整理后的最新记忆更新instructions，再删除开始准备之前的对话条目（它们已经被总结进记忆），
+        之后的对话条目保留在服务端，不需要像热切换那样重放 message_cache_for_new_session
+        :param trim: False 时只更新instructions并注入额外提示，不删除对话条目
+        """
+        session = self.session
+        cutoff = self.summary_triggered_time.timestamp()
+        try:
+            instructions = self._base_prompt() + await self._fetch_memory_context()
+            if session is not self.session or not self.is_active:
+                return
+            await self._configure_realtime_client(session, instructions)
+            deleted = await session.delete_items_before(cutoff) if trim else 0
+            if trim:
+                # 上下文已经被裁剪，用量从头统计；保留的只有开始准备之后的对话
+                session.reset_usage()
+                self._reset_transcript(self.message_cache_for_new_session)
+
+            if self.pending_extra_replies:
+                items = "\n".join([f"- {txt}" for txt in self.pending_extra_replies if isinstance(txt, str) and txt.strip()])
+                self.pending_extra_replies.clear()
+                await session.create_response(
+                    "SYSTEM_MESSAGE | [注入指令] 请用简洁自然的一段话汇报和解释你先前执行的任务的结果，简要说明你做了什么：\n"
+                    + items + "\n完成上述汇报后，恢复正常的对话节奏。", skipped=False)
+
+            self.session_start_time = datetime.now()
+            # 当前任务就是 background_preparation_task，先解除引用，避免被 _reset_preparation_state 取消
+            self.background_preparation_task = None
+            self._reset_preparation_state(clear_main_cache=True)
+            logger.info(f"In-place Refresh: 已更新instructions并删除 {deleted} 条旧对话条目")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 原地刷新失败时，下一轮结束后改用热切换
+            logger.warning(f"⚠️ In-place Refresh: 失败，改用热切换: {e}")
+            session.supports_in_place_refresh = False
+
     async def _trigger_immediate_preparation_for_extra(self):
         """当需要注入额外提示时，如果当前未进入准备流程，立即开始准备并安排renew逻辑。"""
         try:
@@ -780,6 +1195,11 @@ class LLMSessionManager:
                 self.summary_triggered_time = datetime.now()
                 self.message_cache_for_new_session = []
                 self.initial_cache_snapshot_len = 0
+                if isinstance(self.session, OmniRealtimeClient) and self.session.supports_in_place_refresh:
+                    # 原地刷新：只注入提示，不删除对话条目（这些对话还没有被整理进记忆）
+                    if not self.background_preparation_task or self.background_preparation_task.done():
+                        self.background_preparation_task = asyncio.create_task(self._refresh_session_in_place(trim=False))
+                    return
                 # 立即启动后台预热，不等待10秒
                 self.pending_session_warmed_up_event = asyncio.Event()
                 if not self.background_preparation_task or self.background_preparation_task.done():
@@ -805,6 +1225,8 @@ class LLMSessionManager:
             self.is_hot_swap_imminent = False
             return
 
+        # 从这里开始，麦克风音频只进缓冲区，切换完成后重放给新session
+        self._hold_mic()
         try:
             incremental_cache = self.message_cache_for_new_session[self.initial_cache_snapshot_len:]
             # 1. Send incremental cache (or a heartbeat) to PENDING session for its *second* ignored response
@@ -858,7 +1280,11 @@ class LLMSessionManager:
             # 执行session切换
             logger.info("Final Swap Sequence: Swapping sessions...")
             self.session = self.pending_session
+            await self._attach_turn_trackers(self.session)
+            # 增量部分是作为对话消息发给新session的，不在instructions中
+            self._reset_transcript(incremental_cache)
             self.session_start_time = datetime.now()
+            await self._release_mic_hold(new_session=True)
 
             # Start the main listener for the NEWLY PROMOTED self.session
             if self.session and hasattr(self.session, 'handle_messages'):
@@ -900,6 +1326,8 @@ class LLMSessionManager:
             if self.is_active and self.session and hasattr(self.session, 'handle_messages') and (not self.message_handler_task or self.message_handler_task.done()):
                 self.message_handler_task = asyncio.create_task(self.session.handle_messages())
         finally:
+            # 切换失败时，把暂停期间的音频补发给仍在使用的旧session
+            await self._release_mic_hold()
             self.is_hot_swap_imminent = False  # Always reset this flag
             if self.final_swap_task and self.final_swap_task.done():
                 self.final_swap_task = None
@@ -948,6 +1376,78 @@ class LLMSessionManager:
         # Session已就绪，直接处理
         await self._process_stream_data_internal(message)
     
+    def _prepare_mic_pcm(self, message: dict) -> bytes:
+        """检查二进制麦克风帧的序号，非16kHz时重采样到Core API要求的16kHz"""
+        seq = message.get("seq")
+        if seq is not None:
+            if self._mic_last_seq is not None and seq != self._mic_last_seq + 1 and seq != 0:
+                logger.debug(f"麦克风音频帧序号不连续: {self._mic_last_seq} -> {seq}")
+            self._mic_last_seq = seq
+        data = message["data"]
+        sample_rate = message.get("sample_rate") or 16000
+        if sample_rate == 16000:
+            return data
+        if self._mic_resampler is None or self._mic_resampler.orig_sr != sample_rate:
+            self._mic_resampler = StreamingResampler(sample_rate, 16000)
+        return self._mic_resampler.process_bytes(data)
+
+    def _remember_mic(self, seq, pcm):
+        self._mic_history.append((seq, pcm))
+        self._mic_history_bytes += len(pcm)
+        while self._mic_history_bytes > MIC_HISTORY_MS * _MIC_BYTES_PER_MS and len(self._mic_history) > 1:
+            old_seq, old_pcm = self._mic_history.popleft()
+            self._mic_history_bytes -= len(old_pcm)
+            if self._mic_hold and old_seq > self._mic_delivered_seq:
+                logger.warning(f"⚠️ 热切换耗时过长，丢弃了 {len(old_pcm) // _MIC_BYTES_PER_MS}ms 麦克风音频")
+
+    async def _stream_mic_audio(self, pcm):
+        """向当前session发送一块16kHz PCM，同时记入最近音频缓冲区；热切换最后一步期间只缓冲不发送"""
+        async with self._mic_lock:
+            self._mic_seq += 1
+            self._remember_mic(self._mic_seq, pcm)
+            if self._mic_hold:
+                return
+            await self.session.stream_audio(pcm)
+            self._mic_delivered_seq = self._mic_seq
+
+    def _hold_mic(self):
+        """[热切换相关] 暂停向旧session发送麦克风音频"""
+        self._mic_hold = True
+        self._mic_hold_seq = self._mic_seq
+
+    async def _release_mic_hold(self, new_session=False, preroll_ms=MIC_SWAP_PREROLL_MS):
+        """
+        [热切换相关] 恢复发送麦克风音频，并按序号重放当前session尚未收到的部分
+        :param new_session: True 表示session刚被替换，从旧session最后收到的音频之前 preroll_ms 处开始重放
+        """
+        async with self._mic_lock:
+            if not self._mic_hold:
+                return
+            self._mic_hold = False
+            if new_session:
+                # 断线时暂停点之前的几块可能发送失败，以实际送达的位置为准
+                anchor = min(self._mic_hold_seq, self._mic_delivered_seq)
+                start_seq, preroll = anchor, 0
+                for seq, pcm in reversed(self._mic_history):
+                    if seq > anchor:
+                        continue
+                    if preroll >= preroll_ms * _MIC_BYTES_PER_MS:
+                        break
+                    start_seq, preroll = seq - 1, preroll + len(pcm)
+            else:
+                start_seq = self._mic_delivered_seq
+            replay = [(seq, pcm) for seq, pcm in self._mic_history if seq > start_seq]
+            self._mic_delivered_seq = self._mic_seq
+            if not replay or not isinstance(self.session, OmniRealtimeClient):
+                return
+            try:
+                for seq, pcm in replay:
+                    await self.session.stream_audio(pcm)
+                logger.info(f"🎙️ 已向session重放 {sum(len(p) for _, p in replay) // _MIC_BYTES_PER_MS}ms 麦克风音频 "
+                            f"(序号 {replay[0][0]}-{replay[-1][0]})")
+            except Exception as e:
+                logger.warning(f"⚠️ 重放麦克风音频失败: {e}")
+
     async def _process_stream_data_internal(self, message: dict):
         """内部方法：实际处理stream_data的逻辑"""
         data = message.get("data")
@@ -1025,11 +1525,9 @@ class LLMSessionManager:
                 
                 # 文本模式：直接发送文本
                 if isinstance(data, str):
-                    # 为每次文本输入生成新的speech_id（用于TTS和lipsync）
-                    async with self.lock:
-                        self.current_speech_id = str(uuid4())
-
-                    await self.send_user_activity()
+                    # 为每次文本输入生成新的speech_id（用于TTS和lipsync），并打断正在播放的语音
+                    await self.handle_interrupt()
+                    self.turn_latency.start_turn()
                     await self.session.stream_text(data)
                 else:
                     logger.error(f"💥 Stream: Invalid text data type: {type(data)}")
@@ -1061,9 +1559,15 @@ class LLMSessionManager:
                     logger.error("💥 Stream: Session websocket not available")
                     return
                 try:
-                    if isinstance(data, list):
-                        audio_bytes = struct.pack(f'<{len(data)}h', *data)
-                        await self.session.stream_audio(audio_bytes)
+                    if isinstance(data, (bytes, bytearray, memoryview)):
+                        # 二进制帧：已经是PCM16LE，经过静音抑制后透传
+                        pcm = self._mic_gate.process(self._prepare_mic_pcm(message))
+                        if pcm:
+                            await self._stream_mic_audio(pcm)
+                    elif isinstance(data, list):
+                        audio_bytes = self._mic_gate.process(struct.pack(f'<{len(data)}h', *data))
+                        if audio_bytes:
+                            await self._stream_mic_audio(audio_bytes)
                     else:
                         logger.error(f"💥 Stream: Invalid audio data type: {type(data)}")
                         return
@@ -1102,6 +1606,9 @@ class LLMSessionManager:
                         
                         # 如果是语音模式（OmniRealtimeClient），检查是否支持视觉并直接发送
                         elif isinstance(self.session, OmniRealtimeClient):
+                            # 重连期间丢弃画面，恢复后前端会继续发送新的画面
+                            if self._is_resuming():
+                                return
                             # 检查WebSocket连接
                             if not hasattr(self.session, 'ws') or not self.session.ws:
                                 logger.error("💥 Stream: Session websocket not available")
@@ -1141,6 +1648,16 @@ class LLMSessionManager:
                 return
 
         logger.info("End Session: Starting cleanup...")
+        # 重连失败时由重连任务自己调用到这里，不能取消自己
+        if self._is_resuming() and self._resume_task is not asyncio.current_task():
+            self._resume_task.cancel()
+        self._resume_task = None
+        gate_stats = self._mic_gate.stats()
+        if gate_stats['input_seconds']:
+            logger.info(f"🎙️ 静音抑制：输入 {gate_stats['input_seconds']:.1f}s，发送 {gate_stats['sent_seconds']:.1f}s"
+                        f"（抑制 {gate_stats['suppressed_ratio']:.0%}，保活 {gate_stats['keepalives']} 次）")
+        if self.turn_tuner.turns:
+            logger.info(f"🎙️ 说话结束判定: {self.turn_tuner.stats()}")
         self.sync_message_queue.put({'type': 'system', 'data': 'session end'})
         async with self.lock:
             self.is_active = False
@@ -1218,6 +1735,7 @@ class LLMSessionManager:
 
     async def cleanup(self):
         await self.end_session(by_server=True)
+        await self.standby_pool.close()
         # 清理websocket引用，防止保留失效的连接
         self.websocket = None
 
@@ -1234,6 +1752,15 @@ class LLMSessionManager:
         except Exception as e:
             logger.error(f"💥 WS Send Status Error: {e}")
     
+    async def send_session_status(self, status: str): # 通知前端与服务商的连接状态（reconnecting / resumed）
+        try:
+            if self.websocket and hasattr(self.websocket, 'client_state') and self.websocket.client_state == self.websocket.client_state.CONNECTED:
+                await self.websocket.send_json({"type": "session_status", "status": status})
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.error(f"💥 WS Send Session Status Error: {e}")
+
     async def send_session_started(self, input_mode: str): # 通知前端session已启动
         try:
             if self.websocket and hasattr(self.websocket, 'client_state') and self.websocket.client_state == self.websocket.client_state.CONNECTED:
@@ -1288,13 +1815,18 @@ class LLMSessionManager:
             logger.error(f"💥 WS Send Response Error: {e}")
 
 
-    async def send_speech(self, tts_audio):
+    async def send_speech(self, tts_audio, speech_id=None):
         try:
             if self.websocket and hasattr(self.websocket, 'client_state') and self.websocket.client_state == self.websocket.client_state.CONNECTED:
                 await self.websocket.send_bytes(tts_audio)
-
-                # 同步到同步服务器
-                self.sync_message_queue.put({"type": "binary", "data": tts_audio})
+                self.turn_latency.mark('first_ws_send')
+                if self._bringup_t0 is not None:
+                    self._mark_bringup('first_audio')
+                    logger.info(f"⏱️ 从开始会话到首次出声: {self.bringup_timings['first_audio']}ms {self.bringup_timings}")
+                    self._bringup_t0 = None
+
+                # 同步到同步服务器，带上speech_id供同步连接器和monitor丢弃被打断的音频
+                self.sync_message_queue.put({"type": "binary", "data": tts_audio, "speech_id": speech_id})
         except WebSocketDisconnect:
             pass
         except Exception as e:
@@ -1303,7 +1835,12 @@ class LLMSessionManager:
     async def tts_response_handler(self):
         while True:
             while not self.tts_response_queue.empty():
-                data = self.tts_response_queue.get_nowait()
-                await self.send_speech(data)
+                speech_id, data = self.tts_response_queue.get_nowait()
+                if speech_id != self.current_speech_id:
+                    # 属于已被打断的回复
+                    self.tts_frames_dropped += 1
+                    continue
+                self.turn_latency.mark('first_tts_audio')
+                await self.send_speech(data, speech_id)
             await asyncio.sleep(0.01)
 
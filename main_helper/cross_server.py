@@ -18,11 +18,16 @@ from datetime import datetime
 import json
 import requests
 import re
+from uuid import uuid4
+from collections import deque
+from utils.audio import pack_sync_audio
 from utils.frontend_utils import contains_chinese, replace_blank, replace_corner_mark, remove_bracket, spell_out_number, \
     is_only_punctuation, split_paragraph
 
 # Setup logger for this module
 logger = logging.getLogger(__name__)
+# finalize因上传失败或memory_server不可达而推迟后，至少间隔这么久再重发（秒）
+FINALIZE_RETRY_SECONDS = 10.0
 emoji_pattern = re.compile(r'[^\w\u4e00-\u9fff\s>][^\w\u4e00-\u9fff\s]{2,}[^\w\u4e00-\u9fff\s<]', flags=re.UNICODE)
 emoji_pattern2 = re.compile("["
         u"\U0001F600-\U0001F64F"  # emoticons
@@ -88,6 +93,125 @@ def sync_connector_process(message_queue, shutdown_event, lanlan_name, sync_serv
         current_turn = 'user'
         last_screen = None
 
+        # 语音代际：每次用户打断时加一，随音频帧一起发给monitor
+        audio_generation = 0
+        interrupted_speech_ids = deque(maxlen=32)
+
+        # 逐轮流式上传到memory_server，session结束时只需发送一个finalize
+        memory_session = None
+        ingest_session_id = str(uuid4())
+        ingest_seq = 0
+        ingest_outbox = []  # 尚未被memory_server确认的轮次
+        ingest_lock = asyncio.Lock()
+        ingest_task = None
+        ingest_retry_at = 0.0
+        deferred_finalize = []  # 推迟的finalize: [(session_id, mode)]，上传队列清空后重发
+        finalize_task = None
+        finalize_retry_at = 0.0
+
+        def record_turn(entry):
+            """记录一轮完整的消息，并放入待上传队列"""
+            nonlocal ingest_seq
+            chat_history.append(entry)
+            ingest_seq += 1
+            ingest_outbox.append({
+                'session_id': ingest_session_id,
+                'seq': ingest_seq,
+                'key': f"{ingest_session_id}:{ingest_seq}",
+                **entry
+            })
+            schedule_ingest_flush(force=True)
+
+        async def flush_ingest():
+            """把待上传队列以NDJSON发送到 /ingest，成功后从队列中移除"""
+            nonlocal memory_session, ingest_retry_at
+            async with ingest_lock:
+                if not ingest_outbox:
+                    return True
+                batch = list(ingest_outbox)
+                body = ''.join(json.dumps(turn, ensure_ascii=False) + '\n' for turn in batch)
+                try:
+                    if memory_session is None or memory_session.closed:
+                        memory_session = aiohttp.ClientSession()
+                    async with memory_session.post(
+                        f"http://localhost:{MEMORY_SERVER_PORT}/ingest/{lanlan_name}",
+                        data=body.encode('utf-8'),
+                        headers={'Content-Type': 'application/x-ndjson'},
+                        timeout=aiohttp.ClientTimeout(total=5.0)
+                    ) as resp:
+                        result = await resp.json()
+                    if result.get('status') != 'ok':
+                        raise Exception(result.get('message', result))
+                    del ingest_outbox[:len(batch)]
+                    return True
+                except Exception as e:
+                    ingest_retry_at = time.time() + 2.0
+                    logger.warning(f"[{lanlan_name}] 上传对话轮次到 memory_server 失败，稍后重试: {e}")
+                    return False
+
+        def schedule_ingest_flush(force=False):
+            nonlocal ingest_task
+            if not ingest_outbox or (ingest_task and not ingest_task.done()):
+                return
+            if not force and time.time() < ingest_retry_at:
+                return
+            ingest_task = asyncio.create_task(flush_ingest())
+
+        async def finalize_ingest(session_id, mode):
+            """确认该session的轮次都已上传后，通知memory_server进行总结处理"""
+            nonlocal memory_session
+            if not await flush_ingest():
+                # 未上传的轮次留在队列中继续重试，上传完成后再重发finalize
+                defer_finalize(session_id, mode, "对话轮次未能全部上传")
+                return
+            try:
+                if memory_session is None or memory_session.closed:
+                    memory_session = aiohttp.ClientSession()
+                async with memory_session.post(
+                    f"http://localhost:{MEMORY_SERVER_PORT}/finalize/{lanlan_name}",
+                    json={'session_id': session_id, 'mode': mode},
+                    timeout=aiohttp.ClientTimeout(total=60.0)
+                ) as resp:
+                    result = await resp.json()
+                if result.get('status') == 'error':
+                    # 处理失败的session保留在memory_server的日志中，由定期清扫重试
+                    logger.error(f"[{lanlan_name}] 记忆处理失败({mode}): {result.get('message')}")
+                else:
+                    logger.info(f"[{lanlan_name}] 记忆已成功提交到 memory_server ({mode}, {result.get('turns', 0)} 条消息)")
+            except Exception as e:
+                # memory_server不可达或超时；finalize是幂等的，重发不会重复处理
+                defer_finalize(session_id, mode, f"调用 /finalize API 失败: {e}")
+
+        def defer_finalize(session_id, mode, reason):
+            nonlocal finalize_retry_at
+            if (session_id, mode) not in deferred_finalize:
+                deferred_finalize.append((session_id, mode))
+            finalize_retry_at = time.time() + FINALIZE_RETRY_SECONDS
+            logger.warning(f"[{lanlan_name}] {reason}，推迟 {mode} 处理，稍后重试")
+
+        async def retry_deferred_finalize(pending):
+            for session_id, mode in pending:
+                await finalize_ingest(session_id, mode)
+
+        def schedule_deferred_finalize():
+            """上传队列清空后，重发此前推迟的finalize"""
+            nonlocal finalize_task
+            if not deferred_finalize or ingest_outbox or (finalize_task and not finalize_task.done()):
+                return
+            if time.time() < finalize_retry_at:
+                return
+            pending = list(deferred_finalize)
+            deferred_finalize.clear()
+            finalize_task = asyncio.create_task(retry_deferred_finalize(pending))
+
+        def start_finalize(mode):
+            """结束当前ingest session并在后台finalize，之后的轮次写入新的session"""
+            nonlocal ingest_session_id, ingest_seq
+            session_id = ingest_session_id
+            ingest_session_id = str(uuid4())
+            ingest_seq = 0
+            return asyncio.create_task(finalize_ingest(session_id, mode))
+
         while not shutdown_event.is_set():
             try:
                 # 检查消息队列
@@ -103,7 +227,7 @@ def sync_connector_process(message_queue, shutdown_event, lanlan_name, sync_serv
                         if message["data"].get("type") == "gemini_response":
                             if current_turn == 'user':  # assistant new message starts
                                 if user_input_cache:
-                                    chat_history.append({'role': 'user', 'content': [{"type": "text", "text": user_input_cache}]})
+                                    record_turn({'role': 'user', 'content': [{"type": "text", "text": user_input_cache}]})
                                     user_input_cache = ''
                                 current_turn = 'assistant'
                                 text_output_cache = datetime.now().strftime('[%Y%m%d %a %H:%M] ')
@@ -137,8 +261,18 @@ def sync_connector_process(message_queue, shutdown_event, lanlan_name, sync_serv
                                 pass
 
                     elif message["type"] == "binary":
+                        if message.get("speech_id") in interrupted_speech_ids:
+                            continue  # 属于已被打断的回复
                         if config['monitor'] and binary_ws:
-                            await binary_ws.send_bytes(message["data"])
+                            await binary_ws.send_bytes(pack_sync_audio(audio_generation, message["data"]))
+
+                    elif message["type"] == "interrupt":
+                        # 用户开始说话：之后的音频属于新的speech_id，monitor丢弃旧代际的音频并停止播放
+                        if message.get("previous_speech_id"):
+                            interrupted_speech_ids.append(message["previous_speech_id"])
+                        audio_generation += 1
+                        if config['monitor'] and sync_ws:
+                            await sync_ws.send_json({'type': 'user_activity', 'generation': audio_generation})
 
                     elif message["type"] == "user":  # 准备转录
                         data = message["data"].get("data")
@@ -157,7 +291,7 @@ def sync_connector_process(message_queue, shutdown_event, lanlan_name, sync_serv
                         try:
                             if message["data"] == "google disconnected":
                                 if len(text_output_cache) > 0:
-                                    chat_history.append({'role': 'system', 'content': [
+                                    record_turn({'role': 'system', 'content': [
                                         {'type': 'text', 'text': "网络错误，您已断开连接！"}]})
                                 text_output_cache = ''
 
@@ -165,29 +299,18 @@ def sync_connector_process(message_queue, shutdown_event, lanlan_name, sync_serv
                                 current_turn = 'user'
                                 text_output_cache = normalize_text(text_output_cache)
                                 if len(text_output_cache) > 0:
-                                    chat_history.append(
+                                    record_turn(
                                             {'role': 'assistant', 'content': [{'type': 'text', 'text': text_output_cache}]})
                                 text_output_cache = ''
                                 logger.info(f"[{lanlan_name}] 热重置：聊天历史长度 {len(chat_history)} 条消息")
-                                try:
-                                    response = requests.post(
-                                        f"http://localhost:{MEMORY_SERVER_PORT}/renew/{lanlan_name}",
-                                        json={'input_history': json.dumps(chat_history, indent=2, ensure_ascii=False)},
-                                        timeout=5.0
-                                    )
-                                    if response.json()['status'] == 'error':
-                                        logger.error(f"[{lanlan_name}] 热重置记忆处理失败: {response.json()['message']}")
-                                    else:
-                                        logger.info(f"[{lanlan_name}] 热重置记忆已成功上传到 memory_server")
-                                except Exception as e:
-                                    logger.error(f"[{lanlan_name}] 调用 /renew API 失败: {e}")
+                                start_finalize('renew')
                                 chat_history.clear()
 
                             if message["data"] == 'turn end': # lanlan的消息结束了
                                 current_turn = 'user'
                                 text_output_cache = normalize_text(text_output_cache)
                                 if len(text_output_cache) > 0:
-                                    chat_history.append(
+                                    record_turn(
                                         {'role': 'assistant', 'content': [{'type': 'text', 'text': text_output_cache}]})
                                 text_output_cache = ''
                                 if config['monitor'] and sync_ws:
@@ -219,7 +342,7 @@ def sync_connector_process(message_queue, shutdown_event, lanlan_name, sync_serv
                                 current_turn = 'user'
                                 text_output_cache = normalize_text(text_output_cache)
                                 if len(text_output_cache) > 0:
-                                    chat_history.append(
+                                    record_turn(
                                         {'role': 'assistant', 'content': [{'type': 'text', 'text': text_output_cache}]})
                                 text_output_cache = ''
                                 
@@ -247,18 +370,7 @@ def sync_connector_process(message_queue, shutdown_event, lanlan_name, sync_serv
                                 
                                 # 处理聊天历史
                                 logger.info(f"[{lanlan_name}] 会话结束：开始处理聊天历史，共 {len(chat_history)} 条消息")
-                                try:
-                                    response = requests.post(
-                                        f"http://localhost:{MEMORY_SERVER_PORT}/process/{lanlan_name}",
-                                        json={'input_history': json.dumps(chat_history, indent=2, ensure_ascii=False)},
-                                        timeout=5.0
-                                    )
-                                    if response.json()['status'] == 'error':
-                                        logger.error(f"[{lanlan_name}] 会话记忆处理失败: {response.json()['message']}")
-                                    else:
-                                        logger.info(f"[{lanlan_name}] 会话记忆已成功上传到 memory_server")
-                                except Exception as e:
-                                    logger.error(f"[{lanlan_name}] 调用 /process API 失败: {e}")
+                                start_finalize('process')
                                 chat_history.clear()
                         except Exception as e:
                             logger.error(f"[{lanlan_name}] System message error: {e}", exc_info=True)
@@ -267,6 +379,10 @@ def sync_connector_process(message_queue, shutdown_event, lanlan_name, sync_serv
                 logger.error(f"[{lanlan_name}] Message processing error: {e}", exc_info=True)
                 await asyncio.sleep(0.02)
             
+            # 重试此前上传失败的对话轮次，以及因此推迟的finalize
+            schedule_ingest_flush()
+            schedule_deferred_finalize()
+
             # WebSocket 连接管理（独立于消息处理）
             try:
                 # 如果连接不存在，尝试建立连接
@@ -353,6 +469,14 @@ def sync_connector_process(message_queue, shutdown_event, lanlan_name, sync_serv
                 bullet_ws = None
                 await asyncio.sleep(0.03)  # 重连前等待
 
+        # 退出前尽量把剩余轮次上传，未能finalize的session由memory_server在过期后补处理
+        try:
+            await asyncio.wait_for(flush_ingest(), timeout=3.0)
+        except Exception:
+            pass
+        if deferred_finalize:
+            logger.warning(f"[{lanlan_name}] 退出时仍有 {len(deferred_finalize)} 个session未能finalize，交由memory_server清扫")
+
         # 关闭资源
         for ws in [sync_ws, binary_ws, bullet_ws]:
             if ws:
@@ -360,7 +484,7 @@ def sync_connector_process(message_queue, shutdown_event, lanlan_name, sync_serv
                     await ws.close()
                 except Exception:
                     pass
-        for sess in [sync_session, binary_session, bullet_session]:
+        for sess in [sync_session, binary_session, bullet_session, memory_session]:
             if sess:
                 try:
                     await sess.close()
@@ -5,7 +5,7 @@ import json
 import time
 import logging
 from typing import Optional, Callable, Dict, Any, Awaitable
-from langchain_openai import ChatOpenAI
+from utils.llm_client import get_chat_llm
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from config import MODELS_WITH_EXTRA_BODY
 
@@ -69,7 +69,7 @@ class OmniOfflineClient:
         self.on_response_done = on_response_done
         
         # Initialize langchain ChatOpenAI client
-        self.llm = ChatOpenAI(
+        self.llm = get_chat_llm(
             model=self.model,
             base_url=self.base_url,
             api_key=self.api_key,
@@ -114,7 +114,7 @@ class OmniOfflineClient:
             logger.info(f"Switching model from {self.model} to {new_model}")
             self.model = new_model
             # Recreate LLM instance with new model
-            self.llm = ChatOpenAI(
+            self.llm = get_chat_llm(
                 model=self.model,
                 base_url=self.base_url,
                 api_key=self.api_key,
@@ -5,17 +5,46 @@ from re import T
 import websockets
 import json
 import base64
+import binascii
+import re
 import time
 import logging
 
 from typing import Optional, Callable, Dict, Any, Awaitable
 from enum import Enum
-from langchain_openai import ChatOpenAI
+from utils.llm_client import get_chat_llm
+from utils.llm_gateway import llm_ainvoke
+from utils.llm_scheduler import Priority
 from config import get_core_config
 
 # Setup logger for this module
 logger = logging.getLogger(__name__)
 
+# Mic audio is coalesced into frames of this many milliseconds before being sent to the API
+AUDIO_APPEND_FRAME_MS = 60
+# Input audio is 16bit 16kHz mono pcm
+_INPUT_AUDIO_BYTES_PER_MS = 32
+# Model output audio is 16bit 24kHz mono pcm
+_OUTPUT_AUDIO_BYTES_PER_SECOND = 48000
+# Rough token costs, used to estimate session usage when response.done carries no usage
+AUDIO_TOKENS_PER_SECOND = 25
+IMAGE_TOKENS = 500
+# Audio delta fast path: the event type has to appear near the start of the message
+_AUDIO_DELTA_SCAN = 200
+_AUDIO_DELTA_TYPE = re.compile(r'"type"\s*:\s*"response\.(?:output_)?audio\.delta"')
+_DELTA_FIELD = re.compile(r'"delta"\s*:\s*"')
+# Pre-serialized input_audio_buffer.append envelope, filled with (event_id, base64 audio)
+_AUDIO_APPEND_TEMPLATE = '{"type": "input_audio_buffer.append", "event_id": "event_%d", "audio": "%s"}'
+
+# Providers (matched against the model name) that accept session.update and conversation.item.delete
+# mid-session, so a long session can be refreshed in place instead of hot-swapped to a new connection
+IN_PLACE_REFRESH_MODELS = ["gpt"]
+# Providers whose server_vad silence_duration_ms can be re-tuned with session.update
+TUNABLE_SILENCE_MODELS = ["qwen"]
+# semantic_vad has no silence duration; the tuned value is mapped onto its eagerness instead
+SEMANTIC_VAD_EAGER_MS = 400
+SEMANTIC_VAD_PATIENT_MS = 800
+
 class TurnDetectionMode(Enum):
     SERVER_VAD = "server_vad"
     MANUAL = "manual"
@@ -66,11 +95,13 @@ class OmniRealtimeClient:
         on_text_delta: Optional[Callable[[str, bool], Awaitable[None]]] = None,
         on_audio_delta: Optional[Callable[[bytes], Awaitable[None]]] = None,
         on_new_message: Optional[Callable[[], Awaitable[None]]] = None,
+        on_interrupt: Optional[Callable[[], Awaitable[None]]] = None,
         on_input_transcript: Optional[Callable[[str], Awaitable[None]]] = None,
         on_output_transcript: Optional[Callable[[str, bool], Awaitable[None]]] = None,
         on_connection_error: Optional[Callable[[str], Awaitable[None]]] = None,
         on_response_done: Optional[Callable[[], Awaitable[None]]] = None,
-        extra_event_handlers: Optional[Dict[str, Callable[[Dict[str, Any]], Awaitable[None]]]] = None
+        extra_event_handlers: Optional[Dict[str, Callable[[Dict[str, Any]], Awaitable[None]]]] = None,
+        audio_frame_ms: int = AUDIO_APPEND_FRAME_MS
     ):
         self.base_url = base_url
         self.api_key = api_key
@@ -80,6 +111,7 @@ class OmniRealtimeClient:
         self.on_text_delta = on_text_delta
         self.on_audio_delta = on_audio_delta
         self.on_new_message = on_new_message
+        self.on_interrupt = on_interrupt
         self.on_input_transcript = on_input_transcript
         self.on_output_transcript = on_output_transcript
         self.turn_detection_mode = turn_detection_mode
@@ -87,6 +119,21 @@ class OmniRealtimeClient:
         self.on_response_done = on_response_done
         self.extra_event_handlers = extra_event_handlers or {}
 
+        # Mic audio coalescing
+        self.audio_frame_ms = audio_frame_ms
+        self._audio_frame_bytes = audio_frame_ms * _INPUT_AUDIO_BYTES_PER_MS
+        self._audio_pending = bytearray()
+        self._audio_flush_handle = None
+        self.audio_chunks_received = 0
+        self.audio_messages_sent = 0
+        self.audio_deltas_fast_path = 0
+        # Optional TurnLatencyTracker, timestamps speech_stopped and the first response delta of each turn
+        self.latency = None
+        # Optional EndOfTurnTuner, learns the user's pauses from speech_started / speech_stopped timing
+        self.turn_tuner = None
+        self.silence_duration_ms = 500
+        self._event_handlers = self._build_event_handlers()
+
         # Track current response state
         self._current_response_id = None
         self._current_item_id = None
@@ -99,19 +146,89 @@ class OmniRealtimeClient:
         self._modalities = ["text", "audio"]
         self._audio_in_buffer = False
         self._skip_until_next_response = False
+        # Output of a response the user talked over is dropped until the next response starts
+        self._discard_output = False
         # Track image recognition per turn
         self._image_recognized_this_turn = False
         self._image_being_analyzed = False
         self._image_description = "[用户的实时屏幕截图或相机画面正在分析中。你先不要瞎编内容，可以请用户稍等片刻。等收到分析结果后再描述画面。]"
+        # Connection state, used by the standby pool
+        self.connected_at = None
+        self._closing = False
+        self.instructions = None
+        self.native_audio = None
+        # Conversation items known to the server, in creation order: item_id -> created time
+        self._conversation_items = {}
+        self.supports_in_place_refresh = any(k in model for k in IN_PLACE_REFRESH_MODELS)
+        # Token / audio accounting for the renewal policy, see reset_usage()
+        self.reset_usage()
+
+    def reset_usage(self) -> None:
+        """Reset the per-session usage counters (after the context has been trimmed)."""
+        self.usage = {
+            "input_tokens": 0,       # cumulative billed input tokens
+            "output_tokens": 0,      # cumulative billed output tokens
+            "context_tokens": 0,     # size of the conversation context after the last response
+            "input_audio_seconds": 0.0,
+            "output_audio_seconds": 0.0,
+            "text_chars": 0,
+            "images": 0,
+            "responses": 0,
+            "reported": False,       # whether the provider reports usage in response.done
+        }
+
+    def estimate_context_tokens(self) -> int:
+        """Estimate the context size from what has been sent and received so far."""
+        u = self.usage
+        audio_seconds = u["input_audio_seconds"] + u["output_audio_seconds"]
+        return int(len(self.instructions or "") + u["text_chars"]
+                   + audio_seconds * AUDIO_TOKENS_PER_SECOND + u["images"] * IMAGE_TOKENS)
+
+    def _account_response_usage(self, usage: Optional[Dict[str, Any]]) -> None:
+        u = self.usage
+        u["responses"] += 1
+        if usage and usage.get("input_tokens") is not None:
+            u["reported"] = True
+            input_tokens = usage.get("input_tokens") or 0
+            output_tokens = usage.get("output_tokens") or 0
+            u["input_tokens"] += input_tokens
+            u["output_tokens"] += output_tokens
+            u["context_tokens"] = input_tokens + output_tokens
+        else:
+            # Every response re-reads the whole context
+            context = self.estimate_context_tokens()
+            u["input_tokens"] += context
+            u["context_tokens"] = context
 
     async def connect(self, instructions: str, native_audio=True) -> None:
         """Establish WebSocket connection with the Realtime API."""
+        await self.open()
+        await self.configure(instructions, native_audio)
+
+    async def open(self) -> None:
+        """Open the WebSocket connection without configuring the session."""
         url = f"{self.base_url}?model={self.model}" if self.model != "free-model" else self.base_url
         headers = {
             "Authorization": f"Bearer {self.api_key}"
         } 
         self.ws = await websockets.connect(url, additional_headers=headers)
+        self.connected_at = time.monotonic()
+
+    @property
+    def is_connected(self) -> bool:
+        return self.ws is not None and getattr(self.ws, "close_code", None) is None
 
+    def set_callbacks(self, **callbacks) -> None:
+        """Attach event callbacks, e.g. when a pre-connected standby client is handed to a session."""
+        for name, callback in callbacks.items():
+            if not hasattr(self, name):
+                raise AttributeError(f"Unknown callback: {name}")
+            setattr(self, name, callback)
+
+    async def configure(self, instructions: str, native_audio=True) -> None:
+        """Send session.update with the instructions and the model specific session config."""
+        self.instructions = instructions
+        self.native_audio = native_audio
         # Set up default session configuration
         if self.turn_detection_mode == TurnDetectionMode.MANUAL:
             raise NotImplementedError("Manual turn detection is not supported")
@@ -150,7 +267,7 @@ class OmniRealtimeClient:
                         "type": "server_vad",
                         "threshold": 0.5,
                         "prefix_padding_ms":300,
-                        "silence_duration_ms": 500
+                        "silence_duration_ms": self.silence_duration_ms
                     },
                     "temperature": 0.4
                 })
@@ -164,7 +281,7 @@ class OmniRealtimeClient:
                         "input": {
                             "transcription": {"model": "gpt-4o-mini-transcribe"},
                             "turn_detection": { "type": "semantic_vad",
-                                "eagerness": "auto",
+                                "eagerness": self._vad_eagerness(self.silence_duration_ms),
                                 "create_response": True,
                                 "interrupt_response": True 
                             },
@@ -223,6 +340,47 @@ class OmniRealtimeClient:
         if self.ws:
             await self.ws.send(json.dumps(event))
 
+    @staticmethod
+    def _vad_eagerness(silence_ms: int) -> str:
+        if silence_ms <= SEMANTIC_VAD_EAGER_MS:
+            return "high"
+        if silence_ms >= SEMANTIC_VAD_PATIENT_MS:
+            return "low"
+        return "auto"
+
+    async def update_turn_detection(self, silence_ms: int) -> bool:
+        """Re-tune end-of-turn detection mid-session. Returns False if the provider does not support it.
+
+        silence_duration_ms only changes once the update has been sent, so it always reflects what the server uses.
+        """
+        previous = self.silence_duration_ms
+        if any(k in self.model for k in TUNABLE_SILENCE_MODELS):
+            await self.update_session({
+                "turn_detection": {
+                    "type": "server_vad",
+                    "threshold": 0.5,
+                    "prefix_padding_ms": 300,
+                    "silence_duration_ms": silence_ms
+                }
+            })
+        elif "gpt" in self.model:
+            eagerness = self._vad_eagerness(silence_ms)
+            if eagerness != self._vad_eagerness(previous):
+                await self.update_session({
+                    "type": "realtime",
+                    "audio": {"input": {"turn_detection": {
+                        "type": "semantic_vad",
+                        "eagerness": eagerness,
+                        "create_response": True,
+                        "interrupt_response": True
+                    }}}
+                })
+        else:
+            return False
+        self.silence_duration_ms = silence_ms
+        logger.info(f"Turn detection silence: {previous}ms -> {silence_ms}ms")
+        return True
+
     async def update_session(self, config: Dict[str, Any]) -> None:
         """Update session configuration."""
         event = {
@@ -232,15 +390,41 @@ class OmniRealtimeClient:
         await self.send_event(event)
 
     async def stream_audio(self, audio_chunk: bytes) -> None:
-        """Stream raw audio data to the API."""
+        """Stream raw audio data to the API, coalesced into frames of audio_frame_ms."""
         # only support 16bit 16kHz mono pcm
-        audio_b64 = base64.b64encode(audio_chunk).decode()
+        self.audio_chunks_received += 1
+        self._audio_pending += audio_chunk
+        if len(self._audio_pending) >= self._audio_frame_bytes:
+            await self.flush_audio()
+        elif self._audio_flush_handle is None:
+            # Send the partial frame too if no more audio arrives in time
+            self._audio_flush_handle = asyncio.get_running_loop().call_later(
+                self.audio_frame_ms / 1000, self._flush_audio_later)
 
-        append_event = {
-            "type": "input_audio_buffer.append",
-            "audio": audio_b64
-        }
-        await self.send_event(append_event)
+    def _flush_audio_later(self) -> None:
+        self._audio_flush_handle = None
+        if self._audio_pending:
+            asyncio.ensure_future(self._flush_audio_quietly())
+
+    async def _flush_audio_quietly(self) -> None:
+        try:
+            await self.flush_audio()
+        except Exception as e:
+            logger.debug(f"Failed to flush pending audio: {e}")
+
+    async def flush_audio(self) -> None:
+        """Send any coalesced audio as a single input_audio_buffer.append message."""
+        if self._audio_flush_handle is not None:
+            self._audio_flush_handle.cancel()
+            self._audio_flush_handle = None
+        if not self._audio_pending:
+            return
+        chunk, self._audio_pending = self._audio_pending, bytearray()
+        if self.ws:
+            audio_b64 = base64.b64encode(chunk).decode('ascii')
+            await self.ws.send(_AUDIO_APPEND_TEMPLATE % (int(time.time() * 1000), audio_b64))
+            self.audio_messages_sent += 1
+            self.usage["input_audio_seconds"] += len(chunk) / (_INPUT_AUDIO_BYTES_PER_MS * 1000)
 
     async def _analyze_image_with_vision_model(self, image_b64: str) -> str:
         """Use VISION_MODEL to analyze image and return description."""
@@ -258,7 +442,7 @@ class OmniRealtimeClient:
             logger.info(f"🖼️ Using VISION_MODEL ({vision_model}) to analyze image")
             
             # Create vision LLM client
-            vision_llm = ChatOpenAI(
+            vision_llm = get_chat_llm(
                 model=vision_model,
                 base_url=openrouter_url,
                 api_key=openrouter_api_key,
@@ -290,7 +474,7 @@ class OmniRealtimeClient:
             ]
             
             # Call vision model
-            response = await vision_llm.ainvoke(messages)
+            response = await llm_ainvoke(vision_llm, messages, Priority.FOREGROUND)
             description = response.content.strip()
             self._image_description = f"[用户的实时屏幕截图或相机画面]: {description}"
             
@@ -365,10 +549,19 @@ class OmniRealtimeClient:
                     return
                     
                 await self.send_event(append_event)
+                self.usage["images"] += 1
         except Exception as e:
             logger.error(f"Error streaming image: {e}")
             raise e
 
+    async def delete_items_before(self, cutoff: float) -> int:
+        """Delete conversation items created before cutoff (unix time). Returns the number of items deleted."""
+        stale = [item_id for item_id, created in self._conversation_items.items() if created < cutoff]
+        for item_id in stale:
+            await self.send_event({"type": "conversation.item.delete", "item_id": item_id})
+            self._conversation_items.pop(item_id, None)
+        return len(stale)
+
     async def create_response(self, instructions: str, skipped: bool = False) -> None:
         """Request a response from the API. Needed when using manual mode."""
         if skipped == True:
@@ -396,6 +589,8 @@ class OmniRealtimeClient:
             return
 
         logger.info("Handling interruption")
+        # Deltas of the cancelled response that are still in flight must not be played
+        self._discard_output = True
 
         # 1. Cancel the current response
         if self._current_response_id:
@@ -408,6 +603,213 @@ class OmniRealtimeClient:
         self._output_transcript_buffer = ""
         self._is_first_transcript_chunk = True
 
+    def _build_event_handlers(self) -> Dict[str, Callable[[Dict[str, Any]], Awaitable[None]]]:
+        """Map each server event type to its handler."""
+        return {
+            "error": self._on_error,
+            "response.done": self._on_response_done,
+            "response.created": self._on_response_created,
+            "response.output_item.added": self._on_output_item_added,
+            "input_audio_buffer.speech_started": self._on_speech_started,
+            "input_audio_buffer.speech_stopped": self._on_speech_stopped,
+            "conversation.item.input_audio_transcription.completed": self._on_input_transcription_completed,
+            "response.audio_transcript.done": self._on_output_transcript_done,
+            "response.output_audio_transcript.done": self._on_output_transcript_done,
+            "response.text.delta": self._on_text_delta,
+            "response.output_text.delta": self._on_text_delta,
+            "response.audio.delta": self._on_audio_delta_event,
+            "response.output_audio.delta": self._on_audio_delta_event,
+            "response.audio_transcript.delta": self._on_output_transcript_delta,
+            "response.output_audio_transcript.delta": self._on_output_transcript_delta,
+            "conversation.item.created": self._on_item_created,
+            "conversation.item.added": self._on_item_created,
+            "conversation.item.deleted": self._on_item_deleted,
+        }
+
+    async def _on_item_created(self, event: Dict[str, Any]) -> None:
+        item_id = event.get("item", {}).get("id")
+        if item_id and item_id not in self._conversation_items:
+            self._conversation_items[item_id] = time.time()
+        await self._dispatch_extra(event)
+
+    async def _on_item_deleted(self, event: Dict[str, Any]) -> None:
+        self._conversation_items.pop(event.get("item_id"), None)
+        await self._dispatch_extra(event)
+
+    async def _on_error(self, event: Dict[str, Any]) -> None:
+        logger.error(f"API Error: {event['error']}")
+        if '欠费' in event['error'] or 'standing' in event['error']:
+            if self.on_connection_error:
+                await self.on_connection_error(event['error'])
+            await self.close()
+
+    async def _on_response_done(self, event: Dict[str, Any]) -> None:
+        self._is_responding = False
+        self._current_response_id = None
+        self._current_item_id = None
+        self._skip_until_next_response = False
+        # 响应完成，确保buffer被清空
+        self._output_transcript_buffer = ""
+        self._image_recognized_this_turn = False
+        self._account_response_usage((event.get("response") or {}).get("usage"))
+        if self.on_response_done:
+            await self.on_response_done()
+        await self._dispatch_extra(event)
+
+    async def _on_response_created(self, event: Dict[str, Any]) -> None:
+        self._current_response_id = event.get("response", {}).get("id")
+        self._is_responding = True
+        self._discard_output = False
+        self._is_first_text_chunk = self._is_first_transcript_chunk = True
+        # 清空转录buffer，防止累积旧内容
+        self._output_transcript_buffer = ""
+        await self._dispatch_extra(event)
+
+    async def _on_output_item_added(self, event: Dict[str, Any]) -> None:
+        self._current_item_id = event.get("item", {}).get("id")
+        await self._dispatch_extra(event)
+
+    async def _on_speech_started(self, event: Dict[str, Any]) -> None:
+        # Handle interruptions
+        logger.info("Speech detected")
+        self._audio_in_buffer = True
+        # Stop playback first; cancelling the response needs a round trip to the server
+        if self.on_interrupt:
+            await self.on_interrupt()
+        if self._is_responding:
+            logger.info("Handling interruption")
+            await self.handle_interruption()
+        if self.turn_tuner:
+            await self._apply_turn_tuning(self.turn_tuner.speech_started())
+        await self._dispatch_extra(event)
+
+    async def _apply_turn_tuning(self, silence_ms: Optional[int]) -> None:
+        if silence_ms is None or silence_ms == self.silence_duration_ms:
+            return
+        try:
+            if await self.update_turn_detection(silence_ms):
+                self.turn_tuner.applied(silence_ms)
+        except Exception as e:
+            logger.warning(f"Failed to update turn detection: {e}")
+
+    async def _on_speech_stopped(self, event: Dict[str, Any]) -> None:
+        logger.info("Speech ended")
+        if self.latency:
+            self.latency.start_turn()
+        if self.turn_tuner:
+            self.turn_tuner.speech_stopped()
+        if self.on_new_message:
+            await self.on_new_message()
+        self._audio_in_buffer = False
+        await self._dispatch_extra(event)
+
+    async def _on_input_transcription_completed(self, event: Dict[str, Any]) -> None:
+        self._print_input_transcript = True
+        if self._skip_until_next_response:
+            return
+        transcript = event.get("transcript", "")
+        self.usage["text_chars"] += len(transcript)
+        if self.on_input_transcript:
+            await self.on_input_transcript(transcript)
+
+    async def _on_output_transcript_done(self, event: Dict[str, Any]) -> None:
+        self._print_input_transcript = False
+        self._output_transcript_buffer = ""
+        self.usage["text_chars"] += len(event.get("transcript", ""))
+        if self._skip_until_next_response or self._discard_output:
+            return
+        if self.on_output_transcript and self._is_first_transcript_chunk:
+            transcript = event.get("transcript", "")
+            if transcript:
+                await self.on_output_transcript(transcript, True)
+                self._is_first_transcript_chunk = False
+
+    async def _on_text_delta(self, event: Dict[str, Any]) -> None:
+        self.usage["text_chars"] += len(event.get("delta", ""))
+        if self._skip_until_next_response or self._discard_output:
+            return
+        if self.latency:
+            self.latency.mark('first_delta')
+        if self.on_text_delta:
+            if "glm" not in self.model:
+                await self.on_text_delta(event["delta"], self._is_first_text_chunk)
+                self._is_first_text_chunk = False
+
+    async def _on_audio_delta_event(self, event: Dict[str, Any]) -> None:
+        # Skipped audio still ends up in the server side context
+        self.usage["output_audio_seconds"] += len(event["delta"]) * 3 / 4 / _OUTPUT_AUDIO_BYTES_PER_SECOND
+        if self._skip_until_next_response or self._discard_output:
+            return
+        if self.latency:
+            self.latency.mark('first_delta')
+        if self.on_audio_delta:
+            await self.on_audio_delta(base64.b64decode(event["delta"]))
+
+    async def _on_output_transcript_delta(self, event: Dict[str, Any]) -> None:
+        if self._skip_until_next_response or self._discard_output:
+            return
+        if self.latency:
+            self.latency.mark('first_delta')
+        if self.on_output_transcript:
+            delta = event.get("delta", "")
+            if not self._print_input_transcript:
+                self._output_transcript_buffer += delta
+            else:
+                if self._output_transcript_buffer:
+                    await self.on_output_transcript(self._output_transcript_buffer, self._is_first_transcript_chunk)
+                    self._is_first_transcript_chunk = False
+                    self._output_transcript_buffer = ""
+                await self.on_output_transcript(delta, self._is_first_transcript_chunk)
+                self._is_first_transcript_chunk = False
+
+    async def _dispatch_extra(self, event: Dict[str, Any]) -> None:
+        if self._skip_until_next_response:
+            return
+        handler = self.extra_event_handlers.get(event.get("type"))
+        if handler:
+            await handler(event)
+
+    def _extract_audio_delta(self, message) -> Optional[bytes]:
+        """
+        Fast path for audio delta events: decode the base64 payload straight out of the raw message
+        without parsing the whole JSON document. Returns None when the message is not a plain audio delta.
+        """
+        if not isinstance(message, str):
+            return None
+        type_match = _AUDIO_DELTA_TYPE.search(message, 0, _AUDIO_DELTA_SCAN)
+        if type_match is None:
+            return None
+        delta_match = _DELTA_FIELD.search(message)
+        if delta_match is None:
+            return None
+        start = delta_match.end()
+        end = message.find('"', start)
+        if end < 0 or message.find('\\', start, end) >= 0:
+            # Escaped characters in the payload, let json handle it
+            return None
+        return binascii.a2b_base64(message[start:end])
+
+    async def handle_event(self, message) -> None:
+        """Handle one raw server message."""
+        audio_bytes = self._extract_audio_delta(message)
+        if audio_bytes is not None:
+            self.audio_deltas_fast_path += 1
+            self.usage["output_audio_seconds"] += len(audio_bytes) / _OUTPUT_AUDIO_BYTES_PER_SECOND
+            if self._skip_until_next_response or self._discard_output:
+                return
+            if self.latency:
+                self.latency.mark('first_delta')
+            if self.on_audio_delta:
+                await self.on_audio_delta(audio_bytes)
+            return
+
+        event = json.loads(message)
+        handler = self._event_handlers.get(event.get("type"))
+        if handler is not None:
+            await handler(event)
+        else:
+            await self._dispatch_extra(event)
+
     async def handle_messages(self) -> None:
         try:
             if not self.ws:
@@ -415,96 +817,13 @@ class OmniRealtimeClient:
                 return
                 
             async for message in self.ws:
-                event = json.loads(message)
-                event_type = event.get("type")
-                
-                # if event_type not in ["response.audio.delta", "response.audio_transcript.delta",  "response.output_audio.delta", "response.output_audio_transcript.delta"]:
-                #     # print(f"Received event: {event}")
-                #     print(f"Received event: {event_type}")
-                # else:
-                #     print(f"Event type: {event_type}")
-                if event_type == "error":
-                    logger.error(f"API Error: {event['error']}")
-                    if '欠费' in event['error'] or 'standing' in event['error']:
-                        if self.on_connection_error:
-                            await self.on_connection_error(event['error'])
-                        await self.close()
-                    continue
-                elif event_type == "response.done":
-                    self._is_responding = False
-                    self._current_response_id = None
-                    self._current_item_id = None
-                    self._skip_until_next_response = False
-                    # 响应完成，确保buffer被清空
-                    self._output_transcript_buffer = ""
-                    self._image_recognized_this_turn = False
-                    if self.on_response_done:
-                        await self.on_response_done()
-                elif event_type == "response.created":
-                    self._current_response_id = event.get("response", {}).get("id")
-                    self._is_responding = True
-                    self._is_first_text_chunk = self._is_first_transcript_chunk = True
-                    # 清空转录buffer，防止累积旧内容
-                    self._output_transcript_buffer = ""
-                elif event_type == "response.output_item.added":
-                    self._current_item_id = event.get("item", {}).get("id")
-                # Handle interruptions
-                elif event_type == "input_audio_buffer.speech_started":
-                    logger.info("Speech detected")
-                    self._audio_in_buffer = True
-                    if self._is_responding:
-                        logger.info("Handling interruption")
-                        await self.handle_interruption()
-                elif event_type == "input_audio_buffer.speech_stopped":
-                    logger.info("Speech ended")
-                    if self.on_new_message:
-                        await self.on_new_message()
-                    self._audio_in_buffer = False
-                elif event_type == "conversation.item.input_audio_transcription.completed":
-                    self._print_input_transcript = True
-                elif event_type in ["response.audio_transcript.done", "response.output_audio_transcript.done"]:
-                    self._print_input_transcript = False
-                    self._output_transcript_buffer = ""
-
-                if not self._skip_until_next_response:
-                    if event_type in ["response.text.delta", "response.output_text.delta"]:
-                        if self.on_text_delta:
-                            if "glm" not in self.model:
-                                await self.on_text_delta(event["delta"], self._is_first_text_chunk)
-                                self._is_first_text_chunk = False
-                    elif event_type in ["response.audio.delta", "response.output_audio.delta"]:
-                        if self.on_audio_delta:
-                            audio_bytes = base64.b64decode(event["delta"])
-                            await self.on_audio_delta(audio_bytes)
-                    elif event_type == "conversation.item.input_audio_transcription.completed":
-                        transcript = event.get("transcript", "")
-                        if self.on_input_transcript:
-                            await self.on_input_transcript(transcript)
-                    elif event_type in ["response.audio_transcript.done", "response.output_audio_transcript.done"]:
-                        if self.on_output_transcript and self._is_first_transcript_chunk:
-                            transcript = event.get("transcript", "")
-                            if transcript:
-                                await self.on_output_transcript(transcript, True)
-                                self._is_first_transcript_chunk = False
-                    elif event_type in ["response.audio_transcript.delta", "response.output_audio_transcript.delta"]:
-                        if self.on_output_transcript:
-                            delta = event.get("delta", "")
-                            if not self._print_input_transcript:
-                                self._output_transcript_buffer += delta
-                            else:
-                                if self._output_transcript_buffer:
-                                    # logger.info(f"{self._output_transcript_buffer} is_first_chunk: True")
-                                    await self.on_output_transcript(self._output_transcript_buffer, self._is_first_transcript_chunk)
-                                    self._is_first_transcript_chunk = False
-                                    self._output_transcript_buffer = ""
-                                await self.on_output_transcript(delta, self._is_first_transcript_chunk)
-                                self._is_first_transcript_chunk = False
-                    
-                    elif event_type in self.extra_event_handlers:
-                        await self.extra_event_handlers[event_type](event)
+                await self.handle_event(message)
 
-        except websockets.exceptions.ConnectionClosedOK:
+        except websockets.exceptions.ConnectionClosedOK as e:
             logger.info("Connection closed as expected")
+            # The provider ended the session on its own (e.g. a maximum session duration), let the owner resume it
+            if not self._closing and self.on_connection_error:
+                await self.on_connection_error(f"Connection closed by server: {e}")
         except websockets.exceptions.ConnectionClosedError as e:
             error_msg = str(e)
             logger.error(f"Connection closed with error: {error_msg}")
@@ -521,6 +840,11 @@ class OmniRealtimeClient:
 
     async def close(self) -> None:
         """Close the WebSocket connection."""
+        self._closing = True
+        if self._audio_flush_handle is not None:
+            self._audio_flush_handle.cancel()
+            self._audio_flush_handle = None
+        self._audio_pending = bytearray()
         if self.ws:
             try:
                 # 尝试关闭websocket连接
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Realtime服务商的故障切换
+主服务商和 core_config 中配置的备用服务商按顺序错峰发起连接：前一个在 PROVIDER_STAGGER 秒内没有连上（或已经失败）时，
+启动下一个，最先建立连接的胜出，其余的取消并关闭。胜出的服务商在 PROVIDER_STICKY_SECONDS 内优先使用，
+失败的服务商在 PROVIDER_DOWN_SECONDS 内排到最后，只在其余都不可用时再尝试。
+握手成功不代表服务商可用（欠费、鉴权失败等要到session中途才报错），这类错误由调用方通过 report_failure() 告知。
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# 启动下一个候选连接前的等待时间（秒）
+PROVIDER_STAGGER = 0.3
+# 单个服务商的建连超时（秒）
+PROVIDER_CONNECT_TIMEOUT = 8.0
+# 胜出的服务商被优先使用的时长（秒）
+PROVIDER_STICKY_SECONDS = 600.0
+# 连接失败的服务商被排到最后的时长（秒）
+PROVIDER_DOWN_SECONDS = 60.0
+
+
+class RealtimeFailover:
+    def __init__(self, name):
+        self.name = name
+        self._preferred = None  # 最近胜出的服务商类型
+        self._preferred_until = 0.0
+        self._down_until = {}  # 服务商类型 -> 时间
+        self.failovers = 0
+
+    def order(self, providers):
+        """
+        providers: [{'type', 'url', 'model', 'api_key'}, ...]，第一个为主服务商
+        返回本次尝试的顺序：近期胜出的排最前，近期失败的排最后，其余保持配置顺序
+        """
+        now = time.monotonic()
+
+        def rank(item):
+            index, provider = item
+            if provider['type'] == self._preferred and now < self._preferred_until:
+                return (0, index)
+            if now < self._down_until.get(provider['type'], 0.0):
+                return (2, index)
+            return (1, index)
+        return [p for _, p in sorted(enumerate(providers), key=rank)]
+
+    async def connect(self, providers, connect):
+        """
+        按 order() 的顺序错峰调用 connect(provider)，返回 (provider, client)；全部失败时抛出最后一个异常
+        """
+        candidates = self.order(providers)
+        tasks = {}  # task -> provider
+        winner = None
+        last_error = None
+        next_index = 0
+        try:
+            while winner is None:
+                if next_index < len(candidates):
+                    provider = candidates[next_index]
+                    next_index += 1
+                    task = asyncio.create_task(self._connect_one(connect, provider))
+                    tasks[task] = provider
+                if not tasks:
+                    break
+                stagger = PROVIDER_STAGGER if next_index < len(candidates) else None
+                done, _ = await asyncio.wait(tasks, timeout=stagger, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = tasks.pop(task)
+                    try:
+                        client = task.result()
+                    except Exception as e:
+                        last_error = e
+                        self._down_until[provider['type']] = time.monotonic() + PROVIDER_DOWN_SECONDS
+                        logger.warning(f"⚠️ {self.name}: Realtime服务商 {provider['type']} 连接失败: {e}")
+                        continue
+                    if winner is None:
+                        winner = (provider, client)
+                    else:
+                        asyncio.create_task(self._close(client))
+        finally:
+            # 取消仍在建连的候选；取消前刚好连上的连接也要关闭
+            for task in tasks:
+                task.cancel()
+            for result in await asyncio.gather(*tasks, return_exceptions=True):
+                if not isinstance(result, BaseException):
+                    await self._close(result)
+
+        if winner is None:
+            raise last_error or ConnectionError("No realtime provider configured")
+        provider, client = winner
+        self._down_until.pop(provider['type'], None)
+        if provider['type'] != providers[0]['type'] and provider['type'] != self.stats()['preferred']:
+            self.failovers += 1
+            logger.warning(f"🔀 {self.name}: 主服务商不可用，已切换到 {provider['type']}，"
+                           f"{PROVIDER_STICKY_SECONDS:.0f}s 内优先使用")
+        self._preferred = provider['type']
+        self._preferred_until = time.monotonic() + PROVIDER_STICKY_SECONDS
+        return provider, client
+
+    async def _connect_one(self, connect, provider):
+        """
+        带超时地调用 connect(provider)。超时或被取消时，握手可能恰好已经完成，
+        asyncio.wait_for 在这种情况下会丢掉结果（Python 3.11），这里等待它结束并关闭多出来的连接
+        """
+        inner = asyncio.ensure_future(connect(provider))
+        try:
+            return await asyncio.wait_for(asyncio.shield(inner), PROVIDER_CONNECT_TIMEOUT)
+        except BaseException:
+            inner.cancel()
+            result = (await asyncio.gather(inner, return_exceptions=True))[0]
+            if not isinstance(result, BaseException):
+                await self._close(result)
+            raise
+
+    def report_failure(self, provider_type, reason=None):
+        """已建立的session报告了不可恢复的错误：标记该服务商不可用，并取消它的优先使用"""
+        self._down_until[provider_type] = time.monotonic() + PROVIDER_DOWN_SECONDS
+        if self._preferred == provider_type:
+            self._preferred = None
+            self._preferred_until = 0.0
+        logger.warning(f"⚠️ {self.name}: Realtime服务商 {provider_type} 报告不可恢复的错误，"
+                       f"{PROVIDER_DOWN_SECONDS:.0f}s 内不再优先使用: {reason}")
+
+    @staticmethod
+    async def _close(client):
+        try:
+            await client.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'preferred': self._preferred if now < self._preferred_until else None,
+            'down': [t for t, until in self._down_until.items() if now < until],
+            'failovers': self.failovers,
+        }
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+预热的Realtime备用连接池
+每个角色保留少量已经建立WebSocket连接、并已用最新instructions完成 session.update 的 OmniRealtimeClient。
+start_session 和热切换直接取用备用连接，只需要在instructions变化时补发一次 session.update，
+不必在用户等待时重新握手。备用连接在服务商空闲超时之前会被替换，长时间无人使用时整个池子自动停止。
+"""
+import asyncio
+import logging
+import time
+
+from main_helper.omni_realtime_client import OmniRealtimeClient
+
+logger = logging.getLogger(__name__)
+
+STANDBY_POOL_SIZE = 1
+# 备用连接的最长存活时间（秒），需要小于服务商的空闲断开时间
+STANDBY_MAX_AGE = 240.0
+# 维护循环的检查间隔（秒）
+STANDBY_CHECK_INTERVAL = 5.0
+# 超过这么久没有取用，停止维护并关闭所有备用连接（秒）
+STANDBY_IDLE_TIMEOUT = 900.0
+# 建连失败后的退避时间（秒）
+STANDBY_RETRY_DELAY = 30.0
+
+
+class RealtimeStandbyPool:
+    def __init__(self, name, size=STANDBY_POOL_SIZE, max_age=STANDBY_MAX_AGE):
+        self.name = name
+        self.size = size
+        self.max_age = max_age
+        self._spec = None  # (base_url, api_key, model, native_audio)
+        self._instructions = None
+        self._standby = []
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self._last_used = time.monotonic()
+        self._retry_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, base_url, api_key, model, instructions, native_audio=True):
+        """记录最新的连接参数和instructions，并确保维护循环在运行"""
+        spec = (base_url, api_key, model, native_audio)
+        if spec != self._spec:
+            # 配置变了（换了模型或Key），旧的备用连接作废
+            self._spec = spec
+            self._retry_at = 0.0
+            self._discard_all()
+        self._instructions = instructions
+        self._last_used = time.monotonic()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._maintain())
+        self._wakeup.set()
+
+    def acquire(self, base_url, api_key, model, native_audio=True):
+        """
+        取出一个可用的备用连接，instructions是否需要更新由调用方检查（client.instructions）
+        没有匹配的备用连接时返回None，由调用方自行冷启动
+        """
+        spec = (base_url, api_key, model, native_audio)
+        self._last_used = time.monotonic()
+        client = None
+        while self._standby:
+            candidate = self._standby.pop(0)
+            if spec == self._spec and self._is_fresh(candidate):
+                client = candidate
+                break
+            asyncio.create_task(self._close(candidate))
+        self._wakeup.set()
+        if client is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.info(f"♻️ {self.name}: 使用预热的Realtime连接（已连接 {time.monotonic() - client.connected_at:.0f}s）")
+        return client
+
+    def _is_fresh(self, client):
+        return client.is_connected and time.monotonic() - client.connected_at < self.max_age
+
+    async def _maintain(self):
+        try:
+            while time.monotonic() - self._last_used < STANDBY_IDLE_TIMEOUT:
+                # 替换即将超时或已经断开的连接
+                for client in [c for c in self._standby if not self._is_fresh(c)]:
+                    self._standby.remove(client)
+                    await self._close(client)
+                if self._spec and len(self._standby) < self.size and time.monotonic() >= self._retry_at:
+                    await self._fill_one()
+                    continue
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=STANDBY_CHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            logger.info(f"{self.name}: 备用连接长时间未使用，停止预热")
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._discard_all()
+
+    async def _fill_one(self):
+        spec = self._spec
+        base_url, api_key, model, native_audio = spec
+        client = OmniRealtimeClient(base_url=base_url, api_key=api_key, model=model)
+        try:
+            await client.connect(self._instructions, native_audio=native_audio)
+        except Exception as e:
+            logger.warning(f"⚠️ {self.name}: 预热Realtime连接失败，{STANDBY_RETRY_DELAY:.0f}s 后重试: {e}")
+            self._retry_at = time.monotonic() + STANDBY_RETRY_DELAY
+            await self._close(client)
+            return
+        if spec != self._spec:
+            # 建连期间配置发生了变化
+            await self._close(client)
+            return
+        self._standby.append(client)
+        logger.debug(f"{self.name}: 备用Realtime连接已就绪 ({len(self._standby)}/{self.size})")
+
+    def _discard_all(self):
+        standby, self._standby = self._standby, []
+        for client in standby:
+            asyncio.create_task(self._close(client))
+
+    @staticmethod
+    async def _close(client):
+        try:
+            await client.close()
+        except Exception:
+            pass
+
+    async def close(self):
+        """停止维护并关闭所有备用连接"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        standby, self._standby = self._standby, []
+        for client in standby:
+            await self._close(client)
+
+    def stats(self):
+        return {
+            'standby': len(self._standby),
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'running': self._task is not None and not self._task.done(),
+        }
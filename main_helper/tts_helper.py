@@ -3,7 +3,6 @@ TTS Helper模块
 负责处理TTS语音合成，支持自定义音色（阿里云CosyVoice）和默认音色（各core_api的原生TTS）
 """
 import numpy as np
-from librosa import resample
 import time
 import asyncio
 import json
@@ -17,6 +16,7 @@ import io
 import wave
 import aiohttp
 from functools import partial
+from utils.resampler import StreamingResampler
 logger = logging.getLogger(__name__)
 
 
@@ -27,7 +27,7 @@ def step_realtime_tts_worker(request_queue, response_queue, audio_api_key, voice
     
     Args:
         request_queue: 多进程请求队列，接收(speech_id, text)元组
-        response_queue: 多进程响应队列，发送音频数据
+        response_queue: 多进程响应队列，发送(speech_id, 音频数据)元组
         audio_api_key: API密钥
         voice_id: 音色ID，默认使用"qingchunshaonv"
     """
@@ -48,6 +48,7 @@ def step_realtime_tts_worker(request_queue, response_queue, audio_api_key, voice
         receive_task = None
         session_id = None
         session_ready = asyncio.Event()
+        resampler = StreamingResampler(24000, 48000)
         
         try:
             # 连接WebSocket
@@ -117,7 +118,7 @@ def step_realtime_tts_worker(request_queue, response_queue, audio_api_key, voice
             except asyncio.TimeoutError:
                 logger.warning("会话创建超时")
             
-            # 初始接收任务
+            # 初始接收任务（此时还没有speech_id，第一次收到文本时会被替换）
             async def receive_messages_initial():
                 """初始接收任务"""
                 try:
@@ -142,8 +143,7 @@ def step_realtime_tts_worker(request_queue, response_queue, audio_api_key, voice
                                     # 转换为 numpy 数组
                                     audio_array = np.frombuffer(pcm_data, dtype=np.int16)
                                     # 重采样 24000Hz -> 48000Hz
-                                    resampled = np.repeat(audio_array, 48000 // 24000)
-                                    response_queue.put(resampled.tobytes())
+                                    response_queue.put((current_speech_id, resampler.process(audio_array).tobytes()))
                             except Exception as e:
                                 logger.error(f"处理音频数据时出错: {e}")
                 except websockets.exceptions.ConnectionClosed:
@@ -177,6 +177,7 @@ def step_realtime_tts_worker(request_queue, response_queue, audio_api_key, voice
                 # 新的语音ID，重新建立连接
                 if current_speech_id != sid:
                     current_speech_id = sid
+                    resampler.reset()
                     if ws:
                         try:
                             await ws.close()
@@ -229,8 +230,8 @@ def step_realtime_tts_worker(request_queue, response_queue, audio_api_key, voice
                             }
                         }))
                         
-                        # 启动新的接收任务
-                        async def receive_messages():
+                        # 启动新的接收任务，音频带上所属的speech_id
+                        async def receive_messages(sid=sid):
                             try:
                                 async for message in ws:
                                     event = json.loads(message)
@@ -251,9 +252,11 @@ def step_realtime_tts_worker(request_queue, response_queue, audio_api_key, voice
                                                 
                                                 # 转换为 numpy 数组
                                                 audio_array = np.frombuffer(pcm_data, dtype=np.int16)
+                                                # 已被新的speech_id取代的音频直接丢弃
+                                                if sid != current_speech_id:
+                                                    continue
                                                 # 重采样 24000Hz -> 48000Hz
-                                                resampled = np.repeat(audio_array, 48000 // 24000)
-                                                response_queue.put(resampled.tobytes())
+                                                response_queue.put((sid, resampler.process(audio_array).tobytes()))
                                         except Exception as e:
                                             logger.error(f"处理音频数据时出错: {e}")
                             except websockets.exceptions.ConnectionClosed:
@@ -318,7 +321,7 @@ def qwen_realtime_tts_worker(request_queue, response_queue, audio_api_key, voice
     
     Args:
         request_queue: 多进程请求队列，接收(speech_id, text)元组
-        response_queue: 多进程响应队列，发送音频数据
+        response_queue: 多进程响应队列，发送(speech_id, 音频数据)元组
         audio_api_key: API密钥
         voice_id: 音色ID，默认使用"Cherry"
     """
@@ -334,6 +337,7 @@ def qwen_realtime_tts_worker(request_queue, response_queue, audio_api_key, voice
         current_speech_id = None
         receive_task = None
         session_ready = asyncio.Event()
+        resampler = StreamingResampler(24000, 48000)
         
         try:
             # 连接WebSocket
@@ -403,8 +407,7 @@ def qwen_realtime_tts_worker(request_queue, response_queue, audio_api_key, voice
                             try:
                                 audio_bytes = base64.b64decode(event.get("delta", ""))
                                 audio_array = np.frombuffer(audio_bytes, dtype=np.int16)
-                                resampled = np.repeat(audio_array, 2)
-                                response_queue.put(resampled.tobytes())
+                                response_queue.put((current_speech_id, resampler.process(audio_array).tobytes()))
                             except Exception as e:
                                 logger.error(f"处理音频数据时出错: {e}")
                 except websockets.exceptions.ConnectionClosed:
@@ -439,6 +442,7 @@ def qwen_realtime_tts_worker(request_queue, response_queue, audio_api_key, voice
                 # 直接关闭旧连接，打断旧语音
                 if current_speech_id != sid:
                     current_speech_id = sid
+                    resampler.reset()
                     if ws:
                         try:
                             await ws.close()
@@ -479,8 +483,8 @@ def qwen_realtime_tts_worker(request_queue, response_queue, audio_api_key, voice
                         except asyncio.TimeoutError:
                             logger.warning("新会话创建超时")
                         
-                        # 启动新的接收任务
-                        async def receive_messages():
+                        # 启动新的接收任务，音频带上所属的speech_id
+                        async def receive_messages(sid=sid):
                             try:
                                 async for message in ws:
                                     event = json.loads(message)
@@ -489,11 +493,13 @@ def qwen_realtime_tts_worker(request_queue, response_queue, audio_api_key, voice
                                     if event_type == "error":
                                         logger.error(f"TTS错误: {event}")
                                     elif event_type == "response.audio.delta":
+                                        if sid != current_speech_id:
+                                            # 已被新的speech_id取代的音频直接丢弃
+                                            continue
                                         try:
                                             audio_bytes = base64.b64decode(event.get("delta", ""))
                                             audio_array = np.frombuffer(audio_bytes, dtype=np.int16)
-                                            resampled = np.repeat(audio_array, 2)
-                                            response_queue.put(resampled.tobytes())
+                                            response_queue.put((sid, resampler.process(audio_array).tobytes()))
                                         except Exception as e:
                                             logger.error(f"处理音频数据时出错: {e}")
                             except websockets.exceptions.ConnectionClosed:
@@ -554,7 +560,7 @@ def cosyvoice_vc_tts_worker(request_queue, response_queue, audio_api_key, voice_
     
     Args:
         request_queue: 多进程请求队列，接收(speech_id, text)元组
-        response_queue: 多进程响应队列，发送音频数据
+        response_queue: 多进程响应队列，发送(speech_id, 音频数据)元组
         audio_api_key: API密钥
         voice_id: 音色ID
     """
@@ -564,18 +570,18 @@ def cosyvoice_vc_tts_worker(request_queue, response_queue, audio_api_key, voice_
     dashscope.api_key = audio_api_key
     
     class Callback(ResultCallback):
-        def __init__(self, response_queue):
+        def __init__(self, response_queue, speech_id=None):
             self.response_queue = response_queue
-            self.cache = np.zeros(0).astype(np.float32)
+            # 每个synthesizer使用独立的callback，旧synthesizer迟到的音频仍带着旧的speech_id
+            self.speech_id = speech_id
+            # 流式重采样器跨chunk保留状态，不需要再攒够8000个采样点才重采样
+            self.resampler = StreamingResampler(24000, 48000)
             
         def on_open(self): 
             pass
             
         def on_complete(self): 
-            if len(self.cache) > 0:
-                data = (resample(self.cache, orig_sr=24000, target_sr=48000) * 32768.).clip(-32768, 32767).astype(np.int16).tobytes()
-                self.response_queue.put(data)
-                self.cache = np.zeros(0).astype(np.float32)
+            self.resampler.reset()
                 
         def on_error(self, message: str): 
             print(f"TTS Error: {message}")
@@ -587,15 +593,8 @@ def cosyvoice_vc_tts_worker(request_queue, response_queue, audio_api_key, voice_
             pass
             
         def on_data(self, data: bytes) -> None:
-            audio = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
-            self.cache = np.concatenate([self.cache, audio])
-            if len(self.cache) >= 8000:
-                data = self.cache[:8000]
-                data = (resample(data, orig_sr=24000, target_sr=48000) * 32768.).clip(-32768, 32767).astype(np.int16).tobytes()
-                self.response_queue.put(data)
-                self.cache = self.cache[8000:]
+            self.response_queue.put((self.speech_id, self.resampler.process_bytes(data)))
             
-    callback = Callback(response_queue)
     current_speech_id = None
     synthesizer = None
     
@@ -618,6 +617,7 @@ def cosyvoice_vc_tts_worker(request_queue, response_queue, audio_api_key, voice_
             
         if current_speech_id is None or current_speech_id != sid or synthesizer is None:
             current_speech_id = sid
+            callback = Callback(response_queue, sid)
             try:
                 if synthesizer is not None:
                     try:
@@ -660,7 +660,7 @@ def cogtts_tts_worker(request_queue, response_queue, audio_api_key, voice_id):
     
     Args:
         request_queue: 多进程请求队列，接收(speech_id, text)元组
-        response_queue: 多进程响应队列，发送音频数据
+        response_queue: 多进程响应队列，发送(speech_id, 音频数据)元组
         audio_api_key: API密钥
         voice_id: 音色ID，默认使用"tongtong"（支持：tongtong, chuichui, xiaochen, jam, kazi, douji, luodo）
     """
@@ -721,6 +721,7 @@ def cogtts_tts_worker(request_queue, response_queue, audio_api_key, voice_id):
                                             # 使用缓冲区逐块读取，避免 "Chunk too big" 错误
                                             buffer = ""
                                             first_audio_received = False  # 用于调试第一个音频块
+                                            resampler = None  # 每段合成一个新的流式重采样器
                                             async for chunk in resp.content.iter_any():
                                                 # 解码并添加到缓冲区
                                                 buffer += chunk.decode('utf-8')
@@ -777,11 +778,13 @@ def cogtts_tts_worker(request_queue, response_queue, audio_api_key, voice_id):
                                                                             fade_curve = np.linspace(0.0, 1.0, fade_samples)
                                                                             audio_array[:fade_samples] *= fade_curve
                                                                     
-                                                                    # 使用 librosa 进行高质量重采样
-                                                                    resampled = resample(audio_array, orig_sr=sample_rate, target_sr=48000)
+                                                                    # 流式重采样，块之间保留滤波器状态；采样率变化时重建
+                                                                    if resampler is None or resampler.orig_sr != int(sample_rate):
+                                                                        resampler = StreamingResampler(sample_rate, 48000)
+                                                                    resampled = resampler.process(audio_array)
                                                                     # 转回 int16 格式
                                                                     resampled_int16 = (resampled * 32768.0).clip(-32768, 32767).astype(np.int16)
-                                                                    response_queue.put(resampled_int16.tobytes())
+                                                                    response_queue.put((current_speech_id, resampled_int16.tobytes()))
                                                         except json.JSONDecodeError as e:
                                                             logger.warning(f"解析SSE JSON失败: {e}")
                                                         except Exception as e:
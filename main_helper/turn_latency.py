@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+语音回合的延迟时间线
+每一轮从用户说完话（speech_stopped，文本模式下为发送文本）开始，记录关键路径上各阶段第一次发生的时间：
+模型的第一个增量、第一次向TTS发送文本、TTS返回的第一块音频、第一次向浏览器推送音频。
+完成的时间线保存在环形缓冲区中，按阶段统计 p50/p95/p99，由 main_server 通过 /api/latency 暴露。
+"""
+import math
+import time
+from collections import deque
+
+# 按关键路径上的先后顺序排列，第一个阶段是计时起点
+TURN_STAGES = ('speech_stopped', 'first_delta', 'first_tts_request', 'first_tts_audio', 'first_ws_send')
+TURN_HISTORY_SIZE = 200
+
+
+def _percentile(sorted_values, pct):
+    """最近秩法，sorted_values 需已排序且非空"""
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+class TurnLatencyTracker:
+    def __init__(self, history_size=TURN_HISTORY_SIZE):
+        self.history = deque(maxlen=history_size)  # 每项: {stage: 相对起点的毫秒数}
+        self._current = None  # 当前回合: {stage: time.perf_counter()}
+        self._started_at = None
+        self.turns = 0
+
+    def start_turn(self):
+        """开始新的一轮；上一轮如果还没推送音频（例如纯文本回复），按已有阶段归档"""
+        self._commit()
+        self._current = {TURN_STAGES[0]: time.perf_counter()}
+        self._started_at = time.time()
+
+    def mark(self, stage):
+        """记录阶段在本轮中第一次发生的时间"""
+        current = self._current
+        if current is None or stage in current:
+            return
+        current[stage] = time.perf_counter()
+        if stage == TURN_STAGES[-1]:
+            self._commit()
+
+    def _commit(self):
+        current, self._current = self._current, None
+        if not current or len(current) < 2:
+            return
+        origin = current[TURN_STAGES[0]]
+        timeline = {stage: round((current[stage] - origin) * 1000, 1) for stage in TURN_STAGES[1:] if stage in current}
+        timeline['at'] = self._started_at
+        self.history.append(timeline)
+        self.turns += 1
+
+    def summary(self):
+        """各阶段相对起点的 p50/p95/p99（毫秒）"""
+        stages = {}
+        for stage in TURN_STAGES[1:]:
+            values = sorted(t[stage] for t in self.history if stage in t)
+            if not values:
+                continue
+            stages[stage] = {
+                'count': len(values),
+                'p50': _percentile(values, 50),
+                'p95': _percentile(values, 95),
+                'p99': _percentile(values, 99),
+            }
+        return {'turns': self.turns, 'window': len(self.history), 'stages': stages}
+
+    def recent(self, n=20):
+        return list(self.history)[-n:]
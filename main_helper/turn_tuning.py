@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+自适应的说话结束判定
+服务端VAD在用户静音 silence_duration_ms 后判定一轮结束。固定的500ms会截断说话慢、停顿多的用户，
+对说话干脆的用户又多等了一段时间。这里根据 speech_started / speech_stopped 的时间学习用户的停顿习惯：
+判定说话结束后用户很快又开口（通常会打断刚开始的回复），说明这次停顿只是句中停顿，被误判为结束，
+记录这次停顿的长度并调大静音时长；正常结束的回合则缓慢调小，直到接近用户句中停顿的上沿。
+结果限制在 [MIN_SILENCE_MS, MAX_SILENCE_MS] 之内，由 OmniRealtimeClient 通过 session.update 下发。
+"""
+import time
+from collections import deque
+
+# 服务商默认的静音时长（毫秒）
+DEFAULT_SILENCE_MS = 500
+# 调整范围（毫秒），上限需要小于静音抑制的拖尾 GATE_HANGOVER_MS，否则服务端永远等不到足够的静音
+MIN_SILENCE_MS = 300
+MAX_SILENCE_MS = 1000
+# 判定结束后这么久之内用户又开口，视为误判（毫秒）
+CUTOFF_WINDOW_MS = 1500
+# 误判后至少增加的时长 / 正常结束后减少的时长（毫秒）
+STEP_UP_MS = 150
+# 两者之比决定了长期的误判率：约 STEP_DOWN_MS / (STEP_UP_MS + STEP_DOWN_MS)，这里约为5%
+STEP_DOWN_MS = 8
+# 误判后至少比这次句中停顿多留的余量（毫秒）
+PAUSE_MARGIN_MS = 100
+# 保留的句中停顿记录数
+PAUSE_HISTORY = 30
+# 变化小于这个值时不发送 session.update（毫秒）
+MIN_UPDATE_MS = 50
+
+
+class EndOfTurnTuner:
+    """按角色保存，跨session保留学到的停顿习惯；调用需要在同一个事件循环中串行"""
+
+    def __init__(self, silence_ms=DEFAULT_SILENCE_MS):
+        self.silence_ms = silence_ms  # 当前建议值
+        self.applied_ms = silence_ms  # 最近一次下发给服务端的值
+        self.pauses = deque(maxlen=PAUSE_HISTORY)  # 被误判为结束的句中停顿（毫秒）
+        self._stopped_at = None
+        self.turns = 0
+        self.cutoffs = 0
+
+    def speech_stopped(self):
+        """服务端判定用户说完"""
+        self._stopped_at = time.monotonic()
+
+    def speech_started(self):
+        """
+        用户开始说话。对上一次 speech_stopped 做出判断，
+        需要更新服务端配置时返回新的静音时长（毫秒），否则返回None
+        """
+        stopped_at, self._stopped_at = self._stopped_at, None
+        if stopped_at is None:
+            return None
+        gap_ms = (time.monotonic() - stopped_at) * 1000
+        self.turns += 1
+        if gap_ms < CUTOFF_WINDOW_MS:
+            # 服务端等了 applied_ms 的静音后判定结束，用户又过了 gap_ms 才继续说
+            self.cutoffs += 1
+            pause_ms = self.applied_ms + gap_ms
+            self.pauses.append(pause_ms)
+            target = max(self.silence_ms + STEP_UP_MS, pause_ms + PAUSE_MARGIN_MS)
+        else:
+            target = self.silence_ms - STEP_DOWN_MS
+        self.silence_ms = int(min(MAX_SILENCE_MS, max(MIN_SILENCE_MS, target)))
+        if abs(self.silence_ms - self.applied_ms) < MIN_UPDATE_MS:
+            return None
+        return self.silence_ms
+
+    def applied(self, silence_ms):
+        """记录服务端当前实际使用的静音时长"""
+        self.applied_ms = silence_ms
+
+    def stats(self):
+        return {
+            'silence_ms': self.silence_ms,
+            'applied_ms': self.applied_ms,
+            'turns': self.turns,
+            'cutoffs': self.cutoffs,
+            'cutoff_rate': self.cutoffs / self.turns if self.turns else 0.0,
+            'recent_pauses_ms': [round(p) for p in list(self.pauses)[-5:]],
+        }
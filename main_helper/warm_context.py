@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+本地保存的预热上下文
+每次从 memory_server 成功获取 /new_dialog 的内容后，按角色写入记忆目录下的 warm_context/，
+memory_server 响应过慢或正在重启时，start_session 先用这份上一次的上下文启动，
+新的记忆到达后再注入到正在进行的session中。
+"""
+import json
+import logging
+import os
+import time
+
+from utils.config_manager import get_config_manager
+
+logger = logging.getLogger(__name__)
+
+# 超过这个时间（秒）的本地上下文不再使用
+WARM_CONTEXT_MAX_AGE = 3 * 24 * 3600
+
+
+def _warm_context_path(lanlan_name):
+    return get_config_manager().memory_dir / 'warm_context' / f'{lanlan_name}.json'
+
+
+def load_warm_context(lanlan_name, max_age=WARM_CONTEXT_MAX_AGE):
+    """读取角色上一次成功获取的记忆上下文，不存在或过期时返回None"""
+    path = _warm_context_path(lanlan_name)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"读取预热上下文失败: {e}")
+        return None
+    if time.time() - data.get('saved_at', 0) > max_age:
+        return None
+    return data.get('text')
+
+
+def save_warm_context(lanlan_name, text):
+    """原子地写入角色最新的记忆上下文"""
+    path = _warm_context_path(lanlan_name)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'saved_at': time.time(), 'text': text}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"保存预热上下文失败: {e}")
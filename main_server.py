@@ -26,8 +26,10 @@ from dashscope.audio.tts_v2 import VoiceEnrollmentService
 import requests
 import httpx
 import pathlib, wave
-from openai import AsyncOpenAI
-from config import get_character_data, get_core_config, MAIN_SERVER_PORT, MONITOR_SERVER_PORT, MODELS_WITH_EXTRA_BODY, load_characters, save_characters, TOOL_SERVER_PORT, CORE_CONFIG_PATH
+from utils.llm_client import get_async_openai
+from utils.audio import parse_mic_frame
+from utils.llm_scheduler import get_llm_scheduler, estimate_tokens, Priority
+from config import get_character_data, get_core_config, MAIN_SERVER_PORT, MONITOR_SERVER_PORT, MODELS_WITH_EXTRA_BODY, load_characters, save_characters, TOOL_SERVER_PORT, CORE_CONFIG_PATH, invalidate_config_cache, REALTIME_PROVIDERS
 from config.prompts_sys import emotion_analysis_prompt
 import glob
 
@@ -226,6 +228,7 @@ async def get_core_config_api():
             "assistApiKeyGlm": core_cfg.get('assistApiKeyGlm', ''),
             "assistApiKeyStep": core_cfg.get('assistApiKeyStep', ''),
             "assistApiKeySilicon": core_cfg.get('assistApiKeySilicon', ''),
+            "coreApiFallbacks": core_cfg.get('coreApiFallbacks', []),
             "mcpToken": core_cfg.get('mcpToken', ''),  # 添加mcpToken字段
             "success": True
         }
@@ -283,10 +286,25 @@ async def update_core_config(request: Request):
             core_cfg['assistApiKeyStep'] = data['assistApiKeyStep']
         if 'assistApiKeySilicon' in data:
             core_cfg['assistApiKeySilicon'] = data['assistApiKeySilicon']
+        if 'coreApiFallbacks' in data:
+            fallbacks = data['coreApiFallbacks'] or []
+            if not isinstance(fallbacks, list) or any(t not in REALTIME_PROVIDERS for t in fallbacks):
+                return {"success": False, "error": "备用服务商无效"}
+            core_cfg['coreApiFallbacks'] = fallbacks
+        else:
+            # 设置页面目前不编辑备用服务商，保留原有配置
+            try:
+                with open(CORE_CONFIG_PATH, 'r', encoding='utf-8') as f:
+                    previous = json.load(f).get('coreApiFallbacks')
+                if previous:
+                    core_cfg['coreApiFallbacks'] = previous
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
         if 'mcpToken' in data:
             core_cfg['mcpToken'] = data['mcpToken']
         with open(CORE_CONFIG_PATH, 'w', encoding='utf-8') as f:
             json.dump(core_cfg, f, indent=2, ensure_ascii=False)
+        invalidate_config_cache('core_config.json')
         
         return {"success": True, "message": "API Key已保存"}
     except Exception as e:
@@ -369,12 +387,25 @@ async def websocket_endpoint(websocket: WebSocket, lanlan_name: str):
 
     try:
         while True:
-            data = await websocket.receive_text()
+            packet = await websocket.receive()
+            if packet["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(packet.get("code", 1000))
             if session_id[lanlan_name] != this_session_id:
                 await session_manager[lanlan_name].send_status(f"切换至另一个终端...")
                 await websocket.close()
                 break
-            message = json.loads(data)
+
+            # 二进制帧：麦克风PCM16，跳过JSON解析直接交给session
+            if packet.get("bytes") is not None:
+                try:
+                    frame = parse_mic_frame(packet["bytes"])
+                except ValueError as e:
+                    logger.warning(f"忽略无效的二进制音频帧: {e}")
+                    continue
+                asyncio.create_task(session_manager[lanlan_name].stream_data(frame))
+                continue
+
+            message = json.loads(packet["text"])
             action = message.get("action")
             # logger.debug(f"WebSocket received action: {action}") # Optional debug log
 
@@ -1120,6 +1151,7 @@ async def update_review_config(request: Request):
         # 保存配置
         with open(config_path, 'w', encoding='utf-8') as f:
             json.dump(config_data, f, ensure_ascii=False, indent=2)
+        invalidate_config_cache('core_config.json')
         
         logger.info(f"记忆审阅配置已更新: enabled={enabled}")
         return {"success": True, "enabled": enabled}
@@ -1503,7 +1535,7 @@ async def emotion_analysis(request: Request):
             return {"error": "模型名称未提供且配置中未设置默认模型"}
         
         # 创建异步客户端
-        client = AsyncOpenAI(api_key=api_key, base_url=core_config['OPENROUTER_URL'])
+        client = get_async_openai(api_key=api_key, base_url=core_config['OPENROUTER_URL'])
         
         # 构建请求消息
         messages = [
@@ -1529,7 +1561,8 @@ async def emotion_analysis(request: Request):
         if model in MODELS_WITH_EXTRA_BODY:
             request_params["extra_body"] = {"enable_thinking": False}
         
-        response = await client.chat.completions.create(**request_params)
+        async with get_llm_scheduler().slot(core_config['OPENROUTER_URL'], Priority.FOREGROUND, estimate_tokens(text)):
+            response = await client.chat.completions.create(**request_params)
         
         # 解析响应
         result_text = response.choices[0].message.content.strip()
@@ -1579,6 +1612,18 @@ async def emotion_analysis(request: Request):
             "confidence": 0.0
         }
 
+@app.get('/api/latency')
+async def get_turn_latency(recent: int = 0):
+    """各角色语音回合关键路径各阶段（相对speech_stopped）的 p50/p95/p99 延迟（毫秒）"""
+    result = {}
+    for name, mgr in session_manager.items():
+        result[name] = mgr.turn_latency.summary()
+        result[name]['bringup'] = mgr.bringup_timings
+        result[name]['tts_frames_dropped'] = mgr.tts_frames_dropped
+        if recent:
+            result[name]['recent'] = mgr.turn_latency.recent(recent)
+    return JSONResponse(content=result)
+
 @app.get('/memory_browser', response_class=HTMLResponse)
 async def memory_browser(request: Request):
     return templates.TemplateResponse('templates/memory_browser.html', {"request": request})
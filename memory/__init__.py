@@ -3,3 +3,4 @@ from .router import MemoryQueryRouter
 from .semantic import SemanticMemory
 from .settings import ImportantSettingsManager
 from .timeindex import TimeIndexedMemory
+from .ingest import TurnJournal
@@ -0,0 +1,173 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from utils.config_manager import get_config_manager
+
+# 每个角色保留的已finalize的session_id数量，用于拒绝迟到或重试的上传
+FINALIZED_SESSIONS_LIMIT = 256
+
+
+class TurnJournal:
+    """
+    逐轮写入的对话日志。sync connector每完成一轮对话就通过 /ingest 流式上传，
+    这里按 (角色, session_id) 归档并立即落盘，session结束时再由 /finalize 统一交给记忆模块处理。
+    即使connector在会话中途退出，已上传的轮次也会保留在磁盘上，之后由过期清扫补处理。
+
+    每条轮次记录的格式：
+        {"session_id": str, "key": str, "seq": int, "role": str, "content": list|str}
+    其中key是幂等键，同一个key重复上传只会被记录一次。
+    已经finalize的session会留下墓碑记录 {"session_id": str, "finalized": true}，之后再上传的轮次一律忽略。
+    处理过程中已完成的步骤记为 {"session_id": str, "step": str}，处理失败重试时跳过这些步骤。
+    """
+    def __init__(self, journal_dir=None):
+        if journal_dir is None:
+            journal_dir = str(get_config_manager().memory_dir)
+        self.journal_dir = journal_dir
+        # {lanlan_name: {session_id: OrderedDict{key: turn}}}
+        self.sessions = {}
+        # {lanlan_name: OrderedDict{session_id: None}}，已finalize的session
+        self.finalized = {}
+        # {lanlan_name: {session_id: set(step)}}，尚未finalize的session中已完成的处理步骤
+        self.steps = {}
+
+    def _journal_path(self, lanlan_name):
+        return os.path.join(self.journal_dir, f'ingest_{lanlan_name}.ndjson')
+
+    def _load(self, lanlan_name):
+        if lanlan_name in self.sessions:
+            return self.sessions[lanlan_name]
+        sessions = {}
+        finalized = OrderedDict()
+        steps = {}
+        path = self._journal_path(lanlan_name)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        turn = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 进程崩溃时最后一行可能不完整，跳过即可
+                        continue
+                    if turn.get('finalized'):
+                        finalized[turn['session_id']] = None
+                        continue
+                    if 'step' in turn:
+                        steps.setdefault(turn['session_id'], set()).add(turn['step'])
+                        continue
+                    sessions.setdefault(turn['session_id'], OrderedDict())[turn['key']] = turn
+        for session_id in finalized:
+            sessions.pop(session_id, None)
+            steps.pop(session_id, None)
+        while len(finalized) > FINALIZED_SESSIONS_LIMIT:
+            finalized.popitem(last=False)
+        self.sessions[lanlan_name] = sessions
+        self.finalized[lanlan_name] = finalized
+        self.steps[lanlan_name] = steps
+        return sessions
+
+    def _rewrite(self, lanlan_name):
+        sessions = self.sessions.get(lanlan_name, {})
+        finalized = self.finalized.get(lanlan_name, {})
+        steps = self.steps.get(lanlan_name, {})
+        path = self._journal_path(lanlan_name)
+        if not sessions and not finalized:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(self.journal_dir, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for session_id in finalized:
+                f.write(json.dumps({'session_id': session_id, 'finalized': True}) + '\n')
+            for session_id, turns in sessions.items():
+                for turn in turns.values():
+                    f.write(json.dumps(turn, ensure_ascii=False) + '\n')
+                for step in sorted(steps.get(session_id, ())):
+                    f.write(json.dumps({'session_id': session_id, 'step': step}) + '\n')
+        os.replace(tmp_path, path)
+
+    def append(self, lanlan_name, turns):
+        """
+        追加一批轮次，已存在的幂等键以及已finalize的session的轮次会被忽略
+        :return: (accepted, duplicates)
+        """
+        sessions = self._load(lanlan_name)
+        finalized = self.finalized[lanlan_name]
+        accepted = []
+        duplicates = 0
+        now = time.time()
+        for turn in turns:
+            if turn['session_id'] in finalized:
+                duplicates += 1
+                continue
+            session = sessions.setdefault(turn['session_id'], OrderedDict())
+            if turn['key'] in session:
+                duplicates += 1
+                continue
+            turn = dict(turn, received_at=now)
+            session[turn['key']] = turn
+            accepted.append(turn)
+        if accepted:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            with open(self._journal_path(lanlan_name), 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(turn, ensure_ascii=False) + '\n' for turn in accepted))
+        return len(accepted), duplicates
+
+    def get_session(self, lanlan_name, session_id):
+        """按seq顺序返回某个session的全部轮次（role/content格式，可直接交给convert_to_messages）"""
+        turns = self._load(lanlan_name).get(session_id, {})
+        ordered = sorted(turns.values(), key=lambda t: t.get('seq', 0))
+        return [{'role': t['role'], 'content': t['content']} for t in ordered]
+
+    def completed_steps(self, lanlan_name, session_id):
+        """返回该session已完成的处理步骤"""
+        self._load(lanlan_name)
+        return set(self.steps[lanlan_name].get(session_id, ()))
+
+    def mark_step(self, lanlan_name, session_id, step):
+        """记录该session的一个处理步骤已完成，立即落盘"""
+        self._load(lanlan_name)
+        done = self.steps[lanlan_name].setdefault(session_id, set())
+        if step in done:
+            return
+        done.add(step)
+        os.makedirs(self.journal_dir, exist_ok=True)
+        with open(self._journal_path(lanlan_name), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'session_id': session_id, 'step': step}) + '\n')
+
+    def drop_session(self, lanlan_name, session_id):
+        """移除已处理的session，并记下墓碑，之后迟到的轮次不会再被当成新的session"""
+        self._load(lanlan_name).pop(session_id, None)
+        self.steps[lanlan_name].pop(session_id, None)
+        finalized = self.finalized[lanlan_name]
+        finalized[session_id] = None
+        while len(finalized) > FINALIZED_SESSIONS_LIMIT:
+            finalized.popitem(last=False)
+        self._rewrite(lanlan_name)
+
+    def is_finalized(self, lanlan_name, session_id):
+        self._load(lanlan_name)
+        return session_id in self.finalized[lanlan_name]
+
+    def stale_sessions(self, lanlan_name, max_idle_seconds):
+        """返回超过max_idle_seconds没有新轮次的session，通常意味着connector已经退出"""
+        now = time.time()
+        result = []
+        for session_id, turns in self._load(lanlan_name).items():
+            last = max((t.get('received_at', 0) for t in turns.values()), default=0)
+            if now - last >= max_idle_seconds:
+                result.append(session_id)
+        return result
+
+    def characters(self):
+        """返回磁盘上存在日志的角色名"""
+        names = set(self.sessions)
+        if os.path.isdir(self.journal_dir):
+            for filename in os.listdir(self.journal_dir):
+                if filename.startswith('ingest_') and filename.endswith('.ndjson'):
+                    names.add(filename[len('ingest_'):-len('.ndjson')])
+        return sorted(names)
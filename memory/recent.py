@@ -1,11 +1,12 @@
 from datetime import datetime
 from config import get_character_data, get_core_config, MODELS_WITH_EXTRA_BODY
-from langchain_openai import ChatOpenAI
+from utils.llm_client import get_chat_llm
+from utils.model_router import route_model
+from utils.llm_gateway import llm_ainvoke, LLMUnavailableError
 from langchain_core.messages import SystemMessage, messages_to_dict, messages_from_dict, HumanMessage, AIMessage
 import json
 import os
 import asyncio
-from openai import RateLimitError
 
 from config.prompts_sys import recent_history_manager_prompt, detailed_recent_history_manager_prompt, further_summarize_prompt, history_review_prompt
 
@@ -24,17 +25,19 @@ class CompressedRecentHistoryManager:
             else:
                 self.user_histories[ln] = []
     
-    def _get_llm(self):
-        """动态获取LLM实例以支持配置热重载"""
+    def _get_llm(self, task='summary', prompt=None):
+        """动态获取LLM实例以支持配置热重载，模型由路由按任务和输入长度选择"""
         core_config = get_core_config()
         api_key = core_config['OPENROUTER_API_KEY'] if core_config['OPENROUTER_API_KEY'] else None
-        return ChatOpenAI(model=core_config['SUMMARY_MODEL'], base_url=core_config['OPENROUTER_URL'], api_key=api_key, temperature=0.3, extra_body={"enable_thinking": False} if core_config['SUMMARY_MODEL'] in MODELS_WITH_EXTRA_BODY else None)
+        model = route_model(task, prompt, core_config)
+        return get_chat_llm(model=model, base_url=core_config['OPENROUTER_URL'], api_key=api_key, temperature=0.3, extra_body={"enable_thinking": False} if model in MODELS_WITH_EXTRA_BODY else None)
     
-    def _get_review_llm(self):
+    def _get_review_llm(self, prompt=None):
         """动态获取审核LLM实例以支持配置热重载"""
         core_config = get_core_config()
         api_key = core_config['OPENROUTER_API_KEY'] if core_config['OPENROUTER_API_KEY'] else None
-        return ChatOpenAI(model=core_config['CORRECTION_MODEL'], base_url=core_config['OPENROUTER_URL'], api_key=api_key, temperature=0.1, extra_body={"enable_thinking": False} if core_config['CORRECTION_MODEL'] in MODELS_WITH_EXTRA_BODY else None)
+        model = route_model('review', prompt, core_config)
+        return get_chat_llm(model=model, base_url=core_config['OPENROUTER_URL'], api_key=api_key, temperature=0.1, extra_body={"enable_thinking": False} if model in MODELS_WITH_EXTRA_BODY else None)
 
     async def update_history(self, new_messages, lanlan_name, detailed=False):
         if os.path.exists(self.log_file_path[lanlan_name]):
@@ -94,8 +97,8 @@ class CompressedRecentHistoryManager:
         while retries < max_retries:
             try:
                 # 尝试将响应内容解析为JSON
-                llm = self._get_llm()
-                response_content = (await llm.ainvoke(prompt)).content
+                llm = self._get_llm('summary', prompt)
+                response_content = (await llm_ainvoke(llm, prompt)).content
                 # 修复类型问题：确保response_content是字符串
                 if isinstance(response_content, list):
                     response_content = str(response_content)
@@ -115,15 +118,10 @@ class CompressedRecentHistoryManager:
                 else:
                     print('💥 摘要failed: ', response_content)
                     retries += 1
-            except RateLimitError as e:
-                retries += 1
-                if retries >= max_retries:
-                    print(f'❌ 摘要模型失败，已达到最大重试次数: {e}')
-                    break
-                # 指数退避: 1, 2, 4 秒
-                wait_time = 2 ** (retries - 1)
-                print(f'⚠️ 遇到429错误，等待 {wait_time} 秒后重试 (第 {retries}/{max_retries} 次)')
-                await asyncio.sleep(wait_time)
+            except LLMUnavailableError as e:
+                # 网关已经做过退避重试
+                print(f'❌ 摘要模型失败，已达到最大重试次数: {e}')
+                break
             except Exception as e:
                 print(f'❌ 摘要模型失败：{e}')
                 # 如果解析失败，重试
@@ -137,8 +135,8 @@ class CompressedRecentHistoryManager:
         while retries < max_retries:
             try:
                 # 尝试将响应内容解析为JSON
-                llm = self._get_llm()
-                response_content = (await llm.ainvoke(further_summarize_prompt % initial_summary)).content
+                llm = self._get_llm('further_summary', further_summarize_prompt % initial_summary)
+                response_content = (await llm_ainvoke(llm, further_summarize_prompt % initial_summary)).content
                 # 修复类型问题：确保response_content是字符串
                 if isinstance(response_content, list):
                     response_content = str(response_content)
@@ -152,15 +150,9 @@ class CompressedRecentHistoryManager:
                 else:
                     print('💥 第二轮摘要failed: ', response_content)
                     retries += 1
-            except RateLimitError as e:
-                retries += 1
-                if retries >= max_retries:
-                    print(f'❌ 第二轮摘要模型失败，已达到最大重试次数: {e}')
-                    return None
-                # 指数退避: 1, 2, 4 秒
-                wait_time = 2 ** (retries - 1)
-                print(f'⚠️ 遇到429错误，等待 {wait_time} 秒后重试 (第 {retries}/{max_retries} 次)')
-                await asyncio.sleep(wait_time)
+            except LLMUnavailableError as e:
+                print(f'❌ 第二轮摘要模型失败，已达到最大重试次数: {e}')
+                return None
             except Exception as e:
                 print(f'❌ 第二轮摘要模型失败：{e}')
                 retries += 1
@@ -243,8 +235,8 @@ class CompressedRecentHistoryManager:
             try:
                 # 使用LLM审阅历史记录
                 prompt = history_review_prompt % (self.name_mapping['human'], name_mapping['ai'], history_text, self.name_mapping['human'], name_mapping['ai'])
-                review_llm = self._get_review_llm()
-                response_content = (await review_llm.ainvoke(prompt)).content
+                review_llm = self._get_review_llm(prompt)
+                response_content = (await llm_ainvoke(review_llm, prompt)).content
                 
                 # 检查是否被取消（LLM调用后）
                 if cancel_event and cancel_event.is_set():
@@ -294,19 +286,9 @@ class CompressedRecentHistoryManager:
                     print(f"❌ 审阅响应格式错误：{response_content}")
                     return False
                     
-            except RateLimitError as e:
-                retries += 1
-                if retries >= max_retries:
-                    print(f'❌ 记忆审阅失败，已达到最大重试次数: {e}')
-                    return False
-                # 指数退避: 1, 2, 4 秒
-                wait_time = 2 ** (retries - 1)
-                print(f'⚠️ 遇到429错误，等待 {wait_time} 秒后重试 (第 {retries}/{max_retries} 次)')
-                await asyncio.sleep(wait_time)
-                # 检查是否被取消
-                if cancel_event and cancel_event.is_set():
-                    print(f"⚠️ {lanlan_name} 的记忆审阅在重试等待期间被取消")
-                    return False
+            except LLMUnavailableError as e:
+                print(f'❌ 记忆审阅失败，已达到最大重试次数: {e}')
+                return False
             except Exception as e:
                 print(f"❌ 历史记录审阅失败：{e}")
                 import traceback
@@ -8,8 +8,9 @@ from langgraph.graph import StateGraph, END
 from typing import TypedDict, List, Dict, Any
 from langchain_core.messages import BaseMessage
 import json
-from langchain_openai import ChatOpenAI
-from config import get_core_config, ROUTER_MODEL
+from utils.llm_client import get_chat_llm
+from utils.model_router import route_model
+from config import get_core_config
 
 class RouterState(TypedDict):
     messages: List[BaseMessage]
@@ -24,10 +25,10 @@ class MemoryQueryRouter:
         self.settings_manager = settings_manager
         self.graph = self._build_graph()
     
-    def _get_llm(self):
+    def _get_llm(self, prompt=None):
         """动态获取LLM实例以支持配置热重载"""
         core_config = get_core_config()
-        return ChatOpenAI(model=ROUTER_MODEL, base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'])
+        return get_chat_llm(model=route_model('router', prompt, core_config), base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'])
 
     def _build_graph(self):
         # 构建LangGraph流程图
@@ -68,7 +69,7 @@ class MemoryQueryRouter:
 
 只返回类型名称，不要有其他文本。"""
 
-        llm = self._get_llm()
+        llm = self._get_llm(prompt)
         response = llm.invoke(prompt)
         query_type = response.content.strip().lower()
 
@@ -92,7 +93,7 @@ class MemoryQueryRouter:
         }}
         """
 
-        llm = self._get_llm()
+        llm = self._get_llm(prompt)
         response = llm.invoke(prompt)
         try:
             time_range = json.loads(response.content)
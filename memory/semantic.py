@@ -4,12 +4,13 @@ from typing import List
 from langchain_core.documents import Document
 from datetime import datetime
 from memory.recent import CompressedRecentHistoryManager
-from config import get_character_data, get_core_config, SEMANTIC_MODEL, RERANKER_MODEL, MODELS_WITH_EXTRA_BODY
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from config import get_character_data, get_core_config, SEMANTIC_MODEL, MODELS_WITH_EXTRA_BODY
+from utils.llm_client import get_chat_llm, get_embeddings
+from utils.model_router import route_model
+from utils.llm_gateway import llm_ainvoke, LLMUnavailableError
 from config.prompts_sys import semantic_manager_prompt
 import json
 import asyncio
-from openai import RateLimitError
 
 class SemanticMemory:
     def __init__(self, recent_history_manager: CompressedRecentHistoryManager, persist_directory=None):
@@ -23,10 +24,11 @@ class SemanticMemory:
             self.original_memory[i] = SemanticMemoryOriginal(persist_directory, i, name_mapping)
             self.compressed_memory[i] = SemanticMemoryCompressed(persist_directory, i, recent_history_manager, name_mapping)
     
-    def _get_reranker(self):
+    def _get_reranker(self, prompt=None):
         """动态获取Reranker LLM实例以支持配置热重载"""
         core_config = get_core_config()
-        return ChatOpenAI(model=RERANKER_MODEL, base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'], temperature=0.1, extra_body={"enable_thinking": False} if RERANKER_MODEL in MODELS_WITH_EXTRA_BODY else None)
+        model = route_model('rerank', prompt, core_config)
+        return get_chat_llm(model=model, base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'], temperature=0.1, extra_body={"enable_thinking": False} if model in MODELS_WITH_EXTRA_BODY else None)
 
     async def store_conversation(self, event_id, messages, lanlan_name):
         self.original_memory[lanlan_name].store_conversation(event_id, messages)
@@ -62,18 +64,12 @@ class SemanticMemory:
         max_retries = 3
         while retries < max_retries:
             try:
-                reranker = self._get_reranker()
-                response = await reranker.ainvoke(prompt)
-            except RateLimitError as e:
-                retries += 1
-                if retries >= max_retries:
-                    print(f'❌ Rerank query失败，已达到最大重试次数: {e}')
-                    return []
-                # 指数退避: 1, 2, 4 秒
-                wait_time = 2 ** (retries - 1)
-                print(f'⚠️ 遇到429错误，等待 {wait_time} 秒后重试 (第 {retries}/{max_retries} 次)')
-                await asyncio.sleep(wait_time)
-                continue
+                reranker = self._get_reranker(prompt)
+                response = await llm_ainvoke(reranker, prompt)
+            except LLMUnavailableError as e:
+                # 网关已经做过退避重试
+                print(f'❌ Rerank query失败，已达到最大重试次数: {e}')
+                return []
             except Exception as e:
                 retries += 1
                 print(f'❌ Rerank query失败: {e}')
@@ -98,7 +94,7 @@ class SemanticMemory:
 class SemanticMemoryOriginal:
     def __init__(self, persist_directory, lanlan_name, name_mapping):
         core_config = get_core_config()
-        self.embeddings = OpenAIEmbeddings(base_url=core_config['OPENROUTER_URL'], model=SEMANTIC_MODEL, api_key=core_config['OPENROUTER_API_KEY'])
+        self.embeddings = get_embeddings(model=SEMANTIC_MODEL, base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'])
         # self.vectorstore = Chroma(
         #     collection_name="Origin",
         #     persist_directory=persist_directory[lanlan_name],
@@ -152,7 +148,7 @@ class SemanticMemoryCompressed:
         self.lanlan_name = lanlan_name
         self.name_mapping = name_mapping
         core_config = get_core_config()
-        self.embeddings = OpenAIEmbeddings(base_url=core_config['OPENROUTER_URL'], model=SEMANTIC_MODEL, api_key=core_config['OPENROUTER_API_KEY'])
+        self.embeddings = get_embeddings(model=SEMANTIC_MODEL, base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'])
         self.vectorstore = None
         # self.vectorstore = Chroma(
         #     collection_name="Compressed",
@@ -1,39 +1,53 @@
 import json
+import os
 import asyncio
-from langchain_openai import ChatOpenAI
-from openai import RateLimitError
-from config import get_core_config, SETTING_PROPOSER_MODEL, SETTING_VERIFIER_MODEL, get_character_data
+from collections import OrderedDict
+from utils.llm_client import get_chat_llm
+from utils.model_router import route_model
+from utils.llm_gateway import llm_ainvoke, LLMUnavailableError
+from config import get_core_config, get_character_data, MODELS_WITH_EXTRA_BODY
 from config.prompts_sys import settings_extractor_prompt, settings_verifier_prompt
 
 
+# 每个角色保留提取进度的session数量
+MAX_TRACKED_SESSIONS = 256
+
+
 class ImportantSettingsManager:
-    def __init__(self):
+    def __init__(self, max_tracked_sessions=MAX_TRACKED_SESSIONS):
         self.settings = {}
         self.settings_file = None
+        # 各session已送入Proposer的轮次数，用于只对新增轮次做增量提取 {lanlan_name: OrderedDict{session_id: count}}
+        # 与设定文件一起落盘，重启后不会重复提取
+        self.max_tracked_sessions = max_tracked_sessions
+        self.watermarks = {}
     
-    def _get_proposer(self):
+    def _get_proposer(self, prompt=None):
         """动态获取Proposer LLM实例以支持配置热重载"""
         core_config = get_core_config()
-        return ChatOpenAI(model=SETTING_PROPOSER_MODEL, base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'], temperature=0.5)
+        model = route_model('setting_proposer', prompt, core_config)
+        return get_chat_llm(model=model, base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'], temperature=0.5, extra_body={"enable_thinking": False} if model in MODELS_WITH_EXTRA_BODY else None)
     
-    def _get_verifier(self):
+    def _get_verifier(self, prompt=None):
         """动态获取Verifier LLM实例以支持配置热重载"""
         core_config = get_core_config()
-        return ChatOpenAI(model=SETTING_VERIFIER_MODEL, base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'], temperature=0.5)
+        model = route_model('setting_verifier', prompt, core_config)
+        return get_chat_llm(model=model, base_url=core_config['OPENROUTER_URL'], api_key=core_config['OPENROUTER_API_KEY'], temperature=0.5, extra_body={"enable_thinking": False} if model in MODELS_WITH_EXTRA_BODY else None)
 
     def load_settings(self):
         # It is important to update the settings with the latest character on-disk files
         _, _, master_basic_config, lanlan_basic_config, name_mapping, _, _, _, setting_store, _ = get_character_data()
         self.settings_file = setting_store
         self.master_basic_config = master_basic_config
-        self.lanlan_basic_config = lanlan_basic_config
+        # 配置快照是共享的只读视图，这里复制一份并去掉与设定无关的字段
+        self.lanlan_basic_config = {
+            name: {k: v for k, v in cfg.items() if k not in ('system_prompt', 'live2d', 'voice_id')}
+            for name, cfg in lanlan_basic_config.items()
+        }
         self.name_mapping = name_mapping
 
         for i in self.settings_file:
             try:
-                self.lanlan_basic_config[i].pop('system_prompt', None)
-                self.lanlan_basic_config[i].pop('live2d', None)
-                self.lanlan_basic_config[i].pop('voice_id', None)
                 with open(self.settings_file[i], 'r', encoding='utf-8') as f:
                     self.settings[i] = json.load(f)
             except (FileNotFoundError, json.JSONDecodeError):
@@ -43,48 +57,127 @@ class ImportantSettingsManager:
         with open(self.settings_file[lanlan_name], 'w', encoding='utf-8') as f:
             json.dump(self.settings[lanlan_name], f, indent=2, ensure_ascii=False)
 
-    async def detect_and_resolve_contradictions(self, old_settings, new_settings, lanlan_name):
-        # 使用LLM检测矛盾并解决它们
-        prompt = settings_verifier_prompt % (json.dumps(old_settings, ensure_ascii=False), json.dumps(new_settings, ensure_ascii=False))
+    def _watermark_path(self, lanlan_name):
+        return os.path.splitext(self.settings_file[lanlan_name])[0] + '_watermark.json'
+
+    def _load_watermarks(self, lanlan_name):
+        if lanlan_name not in self.watermarks:
+            try:
+                with open(self._watermark_path(lanlan_name), 'r', encoding='utf-8') as f:
+                    self.watermarks[lanlan_name] = OrderedDict(json.load(f))
+            except (FileNotFoundError, json.JSONDecodeError, TypeError, ValueError):
+                self.watermarks[lanlan_name] = OrderedDict()
+        return self.watermarks[lanlan_name]
+
+    def _filter_new_turns(self, messages, lanlan_name, session_id):
+        """
+        只保留尚未提取过设定的消息。同一个session的轮次按顺序追加，重试或续传时只处理上次之后的部分；
+        没有session_id的调用（/process、/renew）各自是一段独立的对话，全部处理
+        """
+        if session_id is None:
+            return list(messages)
+        return list(messages[self._load_watermarks(lanlan_name).get(session_id, 0):])
+
+    def _mark_turns_processed(self, messages, lanlan_name, session_id):
+        if session_id is None:
+            return
+        watermarks = self._load_watermarks(lanlan_name)
+        watermarks.pop(session_id, None)
+        watermarks[session_id] = len(messages)
+        while len(watermarks) > self.max_tracked_sessions:
+            watermarks.popitem(last=False)
+        with open(self._watermark_path(lanlan_name), 'w', encoding='utf-8') as f:
+            json.dump(watermarks, f, ensure_ascii=False)
+
+    @staticmethod
+    def _diff_settings(old_settings, delta):
+        """
+        将Proposer给出的key级别增量拆分为可直接合并的补丁与需要Verifier裁决的冲突
+        :return: (patch, conflicts)。patch为{entity: {key: value}}；conflicts为{entity: {key: {"old": ..., "new": ...}}}
+        """
+        patch, conflicts = {}, {}
+        for entity, attrs in delta.items():
+            if not isinstance(attrs, dict):
+                continue
+            old_attrs = old_settings.get(entity)
+            if not isinstance(old_attrs, dict):
+                old_attrs = {}
+            for key, value in attrs.items():
+                if value in (None, '', [], {}):
+                    continue
+                old_value = old_attrs.get(key)
+                if old_value == value:
+                    continue
+                if old_value in (None, '', [], {}):
+                    patch.setdefault(entity, {})[key] = value
+                else:
+                    conflicts.setdefault(entity, {})[key] = {"old": old_value, "new": value}
+        return patch, conflicts
+
+    @staticmethod
+    def _apply_patch(settings, patch):
+        """按key合并补丁，值为None表示删除该条目"""
+        for entity, attrs in patch.items():
+            target = settings.setdefault(entity, {})
+            for key, value in attrs.items():
+                if value is None:
+                    target.pop(key, None)
+                else:
+                    target[key] = value
+        return settings
+
+    async def detect_and_resolve_contradictions(self, conflicts, lanlan_name):
+        """
+        只把发生冲突的条目交给Verifier裁决
+        :param conflicts: {entity: {key: {"old": ..., "new": ...}}}
+        :return: {entity: {key: final_value}}，解析失败时返回空字典（即保留旧值）
+        """
+        prompt = settings_verifier_prompt % json.dumps(conflicts, ensure_ascii=False)
         prompt = prompt.replace("{LANLAN_NAME}", lanlan_name)
 
         retries = 0
         max_retries = 3
         while retries < max_retries:
             try:
-                verifier = self._get_verifier()
-                response = await verifier.ainvoke(prompt)
+                verifier = self._get_verifier(prompt)
+                response = await llm_ainvoke(verifier, prompt)
                 result = response.content
                 if result.startswith("```"):
                     result = result .replace("```json", "").replace("```", "").strip()
-            except RateLimitError as e:
-                retries += 1
-                if retries >= max_retries:
-                    print(f"❌ Setting resolver query失败，已达到最大重试次数: {e}")
-                    return old_settings
-                # 指数退避: 1, 2, 4 秒
-                wait_time = 2 ** (retries - 1)
-                print(f'⚠️ 遇到429错误，等待 {wait_time} 秒后重试 (第 {retries}/{max_retries} 次)')
-                await asyncio.sleep(wait_time)
-                continue
+            except LLMUnavailableError as e:
+                # 网关已经做过退避重试
+                print(f"❌ Setting resolver query失败，已达到最大重试次数: {e}")
+                return {}
             except Exception as e:
                 print(f"❌ Setting resolver query出错: {e}")
                 retries += 1
                 continue
             try:
-                merged_settings = json.loads(result)
-                return merged_settings
+                resolved = json.loads(result)
             except json.JSONDecodeError:
-                # 如果解析失败，返回新设定
                 retries += 1
                 print(f"❌ Setting resolver返回值解析失败。返回值：{response.content}")
-        return old_settings
+                continue
+            # 只接受针对冲突条目的裁决，忽略模型擅自添加的其他key
+            return {
+                entity: {key: attrs[key] for key in conflicts[entity] if key in attrs}
+                for entity, attrs in resolved.items()
+                if entity in conflicts and isinstance(attrs, dict)
+            }
+        return {}
 
-    async def extract_and_update_settings(self, messages, lanlan_name):
+    async def extract_and_update_settings(self, messages, lanlan_name, session_id=None):
+        """
+        :param session_id: messages所属的session。同一个session再次提交（例如finalize失败后重试）时只处理新增的轮次
+        """
+        self.load_settings()
+        new_messages = self._filter_new_turns(messages, lanlan_name, session_id)
+        if not new_messages:
+            return
         name_mapping = self.name_mapping.copy()
         name_mapping['ai'] = lanlan_name
         lines = []
-        for msg in messages:
+        for msg in new_messages:
             try:
                 parts = []
                 for i in msg.content:
@@ -95,26 +188,19 @@ class ImportantSettingsManager:
                 joined = "\n".join(parts)
             except Exception:
                 joined = str(getattr(msg, 'content', ''))
-            lines.append(f"{name_mapping[msg.type]} | {joined}")
+            lines.append(f"{name_mapping.get(msg.type, msg.type)} | {joined}")
         prompt = settings_extractor_prompt % ("\n".join(lines))
         prompt = prompt.replace('{LANLAN_NAME}', lanlan_name)
         retries = 0
         max_retries = 3
-        new_settings = ""
+        new_settings = None
         while retries < max_retries:
             try:
-                proposer = self._get_proposer()
-                response = await proposer.ainvoke(prompt)
-            except RateLimitError as e:
-                retries += 1
-                if retries >= max_retries:
-                    print(f"❌ Setting LLM query失败，已达到最大重试次数: {e}")
-                    return
-                # 指数退避: 1, 2, 4 秒
-                wait_time = 2 ** (retries - 1)
-                print(f'⚠️ 遇到429错误，等待 {wait_time} 秒后重试 (第 {retries}/{max_retries} 次)')
-                await asyncio.sleep(wait_time)
-                continue
+                proposer = self._get_proposer(prompt)
+                response = await llm_ainvoke(proposer, prompt)
+            except LLMUnavailableError as e:
+                print(f"❌ Setting LLM query失败，已达到最大重试次数: {e}")
+                return
             except Exception as e:
                 print(f"❌ Setting LLM query出错: {e}")
                 retries += 1
@@ -127,12 +213,28 @@ class ImportantSettingsManager:
             except json.JSONDecodeError:
                 print(f"❌ Setting LLM返回的设定JSON解析失败。返回值：{response.content}")
                 retries += 1
+                continue
             break
 
-        # 检测并解决矛盾
-        if len(new_settings)>0:
-            self.load_settings()
-            self.settings[lanlan_name] = await self.detect_and_resolve_contradictions(self.settings[lanlan_name], new_settings, lanlan_name)
+        if not isinstance(new_settings, dict):
+            return
+        # Proposer已成功处理这些消息，即使没有提取出设定也不再重复提取
+        self._mark_turns_processed(messages, lanlan_name, session_id)
+
+        # 只接受关于当前角色和主人的设定
+        delta = {k: v for k, v in new_settings.items() if k in (lanlan_name, self.name_mapping['human'])}
+        if not delta:
+            return
+
+        # 检测并解决矛盾：无冲突的key直接合并，冲突的key交给Verifier
+        self.load_settings()
+        patch, conflicts = self._diff_settings(self.settings[lanlan_name], delta)
+        if conflicts:
+            resolved = await self.detect_and_resolve_contradictions(conflicts, lanlan_name)
+            for entity, attrs in resolved.items():
+                patch.setdefault(entity, {}).update(attrs)
+        if patch:
+            self._apply_patch(self.settings[lanlan_name], patch)
             self.save_settings(lanlan_name)
 
     def get_settings(self, lanlan_name):
@@ -56,8 +56,12 @@ class TimeIndexedMemory:
             table_name=TIME_COMPRESSED_TABLE_NAME,
         )
 
+        # 先完成压缩（可能失败）再写入；同一个event_id重复写入时覆盖之前的记录，重试不会产生重复
+        summary = (await self.recent_history_manager.compress_history(messages, lanlan_name))[1]
+        origin_history.clear()
+        compressed_history.clear()
         origin_history.add_messages(messages)
-        compressed_history.add_message(SystemMessage((await self.recent_history_manager.compress_history(messages, lanlan_name))[1]))
+        compressed_history.add_message(SystemMessage(summary))
 
         with self.engine[lanlan_name].connect() as conn:
             conn.execute(
@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 import sys, os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from memory import CompressedRecentHistoryManager, SemanticMemory, ImportantSettingsManager, TimeIndexedMemory
-from fastapi import FastAPI
+from memory import CompressedRecentHistoryManager, SemanticMemory, ImportantSettingsManager, TimeIndexedMemory, TurnJournal
+from fastapi import FastAPI, Request
 import json
 import uvicorn
 from langchain_core.messages import convert_to_messages
@@ -21,6 +21,10 @@ logger, log_config = setup_logging(app_name="Xiao8_Memory", log_level=logging.IN
 class HistoryRequest(BaseModel):
     input_history: str
 
+class FinalizeRequest(BaseModel):
+    session_id: str
+    mode: str = 'process'  # 'process' | 'renew'
+
 app = FastAPI()
 
 # 初始化组件
@@ -28,6 +32,16 @@ recent_history_manager = CompressedRecentHistoryManager()
 semantic_manager = SemanticMemory(recent_history_manager)
 settings_manager = ImportantSettingsManager()
 time_manager = TimeIndexedMemory(recent_history_manager)
+turn_journal = TurnJournal()
+
+# 流式上传的session超过该时长没有新轮次、也没有finalize，则视为connector已退出
+STALE_INGEST_SESSION_SECONDS = 600
+# 定期清扫的间隔（秒）
+SWEEP_INTERVAL_SECONDS = 60
+# finalize和过期清扫按角色串行，避免同一个session被处理两次
+journal_locks = {}  # {lanlan_name: asyncio.Lock}
+sweep_task = None
+sweep_loop_task = None
 
 # 全局变量用于控制服务器关闭
 shutdown_event = asyncio.Event()
@@ -36,6 +50,10 @@ enable_shutdown = False
 # 全局变量用于管理correction任务
 correction_tasks = {}  # {lanlan_name: asyncio.Task}
 correction_cancel_flags = {}  # {lanlan_name: asyncio.Event}
+# 后台设定提取任务。同一角色的提取按提交顺序串行执行，不取消（取消会丢失该session的设定）
+settings_tasks = {}  # {lanlan_name: asyncio.Task}
+# 关闭时等待未完成的设定提取的最长时间（秒）
+SETTINGS_SHUTDOWN_GRACE_SECONDS = 10
 
 @app.post("/shutdown")
 async def shutdown_memory_server():
@@ -53,10 +71,22 @@ async def shutdown_memory_server():
         logger.error(f"处理关闭信号时出错: {e}")
         return {"status": "error", "message": str(e)}
 
+@app.on_event("startup")
+async def startup_event_handler():
+    """启动时补处理上次运行遗留的未结束session，之后定期清扫"""
+    global sweep_loop_task
+    sweep_loop_task = asyncio.create_task(_sweep_periodically())
+
 @app.on_event("shutdown")
 async def shutdown_event_handler():
     """应用关闭时执行清理工作"""
     logger.info("Memory server正在关闭...")
+    if sweep_loop_task:
+        sweep_loop_task.cancel()
+    pending = [t for t in settings_tasks.values() if not t.done()]
+    if pending:
+        logger.info(f"⏳ 等待 {len(pending)} 个设定提取任务完成...")
+        await asyncio.wait(pending, timeout=SETTINGS_SHUTDOWN_GRACE_SECONDS)
     # 这里可以添加任何需要的清理工作
     logger.info("Memory server已关闭")
 
@@ -87,33 +117,69 @@ async def _run_review_in_background(lanlan_name: str):
         if lanlan_name in correction_cancel_flags:
             correction_cancel_flags[lanlan_name].clear()
 
+async def _run_settings_in_background(input_history, lanlan_name: str, session_id=None, previous=None):
+    """在后台提取重要设定；先等待该角色上一次提取结束，避免并发读写同一份设定文件"""
+    if previous is not None and not previous.done():
+        try:
+            await previous
+        except BaseException:
+            pass
+    try:
+        await settings_manager.extract_and_update_settings(input_history, lanlan_name, session_id=session_id)
+    except asyncio.CancelledError:
+        logger.info(f"⚠️ {lanlan_name} 的设定提取任务被取消")
+    except Exception as e:
+        logger.error(f"❌ {lanlan_name} 的设定提取任务出错: {e}")
+    finally:
+        if settings_tasks.get(lanlan_name) is asyncio.current_task():
+            del settings_tasks[lanlan_name]
+
+async def _process_history(input_history, lanlan_name: str, detailed=False, session_id=None):
+    """
+    将一段完整的对话历史写入各记忆模块，并在后台进行设定提取、重启review_history任务
+    session_id: 来自日志的session。每个步骤完成后记入日志，处理失败重试时只执行未完成的步骤；
+    时间索引也以session_id为键写入，重复写入会覆盖而不是追加
+    """
+    global correction_tasks
+    uid = session_id or str(uuid4())
+    done = turn_journal.completed_steps(lanlan_name, session_id) if session_id else set()
+
+    async def run_step(step, coro_factory):
+        if step in done:
+            return
+        await coro_factory()
+        if session_id:
+            turn_journal.mark_step(lanlan_name, session_id, step)
+
+    await run_step('recent', lambda: recent_history_manager.update_history(input_history, lanlan_name, detailed=detailed))
+    """
+    下面屏蔽了语义记忆模块，因为它需要消耗token，但当前版本实用性近乎于0。尤其是，Qwen与GPT等旗舰模型相比性能差距过大。
+    设定提取已改为只处理新增轮次、按key合并，仅冲突条目会交给Verifier，因此重新启用。
+    设定提取需要调用LLM，放到后台执行，不计入finalize的延迟；同一session重复提交时由设定水位线去重。
+    """
+    settings_tasks[lanlan_name] = asyncio.create_task(
+        _run_settings_in_background(input_history, lanlan_name, session_id, settings_tasks.get(lanlan_name)))
+    # await semantic_manager.store_conversation(uid, input_history, lanlan_name)
+    await run_step('time_index', lambda: time_manager.store_conversation(uid, input_history, lanlan_name))
+
+    # 在后台启动review_history任务
+    if lanlan_name in correction_tasks and not correction_tasks[lanlan_name].done():
+        # 如果已有任务在运行，取消它
+        correction_tasks[lanlan_name].cancel()
+        try:
+            await correction_tasks[lanlan_name]
+        except asyncio.CancelledError:
+            pass
+
+    # 启动新的review任务
+    task = asyncio.create_task(_run_review_in_background(lanlan_name))
+    correction_tasks[lanlan_name] = task
+
 @app.post("/process/{lanlan_name}")
 async def process_conversation(request: HistoryRequest, lanlan_name: str):
-    global correction_tasks
     try:
-        uid = str(uuid4())
         input_history = convert_to_messages(json.loads(request.input_history))
-        await recent_history_manager.update_history(input_history, lanlan_name)
-        """
-        下面屏蔽了两个模块，因为这两个模块需要消耗token，但当前版本实用性近乎于0。尤其是，Qwen与GPT等旗舰模型相比性能差距过大。
-        """
-        # await settings_manager.extract_and_update_settings(input_history, lanlan_name)
-        # await semantic_manager.store_conversation(uid, input_history, lanlan_name)
-        await time_manager.store_conversation(uid, input_history, lanlan_name)
-        
-        # 在后台启动review_history任务
-        if lanlan_name in correction_tasks and not correction_tasks[lanlan_name].done():
-            # 如果已有任务在运行，取消它
-            correction_tasks[lanlan_name].cancel()
-            try:
-                await correction_tasks[lanlan_name]
-            except asyncio.CancelledError:
-                pass
-        
-        # 启动新的review任务
-        task = asyncio.create_task(_run_review_in_background(lanlan_name))
-        correction_tasks[lanlan_name] = task
-        
+        await _process_history(input_history, lanlan_name)
         return {"status": "processed"}
     except Exception as e:
         import traceback
@@ -122,37 +188,104 @@ async def process_conversation(request: HistoryRequest, lanlan_name: str):
 
 @app.post("/renew/{lanlan_name}")
 async def process_conversation_for_renew(request: HistoryRequest, lanlan_name: str):
-    global correction_tasks
     try:
-        uid = str(uuid4())
         input_history = convert_to_messages(json.loads(request.input_history))
-        await recent_history_manager.update_history(input_history, lanlan_name, detailed=True)
-        # await settings_manager.extract_and_update_settings(input_history, lanlan_name)
-        # await semantic_manager.store_conversation(uid, input_history, lanlan_name)
-        await time_manager.store_conversation(uid, input_history, lanlan_name)
-        
-        # 在后台启动review_history任务
-        if lanlan_name in correction_tasks and not correction_tasks[lanlan_name].done():
-            # 如果已有任务在运行，取消它
-            correction_tasks[lanlan_name].cancel()
-            try:
-                await correction_tasks[lanlan_name]
-            except asyncio.CancelledError:
-                pass
-        
-        # 启动新的review任务
-        task = asyncio.create_task(_run_review_in_background(lanlan_name))
-        correction_tasks[lanlan_name] = task
-        
+        await _process_history(input_history, lanlan_name, detailed=True)
         return {"status": "processed"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.post("/ingest/{lanlan_name}")
+async def ingest_turns(request: Request, lanlan_name: str):
+    """
+    流式接收已完成的对话轮次（NDJSON，每行一个轮次），按幂等键去重后立即落盘。
+    每行格式：{"session_id": str, "key": str, "seq": int, "role": str, "content": list}
+    """
+    turns = []
+    invalid = 0
+    buffer = b''
+
+    def parse_line(line):
+        nonlocal invalid
+        line = line.strip()
+        if not line:
+            return
+        try:
+            turn = json.loads(line)
+            if not all(k in turn for k in ('session_id', 'key', 'role', 'content')):
+                raise ValueError("missing field")
+            turns.append(turn)
+        except (ValueError, TypeError):
+            invalid += 1
+
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                parse_line(line)
+        parse_line(buffer)
+        accepted, duplicates = turn_journal.append(lanlan_name, turns)
+        return {"status": "ok", "accepted": accepted, "duplicates": duplicates, "invalid": invalid}
+    except Exception as e:
+        logger.error(f"❌ {lanlan_name} 的轮次写入失败: {e}")
+        return {"status": "error", "message": str(e)}
+
+async def _finalize_journal_session(lanlan_name: str, session_id: str, detailed=False):
+    lock = journal_locks.setdefault(lanlan_name, asyncio.Lock())
+    async with lock:
+        if turn_journal.is_finalized(lanlan_name, session_id):
+            # 已被另一次finalize或清扫处理过
+            return 0
+        turns = turn_journal.get_session(lanlan_name, session_id)
+        if turns:
+            # _process_history 失败时会抛出异常，跳过下面的drop_session：
+            # 只有处理成功才从日志中移除，失败的session会在之后的清扫中重试
+            await _process_history(convert_to_messages(turns), lanlan_name, detailed=detailed, session_id=session_id)
+        turn_journal.drop_session(lanlan_name, session_id)
+        return len(turns)
+
+def _schedule_sweep():
+    """同一时间只运行一个清扫任务"""
+    global sweep_task
+    if sweep_task is None or sweep_task.done():
+        sweep_task = asyncio.create_task(_sweep_stale_sessions())
+
+async def _sweep_periodically():
+    """connector退出或finalize始终没有送达时，session也能在过期后被处理"""
+    while True:
+        _schedule_sweep()
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+
+async def _sweep_stale_sessions():
+    """补处理connector中途退出而没有finalize的session"""
+    for lanlan_name in turn_journal.characters():
+        if lanlan_name not in recent_history_manager.log_file_path:
+            continue
+        for session_id in turn_journal.stale_sessions(lanlan_name, STALE_INGEST_SESSION_SECONDS):
+            try:
+                count = await _finalize_journal_session(lanlan_name, session_id)
+                logger.info(f"♻️ 已补处理 {lanlan_name} 未结束的session {session_id}（{count} 条消息）")
+            except Exception as e:
+                logger.error(f"❌ 补处理 {lanlan_name} 的session {session_id} 失败: {e}")
+
+@app.post("/finalize/{lanlan_name}")
+async def finalize_session(request: FinalizeRequest, lanlan_name: str):
+    """session结束（mode=process）或热切换（mode=renew）时，处理该session已流式上传的全部轮次"""
+    try:
+        count = await _finalize_journal_session(lanlan_name, request.session_id, detailed=(request.mode == 'renew'))
+        _schedule_sweep()
+        return {"status": "processed", "turns": count}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {"status": "error", "message": str(e)}
+
 @app.get("/get_recent_history/{lanlan_name}")
 def get_recent_history(lanlan_name: str):
     history = recent_history_manager.get_recent_history(lanlan_name)
     _, _, _, _, name_mapping, _, _, _, _, _ = get_character_data()
-    name_mapping['ai'] = lanlan_name
+    name_mapping = dict(name_mapping, ai=lanlan_name)
     result = f"开始聊天前，{lanlan_name}又在脑海内整理了近期发生的事情。\n"
     for i in history:
         if i.type == 'system':
@@ -196,7 +329,7 @@ async def new_dialog(lanlan_name: str):
     # 正则表达式：删除所有类型括号及其内容（包括[]、()、{}、<>、【】、（）等）
     brackets_pattern = re.compile(r'(\[.*?\]|\(.*?\)|（.*?）|【.*?】|\{.*?\}|<.*?>)')
     master_name, _, _, _, name_mapping, _, _, _, _, _ = get_character_data()
-    name_mapping['ai'] = lanlan_name
+    name_mapping = dict(name_mapping, ai=lanlan_name)
     result = f"\n========{lanlan_name}的内心活动========\n{lanlan_name}的脑海里经常想着自己和{master_name}的事情，她记得{json.dumps(settings_manager.get_settings(lanlan_name), ensure_ascii=False)}\n\n"
     result += f"开始聊天前，{lanlan_name}又在脑海内整理了近期发生的事情。\n"
     for i in recent_history_manager.get_recent_history(lanlan_name):
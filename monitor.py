@@ -13,6 +13,7 @@ from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
 import uvicorn
 from fastapi.templating import Jinja2Templates
 from utils.frontend_utils import find_models, find_model_config_file
+from utils.audio import unpack_sync_audio
 templates = Jinja2Templates(directory="./")
 
 app = FastAPI()
@@ -116,6 +117,8 @@ connected_clients = set()
 subtitle_clients = set()
 current_subtitle = ""
 should_clear_next = False
+# 每个角色最新的语音代际号，代际号更小的音频属于已被打断的回复
+audio_generation = {}
 
 def is_japanese(text):
     import re
@@ -207,6 +210,10 @@ async def sync_endpoint(websocket: WebSocket, lanlan_name:str):
                 msg_type = data.get("type", "unknown")
 
 
+                if msg_type == "user_activity" and "generation" in data:
+                    # 用户打断：之后只播放新代际的音频
+                    audio_generation[lanlan_name] = max(audio_generation.get(lanlan_name, 0), data["generation"])
+
                 if msg_type == "gemini_response":
                     # 发送到字幕显示
                     subtitle_text = data.get("text", "")
@@ -253,13 +260,19 @@ async def sync_endpoint(websocket: WebSocket, lanlan_name:str):
 async def sync_binary_endpoint(websocket: WebSocket, lanlan_name:str):
     await websocket.accept()
     print(f"✅ [BINARY] 主服务器二进制连接已建立: {websocket.client}")
+    # 同步连接器重启后代际号从0开始
+    audio_generation[lanlan_name] = 0
 
     try:
         while True:
             try:
                 data = await asyncio.wait_for(websocket.receive_bytes(), timeout=25)
                 if len(data)>4:
-                    await broadcast_binary(data)
+                    generation, pcm = unpack_sync_audio(data)
+                    if generation < audio_generation.get(lanlan_name, 0):
+                        continue  # 打断之前的音频
+                    audio_generation[lanlan_name] = generation
+                    await broadcast_binary(pcm)
             except asyncio.exceptions.TimeoutError:
                 pass
     except WebSocketDisconnect:
@@ -29,6 +29,7 @@ function init_app(){
     let scheduledSources = [];
     let animationFrameId;
     let seqCounter = 0;
+    let audioEpoch = 0; // 每次clearAudioQueue加一
     let globalAnalyser = null;
     let lipSyncActive = false;
     let screenCaptureStream = null; // 暂存屏幕共享stream，不再需要每次都弹窗选择共享区域，方便自动重连
@@ -47,6 +48,9 @@ function init_app(){
     
     // WebSocket心跳保活
     let heartbeatInterval = null;
+    let micFrameSeq = 0; // 麦克风二进制帧序号
+    const MIC_FRAME_HEADER_SIZE = 8; // frame_type(u8) | flags(u8) | sample_rate(u16) | seq(u32)，小端
+    const MIC_FRAME_PCM16 = 1;
     const HEARTBEAT_INTERVAL = 30000; // 30秒发送一次心跳
 
     function isMobile() {
@@ -200,6 +204,13 @@ function init_app(){
                             }, 7500); // 7.5秒后执行
                         }
                     }
+                } else if (response.type === 'session_status') {
+                    // 服务端正在自动重连，会话和麦克风都保持不变
+                    if (response.status === 'reconnecting') {
+                        statusElement.textContent = '网络波动，正在重新连接...';
+                    } else if (response.status === 'resumed') {
+                        statusElement.textContent = `${lanlan_config.lanlan_name}回来了`;
+                    }
                 } else if (response.type === 'expression') {
                     window.LanLan1.registered_expressions[response.message]();
                 } else if (response.type === 'system' && response.data === 'turn end') {
@@ -1274,9 +1285,30 @@ function init_app(){
         }
     }
 
+    // 把Int16 PCM打包成二进制帧：8字节头 + PCM16LE
+    function buildMicFrame(pcm16, sampleRate) {
+        const frame = new ArrayBuffer(MIC_FRAME_HEADER_SIZE + pcm16.byteLength);
+        const view = new DataView(frame);
+        view.setUint8(0, MIC_FRAME_PCM16);
+        view.setUint8(1, 0);
+        view.setUint16(2, sampleRate, true);
+        view.setUint32(4, micFrameSeq, true);
+        micFrameSeq = (micFrameSeq + 1) >>> 0;
+        const samples = new Int16Array(frame, MIC_FRAME_HEADER_SIZE, pcm16.length);
+        samples.set(pcm16);
+        // Int16Array 使用平台字节序，几乎所有平台都是小端；大端平台逐个写入
+        if (new Uint8Array(new Uint16Array([1]).buffer)[0] !== 1) {
+            for (let i = 0; i < pcm16.length; i++) {
+                view.setInt16(MIC_FRAME_HEADER_SIZE + i * 2, pcm16[i], true);
+            }
+        }
+        return frame;
+    }
+
     // 使用AudioWorklet开始音频处理
     async function startAudioWorklet(stream) {
         isRecording = true;
+        micFrameSeq = 0;
 
         // 创建音频上下文
         audioContext = new AudioContext();
@@ -1316,11 +1348,7 @@ function init_app(){
                 }
 
                 if (isRecording && socket.readyState === WebSocket.OPEN) {
-                    socket.send(JSON.stringify({
-                        action: 'stream_data',
-                        data: Array.from(audioData),
-                        input_type: 'audio'
-                    }));
+                    socket.send(buildMicFrame(audioData, 16000));
                 }
             };
 
@@ -1398,6 +1426,7 @@ function init_app(){
         isPlaying = false;
         audioStartTime = 0;
         nextStartTime = 0; // 新增：重置预调度时间
+        audioEpoch++; // 解码中的旧音频块不再入队
     }
 
 
@@ -1474,6 +1503,7 @@ function init_app(){
 
     async function handleAudioBlob(blob) {
         // 你现有的PCM处理代码...
+        const epoch = audioEpoch;
         const pcmBytes = await blob.arrayBuffer();
         if (!pcmBytes || pcmBytes.byteLength === 0) {
             console.warn('收到空的PCM数据，跳过处理');
@@ -1488,6 +1518,11 @@ function init_app(){
             await audioPlayerContext.resume();
         }
 
+        if (epoch !== audioEpoch) {
+            // 等待解码期间用户打断了播放
+            return;
+        }
+
         const int16Array = new Int16Array(pcmBytes);
         const audioBuffer = audioPlayerContext.createBuffer(1, int16Array.length, 48000);
         const channelData = audioBuffer.getChannelData(0);
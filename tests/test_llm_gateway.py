@@ -0,0 +1,185 @@
+import asyncio
+
+import pytest
+
+from utils import llm_gateway
+from utils.llm_gateway import BREAKER_THRESHOLD, LLMUnavailableError, llm_ainvoke
+from utils.llm_scheduler import LLMScheduler
+
+
+class FakeLLM:
+    """behavior(call_index) 返回结果、抛出异常，或是一个协程函数"""
+
+    def __init__(self, model, behavior):
+        self.openai_api_base = 'https://llm.example.com/v1'
+        self.model_name = model
+        self.behavior = behavior
+        self.calls = 0
+        self.cancelled = 0
+
+    async def ainvoke(self, payload):
+        index = self.calls
+        self.calls += 1
+        try:
+            result = self.behavior(index)
+            if asyncio.iscoroutine(result):
+                result = await result
+            return result
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def fail(error=asyncio.TimeoutError):
+    def behavior(_):
+        raise error()
+    return behavior
+
+
+async def sleep_then(seconds, value):
+    await asyncio.sleep(seconds)
+    return value
+
+
+@pytest.fixture(autouse=True)
+def gateway(monkeypatch):
+    scheduler = LLMScheduler(foreground_marker=None)
+    monkeypatch.setattr(llm_gateway, 'get_llm_scheduler', lambda: scheduler)
+    monkeypatch.setattr(llm_gateway, '_endpoints', {})
+    monkeypatch.setattr(llm_gateway, 'BACKOFF_BASE', 0.0)
+
+
+def endpoint(llm):
+    return llm_gateway._endpoint_for(llm)
+
+
+def open_breaker(llm):
+    for _ in range(BREAKER_THRESHOLD):
+        endpoint(llm).record_failure()
+
+
+def test_breaker_opens_after_threshold_failures():
+    llm = FakeLLM('m', fail())
+
+    async def run():
+        for _ in range(BREAKER_THRESHOLD):
+            with pytest.raises(LLMUnavailableError):
+                await llm_ainvoke(llm, 'hi', fallback=False, max_attempts=1)
+        with pytest.raises(LLMUnavailableError, match='熔断'):
+            await llm_ainvoke(llm, 'hi', fallback=False, max_attempts=1)
+
+    asyncio.run(run())
+    assert llm.calls == BREAKER_THRESHOLD
+    assert endpoint(llm).health()['open']
+
+
+def test_only_one_probe_after_cooldown():
+    llm = FakeLLM('m', lambda _: sleep_then(0.05, 'ok'))
+    open_breaker(llm)
+    endpoint(llm).open_until = 0.0
+
+    async def run():
+        probe = asyncio.create_task(llm_ainvoke(llm, 'hi', fallback=False, max_attempts=1))
+        await asyncio.sleep(0.01)
+        with pytest.raises(LLMUnavailableError):
+            await llm_ainvoke(llm, 'hi', fallback=False, max_attempts=1)
+        return await probe
+
+    assert asyncio.run(run()) == 'ok'
+    assert llm.calls == 1
+    assert endpoint(llm).failures == 0 and not endpoint(llm).probing
+
+
+def test_failed_probe_reopens_breaker():
+    llm = FakeLLM('m', fail())
+    open_breaker(llm)
+    endpoint(llm).open_until = 0.0
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(llm_ainvoke(llm, 'hi', fallback=False, max_attempts=1))
+    assert not endpoint(llm).probing
+    assert endpoint(llm).health()['open']
+
+
+def test_probe_is_released_on_non_transient_error():
+    llm = FakeLLM('m', fail(ValueError))
+    open_breaker(llm)
+    endpoint(llm).open_until = 0.0
+    with pytest.raises(ValueError):
+        asyncio.run(llm_ainvoke(llm, 'hi', fallback=False, max_attempts=1))
+    assert not endpoint(llm).probing
+    # 非瞬时错误不计入熔断，下一个请求仍可作为探测放行
+    assert endpoint(llm).allow()
+
+
+def test_probe_is_released_on_cancellation():
+    llm = FakeLLM('m', lambda _: sleep_then(10, 'never'))
+    open_breaker(llm)
+    endpoint(llm).open_until = 0.0
+
+    async def run():
+        probe = asyncio.create_task(llm_ainvoke(llm, 'hi', fallback=False, max_attempts=1))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(run())
+    assert llm.cancelled == 1
+    assert not endpoint(llm).probing
+    assert endpoint(llm).failures == BREAKER_THRESHOLD
+
+
+def test_hedge_wins_when_primary_exceeds_p95(monkeypatch):
+    monkeypatch.setattr(llm_gateway, 'HEDGE_MIN_DELAY', 0.01)
+    primary = FakeLLM('slow', lambda _: sleep_then(10, 'primary'))
+    fallback = FakeLLM('fast', lambda _: 'fallback')
+    for _ in range(llm_gateway.HEDGE_MIN_SAMPLES):
+        endpoint(primary).record_success(0.02)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        result = await llm_ainvoke(primary, 'hi', fallback=fallback)
+        await asyncio.sleep(0)
+        return result, loop.time() - t0
+
+    result, elapsed = asyncio.run(run())
+    assert result == 'fallback'
+    assert elapsed < 1.0
+    assert primary.cancelled == 1
+    # 被取消的对冲请求不计入失败
+    assert endpoint(primary).failures == 0
+
+
+def test_primary_within_p95_is_not_hedged():
+    primary = FakeLLM('m', lambda _: 'primary')
+    fallback = FakeLLM('fb', lambda _: 'fallback')
+    assert asyncio.run(llm_ainvoke(primary, 'hi', fallback=fallback)) == 'primary'
+    assert fallback.calls == 0
+
+
+def test_retries_then_succeeds():
+    def behavior(index):
+        if index < 2:
+            raise asyncio.TimeoutError()
+        return 'ok'
+
+    llm = FakeLLM('m', behavior)
+    assert asyncio.run(llm_ainvoke(llm, 'hi', fallback=False)) == 'ok'
+    assert llm.calls == 3
+
+
+def test_unavailable_after_retries_exhausted():
+    llm = FakeLLM('m', fail())
+    with pytest.raises(LLMUnavailableError) as info:
+        asyncio.run(llm_ainvoke(llm, 'hi', fallback=False, max_attempts=3))
+    assert llm.calls == 3
+    assert isinstance(info.value.last_error, asyncio.TimeoutError)
+
+
+def test_non_transient_error_is_not_retried():
+    llm = FakeLLM('m', fail(ValueError))
+    with pytest.raises(ValueError):
+        asyncio.run(llm_ainvoke(llm, 'hi', fallback=False))
+    assert llm.calls == 1
+    assert endpoint(llm).failures == 0
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from utils import llm_scheduler
+from utils.llm_scheduler import LLMScheduler, Priority
+
+URL = 'https://llm.example.com/v1'
+
+
+@pytest.fixture
+def marker(tmp_path, monkeypatch):
+    """记录标记文件I/O发生的线程"""
+    io_threads = []
+    real_stat, real_utime = os.stat, os.utime
+
+    def stat(path, *args, **kwargs):
+        if str(path).endswith('.llm_foreground'):
+            io_threads.append(threading.current_thread())
+        return real_stat(path, *args, **kwargs)
+
+    def utime(path, *args, **kwargs):
+        io_threads.append(threading.current_thread())
+        return real_utime(path, *args, **kwargs)
+
+    monkeypatch.setattr(llm_scheduler.os, 'stat', stat)
+    monkeypatch.setattr(llm_scheduler.os, 'utime', utime)
+    return str(tmp_path / '.llm_foreground'), io_threads
+
+
+def test_foreground_marker_io_stays_off_the_event_loop(marker):
+    path, io_threads = marker
+    scheduler = LLMScheduler(foreground_marker=path)
+
+    async def run():
+        async with scheduler.slot(URL, Priority.FOREGROUND):
+            pass
+        await asyncio.sleep(0.05)
+        scheduler._foreground_at = 0.0
+        async with scheduler.slot(URL, Priority.BACKGROUND):
+            pass
+
+    with pytest.raises(asyncio.TimeoutError):
+        # 标记文件刚被写入，后台请求要等 FOREGROUND_HOLD_SECONDS
+        asyncio.run(asyncio.wait_for(run(), 1.0))
+    threads = list(io_threads)
+    assert threads and threading.main_thread() not in threads
+    assert os.path.exists(path)
+
+
+def test_background_waits_for_other_process_foreground(marker, monkeypatch):
+    monkeypatch.setattr(llm_scheduler, 'FOREGROUND_HOLD_SECONDS', 0.3)
+    path, _ = marker
+    open(path, 'a').close()
+    scheduler = LLMScheduler(foreground_marker=path)
+
+    async def run():
+        t0 = time.monotonic()
+        async with scheduler.slot(URL, Priority.BACKGROUND):
+            return time.monotonic() - t0
+
+    assert asyncio.run(run()) >= 0.25
+
+
+def test_idle_marker_does_not_delay_background(marker):
+    path, _ = marker
+    open(path, 'a').close()
+    os.utime(path, (0, 0))
+    scheduler = LLMScheduler(foreground_marker=path)
+
+    async def run():
+        t0 = time.monotonic()
+        for _ in range(20):
+            async with scheduler.slot(URL, Priority.BACKGROUND):
+                pass
+        return time.monotonic() - t0
+
+    assert asyncio.run(run()) < 0.2
+
+
+def test_marker_writes_are_throttled(marker):
+    path, io_threads = marker
+    scheduler = LLMScheduler(foreground_marker=path)
+
+    async def run():
+        for _ in range(10):
+            async with scheduler.slot(URL, Priority.FOREGROUND):
+                pass
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert len(io_threads) == 1
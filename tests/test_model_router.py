@@ -0,0 +1,76 @@
+from collections import deque
+
+import pytest
+
+from utils import model_router
+from utils.model_router import MIN_SAMPLES, route_model, routing_stats
+
+CORE_CONFIG = {
+    'OPENROUTER_URL': 'https://llm.example.com/v1',
+    'EMOTION_MODEL': 'fast-m',
+    'SUMMARY_MODEL': 'std-m',
+    'CORRECTION_MODEL': 'strong-m',
+    'SETTING_PROPOSER_MODEL': 'proposer-m',
+}
+
+SHORT = 'x' * 100
+LONG = 'x' * 5000
+
+
+def health(p50=None, error_rate=0.0, samples=MIN_SAMPLES * 2, open=False):
+    return {'p50': p50, 'error_rate': error_rate, 'samples': samples, 'open': open}
+
+
+@pytest.fixture(autouse=True)
+def decisions(monkeypatch):
+    monkeypatch.setattr(model_router, '_decisions', deque(maxlen=500))
+
+
+def use_health(monkeypatch, table):
+    """table: 模型 -> health，未列出的模型视为没有样本"""
+    monkeypatch.setattr(model_router, 'endpoint_health',
+                        lambda base_url, model: table.get(model, health(samples=0)))
+
+
+@pytest.mark.parametrize('task,payload,table,expected,reason', [
+    # 输入很短时降级到fast档
+    ('summary', SHORT, {}, 'fast-m', 'small_input'),
+    ('summary', LONG, {}, 'std-m', 'preferred'),
+    ('analyzer', [{'role': 'user', 'content': SHORT}], {}, 'fast-m', 'small_input'),
+    # 没有small_input或不允许fast档的任务不降级
+    ('review', SHORT, {}, 'strong-m', 'preferred'),
+    ('setting_proposer', SHORT, {}, 'proposer-m', 'preferred'),
+    # 熔断或错误率过高时按候选顺序换用健康的模型
+    ('summary', LONG, {'std-m': health(open=True)}, 'fast-m', 'unhealthy_preferred'),
+    ('summary', SHORT, {'fast-m': health(error_rate=0.8)}, 'std-m', 'unhealthy_small_input'),
+    ('setting_proposer', LONG, {'proposer-m': health(open=True)}, 'std-m', 'unhealthy_preferred'),
+    # 样本不足时不参考错误率
+    ('summary', LONG, {'std-m': health(error_rate=1.0, samples=MIN_SAMPLES - 1)}, 'std-m', 'preferred'),
+    # 没有健康的候选时保留原选择
+    ('summary', LONG, {m: health(open=True) for m in ('fast-m', 'std-m', 'strong-m')}, 'std-m', 'preferred'),
+    # 首选模型p50超出预算时，换用最快的健康候选
+    ('summary', LONG, {'std-m': health(p50=30.0), 'fast-m': health(p50=5.0), 'strong-m': health(p50=10.0)},
+     'fast-m', 'slow_preferred'),
+    ('summary', LONG, {'std-m': health(p50=10.0), 'fast-m': health(p50=5.0)}, 'std-m', 'preferred'),
+    ('summary', LONG, {'std-m': health(p50=30.0), 'fast-m': health(p50=5.0, samples=MIN_SAMPLES - 1)},
+     'std-m', 'preferred'),
+    ('summary', LONG, {'std-m': health(p50=30.0), 'fast-m': health(p50=5.0, open=True)}, 'std-m', 'preferred'),
+    ('summary', LONG, {'std-m': health(p50=30.0), 'fast-m': health(p50=40.0)}, 'std-m', 'preferred'),
+])
+def test_route_model(monkeypatch, task, payload, table, expected, reason):
+    use_health(monkeypatch, table)
+    assert route_model(task, payload, CORE_CONFIG) == expected
+    assert routing_stats()['recent'][-1]['reason'] == reason
+
+
+def test_decisions_are_recorded(monkeypatch):
+    use_health(monkeypatch, {'std-m': health(open=True)})
+    route_model('summary', SHORT, CORE_CONFIG)
+    route_model('summary', LONG, CORE_CONFIG)
+    route_model('review', LONG, CORE_CONFIG)
+    stats = routing_stats()
+    assert stats['counts'] == {'summary': {'fast-m': 2}, 'review': {'strong-m': 1}}
+    decision = stats['recent'][1]
+    assert decision['task'] == 'summary' and decision['chars'] == len(LONG)
+    assert decision['model'] == 'fast-m' and decision['reason'] == 'unhealthy_preferred'
+    assert len(routing_stats(limit=2)['recent']) == 2
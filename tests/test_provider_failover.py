@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from main_helper import provider_failover
+from main_helper.provider_failover import RealtimeFailover
+
+PROVIDERS = [
+    {'type': 'qwen', 'url': 'wss://qwen', 'model': 'm1', 'api_key': 'k1'},
+    {'type': 'glm', 'url': 'wss://glm', 'model': 'm2', 'api_key': 'k2'},
+    {'type': 'openai', 'url': 'wss://openai', 'model': 'm3', 'api_key': 'k3'},
+]
+
+
+class FakeClient:
+    def __init__(self, provider_type):
+        self.type = provider_type
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeConnector:
+    """behaviors: 服务商类型 -> ('ok'|'fail'|'hang'|'late', 延迟秒数)，late 表示取消时握手已经完成"""
+
+    def __init__(self, behaviors):
+        self.behaviors = behaviors
+        self.started = []
+        self.clients = []
+
+    async def __call__(self, provider):
+        kind, delay = self.behaviors.get(provider['type'], ('ok', 0.0))
+        self.started.append(provider['type'])
+        if kind == 'hang':
+            await asyncio.sleep(3600)
+        if kind == 'late':
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                pass
+        await asyncio.sleep(delay)
+        if kind == 'fail':
+            raise ConnectionError(f"{provider['type']} refused")
+        client = FakeClient(provider['type'])
+        self.clients.append(client)
+        return client
+
+
+@pytest.fixture(autouse=True)
+def fast_timings(monkeypatch):
+    monkeypatch.setattr(provider_failover, 'PROVIDER_STAGGER', 0.05)
+    monkeypatch.setattr(provider_failover, 'PROVIDER_CONNECT_TIMEOUT', 1.0)
+
+
+def test_primary_wins_without_starting_fallbacks():
+    failover = RealtimeFailover('test')
+    connector = FakeConnector({'qwen': ('ok', 0.0)})
+    provider, client = asyncio.run(failover.connect(PROVIDERS, connector))
+    assert provider['type'] == 'qwen' and client.type == 'qwen'
+    assert connector.started == ['qwen']
+    assert failover.failovers == 0
+
+
+def test_primary_failure_falls_over_immediately():
+    failover = RealtimeFailover('test')
+    connector = FakeConnector({'qwen': ('fail', 0.0)})
+    provider, client = asyncio.run(failover.connect(PROVIDERS, connector))
+    assert provider['type'] == 'glm'
+    assert failover.failovers == 1
+    stats = failover.stats()
+    assert stats['preferred'] == 'glm'
+    assert stats['down'] == ['qwen']
+
+
+def test_hanging_primary_is_cancelled_after_fallback_wins():
+    failover = RealtimeFailover('test')
+    connector = FakeConnector({'qwen': ('hang', 0.0)})
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        result = await failover.connect(PROVIDERS, connector)
+        return result, loop.time() - t0, asyncio.all_tasks() - {asyncio.current_task()}
+
+    (provider, client), elapsed, leftover = asyncio.run(run())
+    assert provider['type'] == 'glm'
+    assert elapsed < 0.5
+    assert not leftover
+
+
+def test_losers_that_connect_are_closed():
+    failover = RealtimeFailover('test')
+    # 主服务商在被取消时刚好连上，备用服务商之后才连上；胜出者之外的连接都要关闭
+    connector = FakeConnector({'qwen': ('late', 0.0), 'glm': ('ok', 0.0), 'openai': ('ok', 0.0)})
+    provider, client = asyncio.run(failover.connect(PROVIDERS, connector))
+    assert provider['type'] == 'glm' and not client.closed
+    losers = [c for c in connector.clients if c is not client]
+    assert [c.type for c in losers] == ['qwen']
+    assert all(c.closed for c in losers)
+
+
+def test_simultaneous_connections_keep_one():
+    failover = RealtimeFailover('test')
+    connector = FakeConnector({'qwen': ('ok', 0.1), 'glm': ('ok', 0.05)})
+
+    async def run():
+        result = await failover.connect(PROVIDERS[:2], connector)
+        await asyncio.sleep(0)
+        return result
+
+    provider, client = asyncio.run(run())
+    assert len(connector.clients) == 2
+    assert [c for c in connector.clients if not c.closed] == [client]
+
+
+def test_all_failed_raises_last_error():
+    failover = RealtimeFailover('test')
+    connector = FakeConnector({t['type']: ('fail', 0.0) for t in PROVIDERS})
+    with pytest.raises(ConnectionError):
+        asyncio.run(failover.connect(PROVIDERS, connector))
+    assert sorted(failover.stats()['down']) == ['glm', 'openai', 'qwen']
+
+
+def test_connect_timeout_marks_provider_down(monkeypatch):
+    monkeypatch.setattr(provider_failover, 'PROVIDER_CONNECT_TIMEOUT', 0.05)
+    failover = RealtimeFailover('test')
+    connector = FakeConnector({'qwen': ('late', 0.0)})
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(failover.connect(PROVIDERS[:1], connector))
+    assert failover.stats()['down'] == ['qwen']
+    assert [c.closed for c in connector.clients] == [True]
+
+
+def test_order_puts_sticky_first_and_down_last():
+    failover = RealtimeFailover('test')
+    assert [p['type'] for p in failover.order(PROVIDERS)] == ['qwen', 'glm', 'openai']
+    asyncio.run(failover.connect(PROVIDERS, FakeConnector({'qwen': ('fail', 0.0), 'glm': ('fail', 0.0)})))
+    # openai 胜出后优先使用，失败的两个排在最后并保持配置顺序
+    assert [p['type'] for p in failover.order(PROVIDERS)] == ['openai', 'qwen', 'glm']
+
+
+def test_order_expires(monkeypatch):
+    failover = RealtimeFailover('test')
+    asyncio.run(failover.connect(PROVIDERS, FakeConnector({'qwen': ('fail', 0.0)})))
+    now = provider_failover.time.monotonic()
+    monkeypatch.setattr(provider_failover.time, 'monotonic',
+                        lambda: now + provider_failover.PROVIDER_STICKY_SECONDS + 1)
+    assert [p['type'] for p in failover.order(PROVIDERS)] == ['qwen', 'glm', 'openai']
+
+
+def test_report_failure_demotes_preferred_provider():
+    failover = RealtimeFailover('test')
+    asyncio.run(failover.connect(PROVIDERS, FakeConnector({'qwen': ('fail', 0.0)})))
+    failover.report_failure('glm', '欠费')
+    stats = failover.stats()
+    assert stats['preferred'] is None
+    assert sorted(stats['down']) == ['glm', 'qwen']
+    assert [p['type'] for p in failover.order(PROVIDERS)] == ['openai', 'qwen', 'glm']
@@ -0,0 +1,58 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from utils.resampler import StreamingResampler
+
+
+def sine(sr, seconds, freq):
+    t = np.arange(int(sr * seconds)) / sr
+    return np.sin(2 * np.pi * freq * t).astype(np.float32) * 0.5
+
+
+@pytest.mark.parametrize('orig_sr,target_sr', [(24000, 48000), (48000, 16000), (16000, 24000)])
+def test_output_length_matches_ratio(orig_sr, target_sr):
+    resampler = StreamingResampler(orig_sr, target_sr)
+    x = sine(orig_sr, 1.0, 440)
+    y = np.concatenate([resampler.process(x[i:i + 480]) for i in range(0, len(x), 480)])
+    assert abs(len(y) - target_sr) <= 1
+
+
+def test_chunked_equals_whole():
+    x = sine(24000, 0.5, 440)
+    whole = StreamingResampler(24000, 48000).process(x)
+    resampler = StreamingResampler(24000, 48000)
+    sizes = [1, 7, 480, 1000, 3]
+    chunks, i = [], 0
+    while i < len(x):
+        size = sizes[len(chunks) % len(sizes)]
+        chunks.append(resampler.process(x[i:i + size]))
+        i += size
+    assert np.allclose(np.concatenate(chunks), whole, atol=1e-5)
+
+
+def test_tone_is_preserved_and_aliases_are_rejected():
+    # 48k->16k：1kHz保留，12kHz（高于8kHz奈奎斯特频率）应被滤除
+    resampler = StreamingResampler(48000, 16000)
+    passed = resampler.process(sine(48000, 0.5, 1000))[400:]
+    resampler.reset()
+    aliased = resampler.process(sine(48000, 0.5, 12000))[400:]
+    assert np.sqrt(np.mean(passed ** 2)) == pytest.approx(0.5 / np.sqrt(2), rel=0.05)
+    assert np.sqrt(np.mean(aliased ** 2)) < 0.005
+
+
+def test_int16_round_trip_and_passthrough():
+    data = (sine(16000, 0.1, 300) * 32767).astype(np.int16)
+    out = StreamingResampler(16000, 48000).process(data)
+    assert out.dtype == np.int16
+    same = StreamingResampler(16000, 16000)
+    assert same.passthrough
+    assert np.array_equal(same.process(data), data)
+
+
+def test_async_bytes_matches_sync():
+    data = (sine(24000, 1.0, 440) * 32767).astype(np.int16).tobytes()
+    expected = StreamingResampler(24000, 48000).process_bytes(data)
+    result = asyncio.run(StreamingResampler(24000, 48000).process_bytes_async(data))
+    assert result == expected
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from brain.response_cache import ResponseCache
+
+
+def test_fingerprint_ignores_whitespace_but_not_content():
+    a = ResponseCache.fingerprint('m', [{'role': 'user', 'content': 'hello   world\n'}])
+    b = ResponseCache.fingerprint('m', [{'role': 'user', 'content': ' hello world'}])
+    c = ResponseCache.fingerprint('m', [{'role': 'user', 'content': 'hello there'}])
+    assert a == b != c
+    assert a != ResponseCache.fingerprint('other', [{'role': 'user', 'content': 'hello world'}])
+    assert a != ResponseCache.fingerprint('m', [{'role': 'user', 'content': 'hello world'}], extra=2)
+
+
+def test_hit_returns_copy():
+    cache = ResponseCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {'tasks': [1]}, True
+
+    async def run():
+        first = await cache.get_or_compute('k', compute)
+        first['tasks'].append(2)
+        return await cache.get_or_compute('k', compute)
+
+    assert asyncio.run(run()) == {'tasks': [1]}
+    assert len(calls) == 1
+    assert cache.stats() == {'size': 1, 'hits': 1, 'misses': 1}
+
+
+def test_uncacheable_result_is_not_stored():
+    cache = ResponseCache()
+
+    async def compute():
+        return 'partial', False
+
+    async def run():
+        await cache.get_or_compute('k', compute)
+        await cache.get_or_compute('k', compute)
+
+    asyncio.run(run())
+    assert cache.stats()['misses'] == 2
+
+
+def test_concurrent_lookups_share_one_call():
+    cache = ResponseCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'value', True
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compute('k', compute) for _ in range(5)))
+
+    assert asyncio.run(run()) == ['value'] * 5
+    assert len(calls) == 1
+
+
+def test_errors_propagate_to_waiters_and_are_not_cached():
+    cache = ResponseCache()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise ValueError('bad json')
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compute('k', compute) for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert cache.stats()['size'] == 0
+
+
+def test_cancelled_owner_does_not_fail_waiters():
+    cache = ResponseCache()
+
+    async def slow():
+        await asyncio.sleep(10)
+        return 'never', True
+
+    async def fast():
+        return 'value', True
+
+    async def run():
+        owner = asyncio.create_task(cache.get_or_compute('k', slow))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_compute('k', fast))
+        await asyncio.sleep(0)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await waiter
+
+    assert asyncio.run(run()) == 'value'
@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+from memory.settings import ImportantSettingsManager
+
+
+def messages(*texts):
+    return [SimpleNamespace(type='human', content=[{'type': 'text', 'text': t}]) for t in texts]
+
+
+def manager(tmp_path):
+    m = ImportantSettingsManager(max_tracked_sessions=2)
+    m.settings_file = {'兰兰': str(tmp_path / 'settings_兰兰.json')}
+    return m
+
+
+def test_only_turns_after_watermark_are_new(tmp_path):
+    m = manager(tmp_path)
+    first = messages('我叫小明', '我喜欢猫')
+    assert m._filter_new_turns(first, '兰兰', 's1') == first
+    m._mark_turns_processed(first, '兰兰', 's1')
+    grown = first + messages('我喜欢猫')
+    # 内容重复但位置不同的轮次仍然是新的
+    assert m._filter_new_turns(grown, '兰兰', 's1') == grown[2:]
+
+
+def test_same_text_in_another_session_is_new(tmp_path):
+    m = manager(tmp_path)
+    m._mark_turns_processed(messages('你好'), '兰兰', 's1')
+    assert len(m._filter_new_turns(messages('你好'), '兰兰', 's2')) == 1
+    assert len(m._filter_new_turns(messages('你好'), '兰兰', None)) == 1
+
+
+def test_watermark_survives_restart_and_is_bounded(tmp_path):
+    m = manager(tmp_path)
+    for session_id in ('s1', 's2', 's3'):
+        m._mark_turns_processed(messages('a', 'b'), '兰兰', session_id)
+    restarted = manager(tmp_path)
+    assert restarted._filter_new_turns(messages('a', 'b'), '兰兰', 's3') == []
+    assert len(restarted._filter_new_turns(messages('a', 'b'), '兰兰', 's1')) == 2
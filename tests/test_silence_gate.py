@@ -0,0 +1,64 @@
+import numpy as np
+
+from utils.silence_gate import FRAME_MS, SilenceGate
+
+SR = 16000
+FRAME_BYTES = SR * FRAME_MS // 1000 * 2
+
+
+def tone(ms, amplitude=8000, freq=220):
+    t = np.arange(SR * ms // 1000) / SR
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.int16).tobytes()
+
+
+def noise(ms, amplitude=30, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, amplitude, SR * ms // 1000).clip(-32768, 32767).astype(np.int16).tobytes()
+
+
+def test_silence_is_suppressed_except_keepalives():
+    gate = SilenceGate(keepalive_interval_ms=500, keepalive_ms=20)
+    out = gate.process(noise(2000))
+    # 2秒静音只发送4次、每次20ms的保活
+    assert len(out) == 4 * 2 * FRAME_BYTES
+    assert out == bytes(len(out))
+    assert not gate.is_open
+    assert gate.stats()['keepalives'] == 4
+
+
+def test_speech_opens_gate_with_preroll_and_hangover():
+    gate = SilenceGate(preroll_ms=200, hangover_ms=300, keepalive_interval_ms=0)
+    assert gate.process(noise(1000)) == b''
+    speech = tone(500)
+    out = gate.process(speech)
+    assert gate.is_open
+    # 预录缓冲区（200ms，其中最后一帧是语音的第一帧）在语音之前补发，语音本身完整发送
+    assert len(out) == len(speech) + 200 * 32 - FRAME_BYTES
+    assert out.endswith(speech)
+
+    tail = gate.process(noise(1000, seed=1))
+    assert len(tail) == 300 * 32
+    assert not gate.is_open
+
+
+def test_short_click_does_not_open_gate():
+    gate = SilenceGate(keepalive_interval_ms=0)
+    gate.process(noise(500))
+    assert gate.process(tone(FRAME_MS)) == b''
+    assert not gate.is_open
+
+
+def test_partial_frames_are_carried_over():
+    gate = SilenceGate(preroll_ms=0, hangover_ms=1000, keepalive_interval_ms=0)
+    speech = tone(100)
+    out = b''.join(gate.process(speech[i:i + 100]) for i in range(0, len(speech), 100))
+    assert len(out) % FRAME_BYTES == 0
+    assert out == speech[:len(out)]
+    assert len(out) >= len(speech) - 2 * FRAME_BYTES
+
+
+def test_disabled_gate_passes_through():
+    gate = SilenceGate()
+    gate.enabled = False
+    data = noise(100)
+    assert gate.process(data) == data
@@ -0,0 +1,83 @@
+import time
+
+from memory import ingest
+from memory.ingest import TurnJournal
+
+
+def turns(session_id, *keys):
+    return [{'session_id': session_id, 'key': key, 'seq': i, 'role': 'user', 'content': key}
+            for i, key in enumerate(keys)]
+
+
+def test_append_is_idempotent_and_persisted(tmp_path):
+    journal = TurnJournal(str(tmp_path))
+    assert journal.append('兰兰', turns('s1', 'a', 'b')) == (2, 0)
+    assert journal.append('兰兰', turns('s1', 'a', 'b', 'c')) == (1, 2)
+
+    reloaded = TurnJournal(str(tmp_path))
+    assert [t['content'] for t in reloaded.get_session('兰兰', 's1')] == ['a', 'b', 'c']
+    assert reloaded.characters() == ['兰兰']
+
+
+def test_session_is_ordered_by_seq(tmp_path):
+    journal = TurnJournal(str(tmp_path))
+    batch = turns('s1', 'a', 'b', 'c')
+    journal.append('兰兰', list(reversed(batch)))
+    assert [t['content'] for t in journal.get_session('兰兰', 's1')] == ['a', 'b', 'c']
+
+
+def test_dropped_session_rejects_late_turns_after_reload(tmp_path):
+    journal = TurnJournal(str(tmp_path))
+    journal.append('兰兰', turns('s1', 'a') + turns('s2', 'x'))
+    journal.drop_session('兰兰', 's1')
+    assert journal.is_finalized('兰兰', 's1')
+    assert journal.append('兰兰', turns('s1', 'late')) == (0, 1)
+
+    reloaded = TurnJournal(str(tmp_path))
+    assert reloaded.is_finalized('兰兰', 's1')
+    assert reloaded.get_session('兰兰', 's1') == []
+    assert reloaded.append('兰兰', turns('s1', 'later')) == (0, 1)
+    assert [t['content'] for t in reloaded.get_session('兰兰', 's2')] == ['x']
+
+
+def test_completed_steps_survive_reload_and_are_dropped_with_session(tmp_path):
+    journal = TurnJournal(str(tmp_path))
+    journal.append('兰兰', turns('s1', 'a'))
+    journal.mark_step('兰兰', 's1', 'recent')
+    journal.mark_step('兰兰', 's1', 'recent')
+    assert journal.completed_steps('兰兰', 's1') == {'recent'}
+
+    reloaded = TurnJournal(str(tmp_path))
+    assert reloaded.completed_steps('兰兰', 's1') == {'recent'}
+    assert [t['content'] for t in reloaded.get_session('兰兰', 's1')] == ['a']
+    reloaded.append('兰兰', turns('s2', 'x'))
+    reloaded.drop_session('兰兰', 's1')
+    assert reloaded.completed_steps('兰兰', 's1') == set()
+    assert TurnJournal(str(tmp_path)).completed_steps('兰兰', 's1') == set()
+
+
+def test_tombstones_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, 'FINALIZED_SESSIONS_LIMIT', 3)
+    journal = TurnJournal(str(tmp_path))
+    for i in range(5):
+        journal.drop_session('兰兰', f's{i}')
+    assert list(journal.finalized['兰兰']) == ['s2', 's3', 's4']
+    assert not TurnJournal(str(tmp_path)).is_finalized('兰兰', 's0')
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    journal = TurnJournal(str(tmp_path))
+    journal.append('兰兰', turns('s1', 'a'))
+    with open(journal._journal_path('兰兰'), 'a', encoding='utf-8') as f:
+        f.write('{"session_id": "s1", "ke')
+    assert [t['content'] for t in TurnJournal(str(tmp_path)).get_session('兰兰', 's1')] == ['a']
+
+
+def test_stale_sessions(tmp_path, monkeypatch):
+    journal = TurnJournal(str(tmp_path))
+    now = time.time()
+    monkeypatch.setattr(ingest.time, 'time', lambda: now - 600)
+    journal.append('兰兰', turns('old', 'a'))
+    monkeypatch.setattr(ingest.time, 'time', lambda: now)
+    journal.append('兰兰', turns('new', 'b'))
+    assert journal.stale_sessions('兰兰', 300) == ['old']
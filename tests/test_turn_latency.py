@@ -0,0 +1,67 @@
+import pytest
+
+from main_helper import turn_latency
+from main_helper.turn_latency import TurnLatencyTracker, _percentile
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(turn_latency.time, 'perf_counter', lambda: now[0])
+    return now
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert _percentile(values, 50) == 50
+    assert _percentile(values, 95) == 95
+    assert _percentile(values, 99) == 99
+    assert _percentile([7], 99) == 7
+
+
+def test_full_turn_is_committed_on_last_stage(clock):
+    tracker = TurnLatencyTracker()
+    tracker.start_turn()
+    for stage, delay in (('first_delta', 0.3), ('first_tts_request', 0.05),
+                         ('first_tts_audio', 0.2), ('first_ws_send', 0.01)):
+        clock[0] += delay
+        tracker.mark(stage)
+    assert tracker.turns == 1
+    timeline = tracker.recent()[0]
+    assert timeline['first_delta'] == pytest.approx(300.0)
+    assert timeline['first_ws_send'] == pytest.approx(560.0)
+
+
+def test_only_first_mark_counts_and_marks_without_turn_are_ignored(clock):
+    tracker = TurnLatencyTracker()
+    tracker.mark('first_delta')
+    tracker.start_turn()
+    clock[0] += 0.1
+    tracker.mark('first_delta')
+    clock[0] += 0.1
+    tracker.mark('first_delta')
+    tracker.start_turn()
+    assert tracker.recent() == [{'first_delta': pytest.approx(100.0), 'at': tracker.recent()[0]['at']}]
+
+
+def test_turn_without_any_stage_is_dropped(clock):
+    tracker = TurnLatencyTracker()
+    tracker.start_turn()
+    tracker.start_turn()
+    assert tracker.turns == 0
+
+
+def test_summary_and_history_window(clock):
+    tracker = TurnLatencyTracker(history_size=10)
+    for i in range(20):
+        tracker.start_turn()
+        clock[0] += (i + 1) / 1000
+        tracker.mark('first_delta')
+    tracker.start_turn()
+    summary = tracker.summary()
+    assert summary['turns'] == 20 and summary['window'] == 10
+    stage = summary['stages']['first_delta']
+    assert stage['count'] == 10
+    assert stage['p50'] == pytest.approx(15.0)
+    assert stage['p99'] == pytest.approx(20.0)
+    assert 'first_ws_send' not in summary['stages']
@@ -0,0 +1,71 @@
+import pytest
+
+from main_helper import turn_tuning
+from main_helper.turn_tuning import (CUTOFF_WINDOW_MS, MAX_SILENCE_MS, MIN_SILENCE_MS, STEP_DOWN_MS,
+                                     STEP_UP_MS, EndOfTurnTuner)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(turn_tuning.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def turn(tuner, clock, gap_ms):
+    tuner.speech_stopped()
+    clock[0] += gap_ms / 1000
+    update = tuner.speech_started()
+    if update is not None:
+        tuner.applied(update)
+    return update
+
+
+def test_speech_started_without_stop_is_ignored(clock):
+    tuner = EndOfTurnTuner()
+    assert tuner.speech_started() is None
+    assert tuner.turns == 0
+
+
+def test_cutoff_raises_silence_past_the_pause(clock):
+    tuner = EndOfTurnTuner(silence_ms=500)
+    update = turn(tuner, clock, 200)
+    # 服务端等了500ms，用户又停了200ms才继续，这次句中停顿约700ms
+    assert update == 800
+    assert tuner.cutoffs == 1
+    assert tuner.pauses[-1] == pytest.approx(700)
+
+
+def test_cutoff_step_is_at_least_step_up(clock):
+    tuner = EndOfTurnTuner(silence_ms=500)
+    tuner.applied(300)
+    turn(tuner, clock, 10)
+    assert tuner.silence_ms == 500 + STEP_UP_MS
+
+
+def test_normal_turns_decay_slowly_and_batch_updates(clock):
+    tuner = EndOfTurnTuner(silence_ms=800)
+    updates = [turn(tuner, clock, CUTOFF_WINDOW_MS + 5000) for _ in range(10)]
+    assert tuner.silence_ms == 800 - 10 * STEP_DOWN_MS
+    # 变化累计超过 MIN_UPDATE_MS 之前不下发
+    assert [u for u in updates if u is not None] == [800 - 7 * STEP_DOWN_MS]
+    assert tuner.cutoffs == 0
+
+
+def test_silence_is_clamped(clock):
+    tuner = EndOfTurnTuner(silence_ms=500)
+    for _ in range(5):
+        turn(tuner, clock, 1400)
+    assert tuner.silence_ms == MAX_SILENCE_MS
+    for _ in range(200):
+        turn(tuner, clock, CUTOFF_WINDOW_MS + 1000)
+    assert tuner.silence_ms == MIN_SILENCE_MS
+
+
+def test_stats(clock):
+    tuner = EndOfTurnTuner()
+    turn(tuner, clock, 100)
+    turn(tuner, clock, 5000)
+    stats = tuner.stats()
+    assert stats['turns'] == 2 and stats['cutoffs'] == 1
+    assert stats['cutoff_rate'] == 0.5
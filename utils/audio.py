@@ -6,8 +6,43 @@ from openai import OpenAI
 import copy
 # from funasr import AutoModel
 import numpy as np
+import struct
 #########
 
+# 麦克风二进制帧：8字节小端头 + PCM16LE 单声道采样
+#   frame_type(uint8) | flags(uint8) | sample_rate(uint16, Hz) | seq(uint32)
+MIC_FRAME_HEADER = struct.Struct('<BBHI')
+MIC_FRAME_PCM16 = 1
+
+
+def parse_mic_frame(frame):
+    """解析前端发来的麦克风二进制帧，返回与 stream_data 消息相同结构的字典"""
+    if len(frame) < MIC_FRAME_HEADER.size:
+        raise ValueError(f"帧长度过短: {len(frame)} bytes")
+    frame_type, _flags, sample_rate, seq = MIC_FRAME_HEADER.unpack_from(frame)
+    if frame_type != MIC_FRAME_PCM16:
+        raise ValueError(f"未知的帧类型: {frame_type}")
+    payload = frame[MIC_FRAME_HEADER.size:]
+    if len(payload) % 2:
+        raise ValueError(f"PCM16数据长度不是偶数: {len(payload)} bytes")
+    return {"action": "stream_data", "input_type": "audio", "data": payload, "seq": seq, "sample_rate": sample_rate}
+
+
+# 同步连接器发往monitor的音频帧：4字节小端的语音代际号 + PCM16LE
+# 每次用户打断（开始说话）代际号加一，monitor据此丢弃打断之前的音频
+SYNC_AUDIO_HEADER = struct.Struct('<I')
+
+
+def pack_sync_audio(generation, pcm):
+    return SYNC_AUDIO_HEADER.pack(generation) + pcm
+
+
+def unpack_sync_audio(frame):
+    """返回 (generation, pcm)"""
+    (generation,) = SYNC_AUDIO_HEADER.unpack_from(frame)
+    return generation, frame[SYNC_AUDIO_HEADER.size:]
+
+
 def make_wav_header(data_length, sample_rate, num_channels, sample_width):
     buffer = io.BytesIO()
     with wave.open(buffer, 'wb') as wf:
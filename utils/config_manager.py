@@ -34,6 +34,8 @@ class ConfigManager:
         self.memory_dir = self.app_docs_dir / "memory"
         self.project_config_dir = self._get_project_config_directory()
         self.project_memory_dir = self._get_project_memory_directory()
+        # 配置文件保存后的回调，用于让进程内的配置缓存立即失效
+        self._change_listeners = []
     
     def _get_documents_directory(self):
         """获取用户文档目录（使用系统API）"""
@@ -274,6 +276,30 @@ class ConfigManager:
         except Exception as e:
             print(f"Error saving {filename}: {e}", file=sys.stderr)
             raise
+        self.notify_config_changed(filename)
+    
+    def add_change_listener(self, callback):
+        """
+        注册配置变更回调
+        
+        Args:
+            callback: 接收文件名参数的函数，配置文件被保存后调用
+        """
+        if callback not in self._change_listeners:
+            self._change_listeners.append(callback)
+    
+    def notify_config_changed(self, filename):
+        """
+        通知配置文件已被修改。直接写配置文件（而非通过save_json_config）的代码需要手动调用
+        
+        Args:
+            filename: 被修改的配置文件名
+        """
+        for callback in list(self._change_listeners):
+            try:
+                callback(filename)
+            except Exception as e:
+                print(f"Warning: config change listener failed for {filename}: {e}", file=sys.stderr)
     
     def get_memory_path(self, filename):
         """
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+LLM客户端工厂
+按 (模型, base_url, api_key, 参数) 缓存 ChatOpenAI / AsyncOpenAI / OpenAIEmbeddings 实例，
+所有实例共享一组有上限的HTTP连接池，从而复用TLS握手和keep-alive连接。
+核心配置（core_config.json）发生变化时，缓存的客户端会被清空。
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 连接池上限：辅助LLM调用都是少量长请求，不需要太多连接
+POOL_MAX_CONNECTIONS = 32
+POOL_MAX_KEEPALIVE = 16
+POOL_KEEPALIVE_EXPIRY = 60.0
+# 客户端缓存上限，超过后淘汰最久未使用的
+MAX_CACHED_CLIENTS = 64
+
+_lock = threading.RLock()
+_clients = OrderedDict()
+# 缓存中客户端的构造参数 {id(client): (kind, model, base_url, api_key, params)}，供网关构造备用模型
+_client_specs = {}
+_config_version = None
+_sync_http_client = None
+# httpx.AsyncClient的连接绑定在创建它的事件循环上，因此每个事件循环各有一个连接池 {id(loop): (loop, client)}
+_async_http_clients = {}
+
+
+def _pool_limits():
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+def _get_sync_http_client():
+    global _sync_http_client
+    if _sync_http_client is None or _sync_http_client.is_closed:
+        _sync_http_client = httpx.Client(limits=_pool_limits(), timeout=httpx.Timeout(60.0, connect=10.0))
+    return _sync_http_client
+
+
+def _current_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _get_async_http_client(loop):
+    # 清理已关闭的事件循环遗留的连接池
+    for loop_id, (old_loop, _) in list(_async_http_clients.items()):
+        if old_loop.is_closed():
+            del _async_http_clients[loop_id]
+    entry = _async_http_clients.get(id(loop))
+    if entry is None or entry[0] is not loop or entry[1].is_closed:
+        client = httpx.AsyncClient(limits=_pool_limits(), timeout=httpx.Timeout(60.0, connect=10.0))
+        _async_http_clients[id(loop)] = (loop, client)
+        return client
+    return entry[1]
+
+
+def _check_config_version():
+    """核心配置版本变化时清空客户端缓存（连接池保留，正在进行的请求不受影响）"""
+    global _config_version
+    from config import get_config_version
+    version = get_config_version()
+    if version != _config_version:
+        if _config_version is not None and _clients:
+            logger.info(f"核心配置已更新，清空 {len(_clients)} 个缓存的LLM客户端")
+        _clients.clear()
+        _client_specs.clear()
+        _config_version = version
+
+
+def _cached(kind, factory, model, base_url, api_key, params):
+    loop = _current_loop()
+    key = (kind, model, base_url, api_key, json.dumps(params, sort_keys=True, default=str), id(loop) if loop else None)
+    with _lock:
+        _check_config_version()
+        client = _clients.get(key)
+        if client is not None:
+            _clients.move_to_end(key)
+            return client
+        async_http_client = _get_async_http_client(loop) if loop else None
+        client = factory(async_http_client)
+        _clients[key] = client
+        _client_specs[id(client)] = (kind, model, base_url, api_key, params)
+        while len(_clients) > MAX_CACHED_CLIENTS:
+            _, evicted = _clients.popitem(last=False)
+            _client_specs.pop(id(evicted), None)
+        return client
+
+
+def get_chat_llm(model, base_url, api_key, **params):
+    """获取（缓存的）ChatOpenAI实例，params 为 temperature、extra_body 等其余构造参数"""
+    from langchain_openai import ChatOpenAI
+
+    def factory(async_http_client):
+        kwargs = dict(params)
+        kwargs['http_client'] = _get_sync_http_client()
+        if async_http_client is not None:
+            kwargs['http_async_client'] = async_http_client
+        return ChatOpenAI(model=model, base_url=base_url, api_key=api_key, **kwargs)
+
+    return _cached('chat', factory, model, base_url, api_key, params)
+
+
+def get_embeddings(model, base_url, api_key, **params):
+    """获取（缓存的）OpenAIEmbeddings实例"""
+    from langchain_openai import OpenAIEmbeddings
+
+    def factory(async_http_client):
+        kwargs = dict(params)
+        kwargs['http_client'] = _get_sync_http_client()
+        if async_http_client is not None:
+            kwargs['http_async_client'] = async_http_client
+        return OpenAIEmbeddings(model=model, base_url=base_url, api_key=api_key, **kwargs)
+
+    return _cached('embeddings', factory, model, base_url, api_key, params)
+
+
+def get_async_openai(base_url, api_key, **params):
+    """获取（缓存的）AsyncOpenAI实例，必须在事件循环中调用"""
+    from openai import AsyncOpenAI
+
+    loop = _current_loop()
+    if loop is None:
+        raise RuntimeError("get_async_openai 必须在事件循环中调用")
+
+    def factory(async_http_client):
+        return AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=async_http_client, **params)
+
+    return _cached('async_openai', factory, None, base_url, api_key, params)
+
+
+def get_client_spec(client):
+    """返回由本工厂创建的客户端的构造参数 (kind, model, base_url, api_key, params)，未知客户端返回None"""
+    with _lock:
+        spec = _client_specs.get(id(client))
+        # 客户端被淘汰后id可能被复用，需要确认仍是同一个对象
+        if spec is not None and any(c is client for c in _clients.values()):
+            return spec
+        return None
+
+
+def clear_llm_clients():
+    """清空客户端缓存"""
+    with _lock:
+        _clients.clear()
+        _client_specs.clear()
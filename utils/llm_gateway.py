@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+统一的LLM调用网关
+所有辅助LLM调用都经过这里：
+1. 通过 llm_scheduler 获取调用槽位（优先级 + provider限流）
+2. 可重试错误（429、连接错误、超时、5xx）按带抖动的指数退避重试
+3. 每个endpoint（provider + 模型）有独立的熔断器，连续失败后短时间内直接跳过
+4. 请求耗时超过该endpoint历史耗时的P95时，向备用模型发送一个对冲请求，取先返回的结果
+
+业务代码只需要处理返回内容的解析；重试耗尽或熔断时抛出 LLMUnavailableError。
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+from utils.llm_client import get_chat_llm, get_client_spec
+from utils.llm_scheduler import get_llm_scheduler, estimate_tokens, provider_key, Priority
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 8.0
+# 熔断：连续失败 BREAKER_THRESHOLD 次后打开，BREAKER_COOLDOWN 秒后放行一个探测请求
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+# 对冲：按最近 LATENCY_WINDOW 次成功调用的P95决定何时发送对冲请求
+LATENCY_WINDOW = 50
+HEDGE_MIN_SAMPLES = 10
+HEDGE_PERCENTILE = 0.95
+HEDGE_DEFAULT_DELAY = 15.0  # 样本不足时使用
+HEDGE_MIN_DELAY = 1.0
+# 备用模型，按主模型名覆盖。未指定时使用当前辅助API的CORRECTION_MODEL（主模型就是它时用SUMMARY_MODEL）
+FALLBACK_MODELS = {}
+
+
+class LLMUnavailableError(Exception):
+    """重试耗尽或endpoint处于熔断状态"""
+    def __init__(self, message, last_error=None):
+        super().__init__(message)
+        self.last_error = last_error
+
+
+def _transient_errors():
+    import openai
+    return (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError,
+            openai.InternalServerError, asyncio.TimeoutError)
+
+
+class _Endpoint:
+    def __init__(self, key):
+        self.key = key
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.outcomes = deque(maxlen=LATENCY_WINDOW)  # True 表示成功
+
+    def allow(self):
+        if self.failures < BREAKER_THRESHOLD:
+            return True
+        if time.monotonic() < self.open_until or self.probing:
+            return False
+        # 半开：放行一个探测请求
+        self.probing = True
+        return True
+
+    def record_success(self, latency):
+        self.failures = 0
+        self.probing = False
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        self.outcomes.append(False)
+        if self.failures >= BREAKER_THRESHOLD:
+            self.open_until = time.monotonic() + BREAKER_COOLDOWN
+            logger.warning(f"LLM endpoint {self.key} 连续失败 {self.failures} 次，熔断 {BREAKER_COOLDOWN:.0f}s")
+
+    def hedge_delay(self):
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        ordered = sorted(self.latencies)
+        idx = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE))
+        return max(HEDGE_MIN_DELAY, ordered[idx])
+
+    def health(self):
+        ordered = sorted(self.latencies)
+        return {
+            'p50': ordered[len(ordered) // 2] if ordered else None,
+            'error_rate': (self.outcomes.count(False) / len(self.outcomes)) if self.outcomes else 0.0,
+            'samples': len(self.outcomes),
+            'open': self.failures >= BREAKER_THRESHOLD and time.monotonic() < self.open_until,
+        }
+
+
+_endpoints = {}
+
+
+def _get_endpoint(base_url, model):
+    key = f"{provider_key(base_url)}/{model}"
+    endpoint = _endpoints.get(key)
+    if endpoint is None:
+        endpoint = _endpoints[key] = _Endpoint(key)
+    return endpoint
+
+
+def _endpoint_for(llm):
+    return _get_endpoint(getattr(llm, 'openai_api_base', None),
+                         getattr(llm, 'model_name', None) or getattr(llm, 'model', None))
+
+
+def endpoint_health(base_url, model):
+    """某个endpoint最近的表现：p50耗时、错误率、样本数、是否熔断"""
+    return _get_endpoint(base_url, model).health()
+
+
+def get_fallback_llm(llm):
+    """为工厂创建的ChatOpenAI构造同provider下的备用模型实例，没有合适的备用模型时返回None"""
+    spec = get_client_spec(llm)
+    if spec is None or spec[0] != 'chat':
+        return None
+    _, model, base_url, api_key, params = spec
+    fallback = FALLBACK_MODELS.get(model)
+    if fallback is None:
+        from config import get_core_config
+        core_config = get_core_config()
+        fallback = core_config['CORRECTION_MODEL'] if model != core_config['CORRECTION_MODEL'] else core_config['SUMMARY_MODEL']
+    if not fallback or fallback == model:
+        return None
+    params = dict(params)
+    if 'extra_body' in params:
+        from config import MODELS_WITH_EXTRA_BODY
+        params['extra_body'] = {"enable_thinking": False} if fallback in MODELS_WITH_EXTRA_BODY else None
+    return get_chat_llm(fallback, base_url, api_key, **params)
+
+
+async def _call_once(llm, payload, priority):
+    """单次调用，记录耗时和熔断状态"""
+    endpoint = _endpoint_for(llm)
+    base_url = getattr(llm, 'openai_api_base', None)
+    scheduler = get_llm_scheduler()
+    async with scheduler.slot(base_url, priority, estimate_tokens(payload)):
+        start = time.monotonic()
+        try:
+            result = await llm.ainvoke(payload)
+        except asyncio.CancelledError:
+            # 对冲中被取消的请求不计入失败，但要释放半开状态下的探测名额
+            endpoint.probing = False
+            raise
+        except _transient_errors() as e:
+            endpoint.record_failure()
+            import openai
+            if isinstance(e, openai.RateLimitError):
+                scheduler.report_rate_limit(base_url)
+            raise
+        except Exception:
+            # 参数错误、鉴权失败等不是endpoint的问题，不计入熔断，但同样要释放探测名额，否则会一直处于熔断状态
+            endpoint.probing = False
+            raise
+        endpoint.record_success(time.monotonic() - start)
+        return result
+
+
+async def _hedged(primary, fallback, payload, priority):
+    """先发主请求，超过P95耗时仍未返回时再向备用模型发请求，取先成功的结果"""
+    if fallback is None:
+        return await _call_once(primary, payload, priority)
+    primary_task = asyncio.create_task(_call_once(primary, payload, priority))
+    pending = {primary_task}
+    last_error = None
+    try:
+        delay = _endpoint_for(primary).hedge_delay()
+        done, _ = await asyncio.wait({primary_task}, timeout=delay)
+        if done:
+            pending = set()
+            return primary_task.result()
+
+        logger.info(f"LLM请求超过 {delay:.1f}s 未返回，向备用模型 {_endpoint_for(fallback).key} 发送对冲请求")
+        pending.add(asyncio.create_task(_call_once(fallback, payload, priority)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def llm_ainvoke(llm, payload, priority=Priority.BACKGROUND, fallback=True, max_attempts=MAX_ATTEMPTS):
+    """
+    通过网关调用 langchain 的 llm.ainvoke
+    :param fallback: True 表示自动选择备用模型，False 表示不对冲，也可以直接传入备用的llm实例
+    :raises LLMUnavailableError: 重试耗尽或熔断
+    """
+    if fallback is True:
+        fallback = get_fallback_llm(llm)
+    elif fallback is False:
+        fallback = None
+    transient = _transient_errors()
+    last_error = None
+    for attempt in range(max_attempts):
+        primary, hedge = llm, fallback
+        if not _endpoint_for(primary).allow():
+            if hedge is None or not _endpoint_for(hedge).allow():
+                raise LLMUnavailableError(f"LLM endpoint {_endpoint_for(primary).key} 处于熔断状态", last_error)
+            primary, hedge = hedge, None
+        elif hedge is not None and _endpoint_for(hedge).failures >= BREAKER_THRESHOLD:
+            hedge = None
+        try:
+            return await _hedged(primary, hedge, payload, priority)
+        except transient as e:
+            last_error = e
+            if attempt + 1 >= max_attempts:
+                break
+            # full jitter 指数退避
+            wait_time = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            logger.warning(f"LLM请求失败（{type(e).__name__}），{wait_time:.1f}s 后重试 (第 {attempt + 1}/{max_attempts} 次)")
+            await asyncio.sleep(wait_time)
+    raise LLMUnavailableError(f"LLM请求失败，已达到最大重试次数: {last_error}", last_error)
+
+
+def gateway_stats():
+    return {
+        key: dict(e.health(), failures=e.failures, hedge_delay=round(e.hedge_delay(), 2))
+        for key, e in _endpoints.items()
+    }
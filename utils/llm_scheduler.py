@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+辅助LLM调用的优先级调度器
+前台调用（情绪分析、视觉描述、Agent规划）和后台调用（记忆审阅、摘要压缩、设定提取、记忆重排）
+共用同一组API Key。这里按provider（base_url）限制并发数和每分钟token数，
+并在有前台请求排队、或前台刚刚活跃时推迟后台请求，避免后台的突发流量引发429拖慢前台。
+
+main_server、memory_server、agent_server 是不同的进程，前台活跃状态通过记忆目录下的一个标记文件的mtime共享。
+标记文件的读写都在线程池中进行，读取结果缓存 FOREGROUND_MARKER_TTL 秒，调度本身不会阻塞事件循环。
+已经开始的后台请求不会被中断，调度器只会推迟尚未开始的后台请求。
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    FOREGROUND = 0
+    BACKGROUND = 1
+
+
+# 每个provider的默认限制，可按host覆盖，例如 PROVIDER_LIMITS['dashscope.aliyuncs.com'] = {'concurrency': 8}
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TOKENS_PER_MINUTE = None  # None 表示不限制
+PROVIDER_LIMITS = {}
+# 为前台请求预留的并发槽位数，后台请求最多占用 concurrency - FOREGROUND_RESERVED 个
+FOREGROUND_RESERVED = 1
+# 前台请求结束后多久之内继续推迟后台请求（秒）
+FOREGROUND_HOLD_SECONDS = 5.0
+# 后台请求最长被推迟多久（秒），超过后不再等待前台，防止饿死
+MAX_BACKGROUND_DEFER = 30.0
+# 收到429后，该provider上的后台请求暂停多久（秒）
+RATE_LIMIT_COOLDOWN = 5.0
+# 前台标记文件mtime的缓存时长，同时也是两次写入标记文件的最小间隔（秒）
+FOREGROUND_MARKER_TTL = 0.5
+
+
+def estimate_tokens(payload):
+    """粗略估算token数，中文约1字1token，英文约4字符1token，这里统一按2字符1token估算"""
+    if payload is None:
+        return 0
+    if not isinstance(payload, str):
+        payload = str(payload)
+    return len(payload) // 2 + 1
+
+
+def provider_key(base_url):
+    if not base_url:
+        return 'default'
+    return urlparse(str(base_url)).netloc or str(base_url)
+
+
+class _ProviderState:
+    def __init__(self, key):
+        limits = PROVIDER_LIMITS.get(key, {})
+        self.key = key
+        self.concurrency = max(1, limits.get('concurrency', DEFAULT_CONCURRENCY))
+        self.tokens_per_minute = limits.get('tokens_per_minute', DEFAULT_TOKENS_PER_MINUTE)
+        self.tokens = float(self.tokens_per_minute or 0)
+        self.refilled_at = time.monotonic()
+        self.active = {Priority.FOREGROUND: 0, Priority.BACKGROUND: 0}
+        self.waiters = []  # heap of (priority, seq, est_tokens, enqueued_at, future)
+        self.cooldown_until = 0.0
+        self.wakeup = None
+
+    def refill(self):
+        if not self.tokens_per_minute:
+            return
+        now = time.monotonic()
+        self.tokens = min(float(self.tokens_per_minute),
+                          self.tokens + (now - self.refilled_at) * self.tokens_per_minute / 60.0)
+        self.refilled_at = now
+
+    def token_wait(self, est_tokens):
+        """还需要等多久才有足够的token，0表示可以立即发送"""
+        if not self.tokens_per_minute:
+            return 0.0
+        # 单个请求超过整个预算时，只要求桶是满的，避免永远等待
+        need = min(est_tokens, self.tokens_per_minute)
+        if self.tokens >= need:
+            return 0.0
+        return (need - self.tokens) * 60.0 / self.tokens_per_minute
+
+
+class LLMScheduler:
+    def __init__(self, foreground_marker=None):
+        self._providers = {}
+        self._seq = itertools.count()
+        if foreground_marker is None:
+            try:
+                from utils.config_manager import get_config_manager
+                foreground_marker = str(get_config_manager().memory_dir / '.llm_foreground')
+            except Exception:
+                foreground_marker = None
+        self.foreground_marker = foreground_marker
+        self._foreground_at = 0.0  # 已知的最近一次前台活跃时间（time.time()），来自本进程或标记文件
+        self._marker_touched_at = None  # 最近一次写入标记文件的时间（time.monotonic()）
+        self._marker_checked_at = None  # 最近一次读取标记文件完成的时间（time.monotonic()）
+        self._marker_read = None  # 进行中的读取
+
+    def _state(self, base_url):
+        key = provider_key(base_url)
+        state = self._providers.get(key)
+        if state is None:
+            state = self._providers[key] = _ProviderState(key)
+        return state
+
+    def _touch_foreground(self):
+        self._foreground_at = time.time()
+        if not self.foreground_marker:
+            return
+        now = time.monotonic()
+        if self._marker_touched_at is not None and now - self._marker_touched_at < FOREGROUND_MARKER_TTL:
+            return
+        self._marker_touched_at = now
+        asyncio.get_running_loop().run_in_executor(None, self._write_marker)
+
+    def _write_marker(self):
+        try:
+            with open(self.foreground_marker, 'a'):
+                pass
+            os.utime(self.foreground_marker, None)
+        except OSError:
+            pass
+
+    def _stat_marker(self):
+        try:
+            return os.stat(self.foreground_marker).st_mtime
+        except OSError:
+            return None
+
+    def _on_marker_read(self, future):
+        self._marker_read = None
+        self._marker_checked_at = time.monotonic()
+        mtime = None if future.cancelled() or future.exception() else future.result()
+        if mtime:
+            self._foreground_at = max(self._foreground_at, mtime)
+        # 等待读取结果的后台请求重新调度
+        for state in self._providers.values():
+            if state.waiters:
+                self._dispatch(state)
+
+    def _foreground_recent(self):
+        """
+        本进程或其他进程的前台请求是否刚刚活跃
+        标记文件的缓存已过期时在线程池中重新读取，读取完成前返回None
+        """
+        if time.time() - self._foreground_at < FOREGROUND_HOLD_SECONDS:
+            return True
+        if not self.foreground_marker:
+            return False
+        if self._marker_checked_at is not None and time.monotonic() - self._marker_checked_at < FOREGROUND_MARKER_TTL:
+            return False
+        if self._marker_read is None:
+            self._marker_read = asyncio.get_running_loop().run_in_executor(None, self._stat_marker)
+            self._marker_read.add_done_callback(self._on_marker_read)
+        return None
+
+    def _blocked_reason(self, state, priority, enqueued_at):
+        """返回请求暂时不能发送的原因，可以发送时返回None"""
+        total_active = state.active[Priority.FOREGROUND] + state.active[Priority.BACKGROUND]
+        if total_active >= state.concurrency:
+            return 'concurrency'
+        if priority == Priority.BACKGROUND:
+            if state.active[Priority.BACKGROUND] >= max(1, state.concurrency - FOREGROUND_RESERVED):
+                return 'concurrency'
+            if any(w[0] == Priority.FOREGROUND for w in state.waiters):
+                return 'foreground_queued'
+            if time.monotonic() - enqueued_at < MAX_BACKGROUND_DEFER:
+                if time.monotonic() < state.cooldown_until:
+                    return 'rate_limited'
+                if state.active[Priority.FOREGROUND] > 0:
+                    return 'foreground_active'
+                recent = self._foreground_recent()
+                if recent is None:
+                    return 'foreground_unknown'
+                if recent:
+                    return 'foreground_active'
+        return None
+
+    def _dispatch(self, state):
+        """按优先级把空闲槽位分配给等待中的请求"""
+        state.refill()
+        retry_in = None
+        while state.waiters:
+            priority, seq, est_tokens, enqueued_at, future = state.waiters[0]
+            if future.done():
+                heapq.heappop(state.waiters)
+                continue
+            reason = self._blocked_reason(state, priority, enqueued_at)
+            if reason is None:
+                wait = state.token_wait(est_tokens)
+                if wait > 0:
+                    retry_in = wait
+                    break
+                heapq.heappop(state.waiters)
+                self._grant(state, priority, est_tokens)
+                future.set_result(None)
+                continue
+            if reason in ('concurrency', 'foreground_unknown'):
+                # 释放槽位或读取完标记文件时会重新调度
+                break
+            retry_in = 0.5
+            break
+        if retry_in is not None and state.waiters:
+            self._schedule_wakeup(state, retry_in)
+
+    def _schedule_wakeup(self, state, delay):
+        if state.wakeup is not None and not state.wakeup.cancelled():
+            return
+        loop = asyncio.get_running_loop()
+
+        def wake():
+            state.wakeup = None
+            self._dispatch(state)
+        state.wakeup = loop.call_later(delay, wake)
+
+    def _grant(self, state, priority, est_tokens):
+        state.active[priority] += 1
+        if state.tokens_per_minute:
+            state.tokens -= min(est_tokens, state.tokens_per_minute)
+
+    @asynccontextmanager
+    async def slot(self, base_url, priority=Priority.BACKGROUND, est_tokens=0):
+        """获取一个调用槽位，退出时释放"""
+        state = self._state(base_url)
+        if priority == Priority.FOREGROUND:
+            self._touch_foreground()
+        loop = asyncio.get_running_loop()
+        enqueued_at = time.monotonic()
+        future = loop.create_future()
+        heapq.heappush(state.waiters, (priority, next(self._seq), est_tokens, enqueued_at, future))
+        self._dispatch(state)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已经拿到槽位后才被取消，需要归还
+                state.active[priority] -= 1
+                self._dispatch(state)
+            raise
+        waited = time.monotonic() - enqueued_at
+        if waited > 1.0:
+            logger.debug(f"LLM调度: {state.key} {priority.name} 等待了 {waited:.1f}s")
+        try:
+            yield
+        finally:
+            state.active[priority] -= 1
+            if priority == Priority.FOREGROUND:
+                self._touch_foreground()
+            self._dispatch(state)
+
+    def report_rate_limit(self, base_url):
+        """收到429时调用，该provider的后台请求暂停一段时间"""
+        state = self._state(base_url)
+        state.cooldown_until = time.monotonic() + RATE_LIMIT_COOLDOWN
+
+    def stats(self):
+        return {
+            key: {
+                'active_foreground': s.active[Priority.FOREGROUND],
+                'active_background': s.active[Priority.BACKGROUND],
+                'waiting': sum(1 for w in s.waiters if not w[4].done()),
+                'concurrency': s.concurrency,
+            }
+            for key, s in self._providers.items()
+        }
+
+
+_scheduler = None
+
+
+def get_llm_scheduler():
+    """获取调度器单例"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+    return _scheduler
+
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+辅助任务的模型路由
+根据任务类型、输入长度以及各模型最近的耗时和错误率（来自 llm_gateway），为每次调用选择模型：
+- 输入很短的压缩、去重、意图分析等任务直接交给最快的廉价模型（EMOTION_MODEL）
+- 首选模型熔断或错误率过高时，换用同一provider下的其他已配置模型
+- 首选模型最近明显偏慢、而同档或更低档的模型更快时，换用更快的模型
+每次决策都会被记录，可通过 routing_stats() 查看。
+"""
+import logging
+import time
+from collections import deque, Counter
+
+from utils.llm_gateway import endpoint_health
+
+logger = logging.getLogger(__name__)
+
+# 档位由低到高
+TIERS = ['fast', 'standard', 'strong']
+
+# 任务配置：
+#   model: 首选模型，可以是档位名或core_config中的键，也可以是具体的模型名
+#   tiers: 允许路由到的档位
+#   small_input: 输入不超过该字符数时优先使用fast档（None表示不降级）
+#   latency_budget: 首选模型p50耗时超过该值（秒）时，尝试更快的候选
+TASK_PROFILES = {
+    'summary': {'model': 'standard', 'tiers': ['fast', 'standard', 'strong'], 'small_input': 1200, 'latency_budget': 20.0},
+    'further_summary': {'model': 'standard', 'tiers': ['fast', 'standard', 'strong'], 'small_input': 800, 'latency_budget': 15.0},
+    'review': {'model': 'strong', 'tiers': ['standard', 'strong'], 'small_input': None, 'latency_budget': 40.0},
+    'setting_proposer': {'model': 'SETTING_PROPOSER_MODEL', 'tiers': ['standard', 'strong'], 'small_input': None, 'latency_budget': 30.0},
+    'setting_verifier': {'model': 'SETTING_VERIFIER_MODEL', 'tiers': ['standard', 'strong'], 'small_input': None, 'latency_budget': 30.0},
+    'rerank': {'model': 'RERANKER_MODEL', 'tiers': ['fast', 'standard'], 'small_input': 600, 'latency_budget': 10.0},
+    'router': {'model': 'ROUTER_MODEL', 'tiers': ['fast', 'standard'], 'small_input': 400, 'latency_budget': 10.0},
+    'analyzer': {'model': 'standard', 'tiers': ['fast', 'standard'], 'small_input': 600, 'latency_budget': 8.0},
+    'dedup': {'model': 'standard', 'tiers': ['fast', 'standard'], 'small_input': 1500, 'latency_budget': 8.0},
+    'planner': {'model': 'standard', 'tiers': ['standard', 'strong'], 'small_input': None, 'latency_budget': 15.0},
+    'processor': {'model': 'standard', 'tiers': ['standard', 'strong'], 'small_input': None, 'latency_budget': 15.0},
+}
+
+# 样本不少于MIN_SAMPLES时才参考错误率和耗时
+MIN_SAMPLES = 5
+MAX_ERROR_RATE = 0.5
+
+_decisions = deque(maxlen=500)
+
+
+def _tier_models(core_config):
+    return {
+        'fast': core_config.get('EMOTION_MODEL'),
+        'standard': core_config.get('SUMMARY_MODEL'),
+        'strong': core_config.get('CORRECTION_MODEL'),
+    }
+
+
+def _resolve_model(name, core_config, tier_models):
+    if name in tier_models:
+        return tier_models[name]
+    if name in core_config:
+        return core_config[name]
+    import config
+    return getattr(config, name, name)
+
+
+def _payload_size(payload):
+    if payload is None:
+        return 0
+    if isinstance(payload, str):
+        return len(payload)
+    if isinstance(payload, (list, tuple)):
+        return sum(_payload_size(m.get('content') if isinstance(m, dict) else getattr(m, 'content', m)) for m in payload)
+    return len(str(payload))
+
+
+def _healthy(health):
+    if health['open']:
+        return False
+    return health['samples'] < MIN_SAMPLES or health['error_rate'] < MAX_ERROR_RATE
+
+
+def route_model(task, payload, core_config):
+    """为一次辅助任务调用选择模型，返回模型名"""
+    profile = TASK_PROFILES[task]
+    base_url = core_config.get('OPENROUTER_URL')
+    tier_models = _tier_models(core_config)
+    preferred = _resolve_model(profile['model'], core_config, tier_models)
+    size = _payload_size(payload)
+
+    # 候选顺序：首选模型，然后按档位由低到高
+    candidates = [preferred]
+    for tier in profile['tiers']:
+        model = tier_models.get(tier)
+        if model and model not in candidates:
+            candidates.append(model)
+    fast_model = tier_models.get('fast')
+
+    model, reason = preferred, 'preferred'
+    if profile['small_input'] is not None and size <= profile['small_input'] \
+            and 'fast' in profile['tiers'] and fast_model:
+        model, reason = fast_model, 'small_input'
+
+    health = endpoint_health(base_url, model)
+    if not _healthy(health):
+        for candidate in candidates:
+            if candidate != model and _healthy(endpoint_health(base_url, candidate)):
+                model, reason = candidate, 'unhealthy_' + reason
+                break
+    elif health['samples'] >= MIN_SAMPLES and health['p50'] is not None and health['p50'] > profile['latency_budget']:
+        best_p50 = health['p50']
+        for candidate in candidates:
+            if candidate == model:
+                continue
+            h = endpoint_health(base_url, candidate)
+            if _healthy(h) and h['samples'] >= MIN_SAMPLES and h['p50'] is not None and h['p50'] < best_p50:
+                model, best_p50, reason = candidate, h['p50'], 'slow_' + reason
+
+    _decisions.append({'time': time.time(), 'task': task, 'chars': size, 'model': model, 'reason': reason})
+    if model != preferred:
+        logger.debug(f"模型路由: {task} ({size} 字符) -> {model} [{reason}]，首选 {preferred}")
+    return model
+
+
+def routing_stats(limit=50):
+    """最近的路由决策及按任务统计的模型分布"""
+    counts = {}
+    for d in _decisions:
+        counts.setdefault(d['task'], Counter())[d['model']] += 1
+    return {
+        'counts': {task: dict(c) for task, c in counts.items()},
+        'recent': list(_decisions)[-limit:],
+    }
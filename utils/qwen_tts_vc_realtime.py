@@ -175,6 +175,7 @@ from multiprocessing import Process, Queue as MPQueue
 from uuid import uuid4
 import numpy as np
 import httpx 
+from utils.resampler import StreamingResampler
 import websockets
 import time
 from enum import Enum
@@ -188,12 +189,13 @@ class SessionMode(Enum):
 
 async def tts_audio_worker(in_queue: MPQueue, out_queue: MPQueue):
     """
-    异步音频处理协程：从 in_queue 读取 24kHz PCM（int16 LE），重复采样为 48kHz 后写入 out_queue。
+    异步音频处理协程：从 in_queue 读取 24kHz PCM（int16 LE），流式重采样为 48kHz 后写入 out_queue。
     收到 None 作为哨兵值时退出。为兼容 multiprocessing，进程入口见 _tts_audio_worker_entry。
     """
     import numpy as _np
     import asyncio as _asyncio
     loop = _asyncio.get_running_loop()
+    resampler = StreamingResampler(24000, 48000)
 
     while True:
         # MPQueue.get() 是阻塞的；放到线程池避免阻塞事件循环
@@ -206,7 +208,7 @@ async def tts_audio_worker(in_queue: MPQueue, out_queue: MPQueue):
 
         try:
             audio_array = _np.frombuffer(audio_bytes, dtype=_np.int16)
-            resampled = _np.repeat(audio_array, 2) # 24kHz -> 48kHz（简单重复法）
+            resampled = resampler.process(audio_array) # 24kHz -> 48kHz
             await loop.run_in_executor(None, out_queue.put, resampled.tobytes())
         except Exception:
         # 处理失败则退回原始数据，避免中断播放链路
@@ -562,6 +564,7 @@ class LLMSessionManager:
         self.tts_client = None  # TTS实时客户端
         self.tts_handler_task = None  # TTS消息处理任务
         self.lock = asyncio.Lock()  # 使用异步锁替代同步锁
+        self._output_resampler = StreamingResampler(24000, 48000)
         self.current_speech_id = None
         self.inflect_parser = inflect.engine()
         self.emoji_pattern = re.compile(r'[^\w\u4e00-\u9fff\s>][^\w\u4e00-\u9fff\s]{2,}[^\w\u4e00-\u9fff\s<]', flags=re.UNICODE)
@@ -731,12 +734,10 @@ class LLMSessionManager:
         """Qwen音频回调：推送音频到WebSocket前端"""
         if not self.use_tts:
             if self.websocket and hasattr(self.websocket, 'client_state') and self.websocket.client_state == self.websocket.client_state.CONNECTED:
-                # 这里假设audio_data为PCM16字节流，直接推送
-                audio = np.frombuffer(audio_data, dtype=np.int16)
-                # 使用简单的重复采样，将 24kHz 转为 48kHz
-                audio = np.repeat(audio, 2)
+                # 这里假设audio_data为PCM16字节流，流式重采样到48kHz后推送
+                audio = await self._output_resampler.process_bytes_async(audio_data)
 
-                await self.send_speech(audio.tobytes())
+                await self.send_speech(audio)
                 # 你可以根据需要加上格式、isNewMessage等标记
                 # await self.websocket.send_json({"type": "cozy_audio", "format": "blob", "isNewMessage": True})
             else:
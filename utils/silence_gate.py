@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+麦克风静音抑制门限
+按10ms一帧计算能量（RMS）和过零率，结合自适应的底噪估计判断是否有人说话。
+检测到语音时先补发一段预录（pre-roll），保证语音开头不被截掉；语音结束后继续发送一段拖尾（hangover），
+让服务端VAD能看到足够的静音来判断说话结束。其余的静音不再发送，只定期发送一小段数字静音作为保活。
+"""
+from collections import deque
+
+import numpy as np
+
+FRAME_MS = 10
+# 语音开始前补发的音频时长（毫秒），需要覆盖服务端VAD的 prefix_padding_ms
+GATE_PREROLL_MS = 400
+# 语音结束后继续发送的时长（毫秒），需要大于服务端VAD的 silence_duration_ms
+GATE_HANGOVER_MS = 1200
+# 门限关闭期间，每隔这么久发送一次保活静音（毫秒），0 表示不发送
+GATE_KEEPALIVE_INTERVAL_MS = 5000
+GATE_KEEPALIVE_MS = 20
+# 绝对能量下限（int16幅度），低于它一定是静音
+MIN_SPEECH_RMS = 300.0
+# 能量超过底噪这么多倍判为语音
+SPEECH_TO_NOISE = 3.0
+# 清音（s、sh等）能量低但过零率高：能量超过底噪 UNVOICED_TO_NOISE 倍且过零率超过 UNVOICED_ZCR 也判为语音
+UNVOICED_TO_NOISE = 2.0
+UNVOICED_ZCR = 0.25
+# 连续这么多帧判为语音才打开门限，避免单个咔哒声
+ONSET_FRAMES = 2
+# 底噪估计的平滑系数：门限关闭时的静音帧 / 其余帧
+NOISE_FLOOR_ALPHA = 0.05
+NOISE_FLOOR_SLOW_ALPHA = 0.0005
+
+
+class SilenceGate:
+    """有状态的静音抑制门限，同一实例只处理同一路16bit单声道PCM，调用需要串行"""
+
+    def __init__(self, sample_rate=16000, preroll_ms=GATE_PREROLL_MS, hangover_ms=GATE_HANGOVER_MS,
+                 keepalive_interval_ms=GATE_KEEPALIVE_INTERVAL_MS, keepalive_ms=GATE_KEEPALIVE_MS):
+        self.frame_samples = sample_rate * FRAME_MS // 1000
+        self.frame_bytes = self.frame_samples * 2
+        self.preroll_ms = preroll_ms
+        self.hangover_ms = hangover_ms
+        self.keepalive_interval_ms = keepalive_interval_ms
+        self.keepalive_ms = keepalive_ms
+        self.enabled = True
+        self.reset()
+
+    def reset(self):
+        """清空状态，新的session开始时调用"""
+        self._remainder = b''
+        self._preroll = deque(maxlen=max(1, self.preroll_ms // FRAME_MS))
+        self._open = False
+        self._speech_run = 0
+        self._silence_run = 0
+        self._closed_frames = 0
+        self._noise_floor = MIN_SPEECH_RMS / SPEECH_TO_NOISE
+        self.frames_in = 0
+        self.frames_sent = 0
+        self.keepalives_sent = 0
+
+    @property
+    def is_open(self):
+        return self._open
+
+    def _classify(self, frames):
+        """frames: (n, frame_samples) int16，返回每帧是否像语音"""
+        x = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(x * x, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame_samples - 1)
+        return rms, zcr
+
+    def process(self, pcm):
+        """
+        输入一块PCM16字节，返回需要发送的字节（可能为空）。
+        不足一帧的尾部留到下一次调用，输出总是整帧。
+        """
+        if not self.enabled:
+            return pcm
+        data = self._remainder + bytes(pcm)
+        n = len(data) // self.frame_bytes
+        self._remainder = data[n * self.frame_bytes:]
+        if n == 0:
+            return b''
+        frames = np.frombuffer(data, dtype=np.int16, count=n * self.frame_samples).reshape(n, self.frame_samples)
+        rms, zcr = self._classify(frames)
+
+        out = []
+        hangover_frames = self.hangover_ms // FRAME_MS
+        keepalive_frames = self.keepalive_interval_ms // FRAME_MS
+        for i in range(n):
+            frame = data[i * self.frame_bytes:(i + 1) * self.frame_bytes]
+            floor = self._noise_floor
+            speech = rms[i] > max(MIN_SPEECH_RMS, floor * SPEECH_TO_NOISE) or \
+                (rms[i] > max(MIN_SPEECH_RMS / 2, floor * UNVOICED_TO_NOISE) and zcr[i] > UNVOICED_ZCR)
+            # 门限打开期间（包括句中停顿）只缓慢更新，避免把语音当成底噪；
+            # 但也不完全停止，背景噪声突然变大时门限不会一直开着
+            alpha = NOISE_FLOOR_SLOW_ALPHA if speech or self._open else NOISE_FLOOR_ALPHA
+            self._noise_floor = floor + alpha * (rms[i] - floor)
+            self._speech_run = self._speech_run + 1 if speech else 0
+
+            if self._open:
+                out.append(frame)
+                self._silence_run = 0 if speech else self._silence_run + 1
+                if self._silence_run >= hangover_frames:
+                    self._open = False
+                    self._closed_frames = 0
+            elif self._speech_run >= ONSET_FRAMES:
+                # 语音开始：先补发预录的音频
+                out.extend(self._preroll)
+                self._preroll.clear()
+                out.append(frame)
+                self._open = True
+                self._silence_run = 0
+            else:
+                self._preroll.append(frame)
+                self._closed_frames += 1
+                if keepalive_frames and self._closed_frames % keepalive_frames == 0:
+                    out.append(bytes(self.frame_bytes * max(1, self.keepalive_ms // FRAME_MS)))
+                    self.keepalives_sent += 1
+
+        self.frames_in += n
+        sent = b''.join(out)
+        self.frames_sent += len(sent) // self.frame_bytes
+        return sent
+
+    def stats(self):
+        return {
+            'input_seconds': self.frames_in * FRAME_MS / 1000,
+            'sent_seconds': self.frames_sent * FRAME_MS / 1000,
+            'suppressed_ratio': 1 - self.frames_sent / self.frames_in if self.frames_in else 0.0,
+            'keepalives': self.keepalives_sent,
+        }